@@ -0,0 +1,292 @@
+"""
+Embed existing visits that are missing from the active text collection
+Run: python backfill.py [--batch-size 128] [--workers 4] [--page-size 1000]
+         [--restart] [--force] [--progress-interval 5] [--photos]
+
+Visits are streamed from SQLite in id order (keyset pagination, one page in
+memory at a time). Each page is checked against the collection with one
+``get(ids=...)``, and the missing visits are embedded in batches by
+``--workers`` threads and upserted one batch at a time. Texts embedded
+before (by the service or an earlier run) come from the embedding cache.
+
+Progress is checkpointed per collection in the ``backfill_checkpoints`` table
+after every fully processed page: an interrupted run resumes after the last
+completed page (``--restart`` starts over). The checkpoint is cleared when
+the run reaches the end, so the next run rescans everything and retries any
+visits that failed.
+
+``--photos`` instead copies each visit's filterable fields onto its stored
+photo vectors (photos stored before image search filtered on them).
+
+Document text and metadata are built by the service's own code (main.py,
+which has no side effects on import). Stop the service first: ChromaDB
+collections must not be written by two processes at once. During a model
+migration the service backfills the new collection itself; this fills the
+one registered as active and never registers, switches or retires models.
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from env_file import load_env  # noqa: E402
+
+# Before main.py (and the modules it imports) read their settings
+load_env(Path(__file__).resolve().parent / ".env")
+
+import main  # noqa: E402
+from model_registry import TextIndex  # noqa: E402
+from vector_store import VECTOR_BACKEND, create_vector_client  # noqa: E402
+
+Document = Tuple[str, int, str, Dict[str, Any]]  # (id, updated_at, text, metadata)
+
+
+def init_checkpoints():
+    with main.db.transaction() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+                collection TEXT PRIMARY KEY,
+                cursor TEXT NOT NULL,              -- last visit id of the last completed page
+                processed INTEGER NOT NULL DEFAULT 0,
+                embedded INTEGER NOT NULL DEFAULT 0,
+                skipped INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                updated_at INTEGER NOT NULL
+            )
+        """)
+
+
+def load_checkpoint(collection: str) -> Optional[Dict[str, Any]]:
+    row = main.db.fetchone(
+        "SELECT cursor, processed, embedded, skipped, failed FROM backfill_checkpoints WHERE collection = ?",
+        (collection,)
+    )
+    if row is None:
+        return None
+    return dict(zip(("cursor", "processed", "embedded", "skipped", "failed"), row))
+
+
+def save_checkpoint(collection: str, cursor_id: str, counts: Dict[str, int]):
+    with main.db.transaction() as cursor:
+        cursor.execute("""
+            INSERT INTO backfill_checkpoints (collection, cursor, processed, embedded, skipped, failed, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(collection) DO UPDATE SET
+                cursor = excluded.cursor, processed = excluded.processed, embedded = excluded.embedded,
+                skipped = excluded.skipped, failed = excluded.failed, updated_at = excluded.updated_at
+        """, (collection, cursor_id, counts["processed"], counts["embedded"], counts["skipped"],
+              counts["failed"], int(time.time())))
+
+
+def clear_checkpoint(collection: str):
+    with main.db.transaction() as cursor:
+        cursor.execute("DELETE FROM backfill_checkpoints WHERE collection = ?", (collection,))
+
+
+def embed_and_store(provider, collection, batch: List[Document]) -> Tuple[int, int]:
+    """Embed one batch and upsert it; returns (embedded, failed)"""
+    embeddings = provider.embed_batch([d[2] for d in batch])
+    if embeddings is None:
+        return 0, len(batch)
+    keep = [(d, e) for d, e in zip(batch, embeddings) if e]
+    if keep:
+        collection.upsert(
+            ids=[d[0] for d, _ in keep],
+            embeddings=[e for _, e in keep],
+            documents=[d[2] for d, _ in keep],
+            metadatas=[d[3] for d, _ in keep]
+        )
+    return len(keep), len(batch) - len(keep)
+
+
+def _duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class Progress:
+    """Throughput and ETA over the visits processed by this run"""
+
+    def __init__(self, total: int, interval: float):
+        self.total = total
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.last_print = self.start
+        self.processed = 0
+        self.embedded = 0
+
+    def update(self, processed: int, embedded: int, force: bool = False):
+        self.processed += processed
+        self.embedded += embedded
+        now = time.perf_counter()
+        if not force and now - self.last_print < self.interval:
+            return
+        self.last_print = now
+        elapsed = max(now - self.start, 1e-9)
+        rate = self.processed / elapsed
+        percent = 100 * self.processed / self.total if self.total else 100.0
+        eta = _duration((self.total - self.processed) / rate) if rate and self.processed < self.total else "-"
+        print(f"[Backfill] {self.processed}/{self.total} visits ({percent:.1f}%) | "
+              f"{rate:.0f} visits/s | {self.embedded / elapsed:.0f} embedded/s | "
+              f"elapsed {_duration(elapsed)} | ETA {eta}", flush=True)
+
+
+def run(args):
+    main.DATA_DIR.mkdir(exist_ok=True)
+    main.init_db()
+    init_checkpoints()
+
+    vector_client = create_vector_client(VECTOR_BACKEND, main.CHROMA_DIR, main.VECTOR_DIR)
+    # Read-only lookup: the service owns model selection and migrations
+    text_index = TextIndex(main.model_registry, vector_client, main.make_text_provider)
+    slot = text_index.registered_slot("active")
+    if slot is None:
+        print("[ERROR] No active text collection registered; start the service once to create it")
+        sys.exit(1)
+    migrating = main.model_registry.find("migrating")
+    if migrating is not None:
+        print(f"[INFO] Migration to {migrating['collection']} is left to the service")
+    provider, collection = slot.provider, slot.collection
+    print(f"[INFO] Embedding provider: {provider.name} ({provider.model_id}) -> {slot.name}")
+
+    if args.restart:
+        clear_checkpoint(slot.name)
+    checkpoint = load_checkpoint(slot.name)
+    counts = {"processed": 0, "embedded": 0, "skipped": 0, "failed": 0}
+    cursor_id = None
+    if checkpoint is not None:
+        cursor_id = checkpoint.pop("cursor")
+        counts.update(checkpoint)
+        print(f"[INFO] Resuming after visit {cursor_id} ({counts['processed']} visits done before)")
+
+    total = main.db.fetchone("SELECT COUNT(*) FROM visits WHERE id > ?", (cursor_id or "",))[0]
+    print(f"[INFO] {total} visits to scan, {args.workers} workers, batches of {args.batch_size}")
+    progress = Progress(total, args.progress_interval)
+
+    # Pages in read order; the checkpoint moves past a page once all its batches are done
+    pages: deque = deque()
+    futures: Dict[Any, Tuple[Dict[str, Any], int]] = {}  # future -> (page, batch size)
+
+    def collect(block: bool):
+        done = set()
+        if futures:
+            done, _ = wait(list(futures), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            page, size = futures.pop(future)
+            try:
+                embedded, failed = future.result()
+            except Exception as e:
+                print(f"[ERROR] Batch upsert failed: {e}")
+                embedded, failed = 0, size
+            page["embedded"] += embedded
+            page["failed"] += failed
+            page["pending"] -= 1
+        while pages and pages[0]["pending"] == 0:
+            page = pages.popleft()
+            counts["processed"] += page["rows"]
+            counts["embedded"] += page["embedded"]
+            counts["skipped"] += page["skipped"]
+            counts["failed"] += page["failed"]
+            save_checkpoint(slot.name, page["last_id"], counts)
+            progress.update(page["rows"], page["embedded"])
+
+    pool = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="backfill")
+    try:
+        while True:
+            docs = main.load_visit_documents(cursor_id, args.page_size)
+            if not docs:
+                break
+            cursor_id = docs[-1][0]
+            todo = [d for d in docs if d[2]]
+            if todo and not args.force:
+                existing = set(collection.get(ids=[d[0] for d in todo], include=[])["ids"])
+                todo = [d for d in todo if d[0] not in existing]
+            page = {"last_id": cursor_id, "rows": len(docs), "skipped": len(docs) - len(todo),
+                    "embedded": 0, "failed": 0, "pending": 0}
+            pages.append(page)
+            for start in range(0, len(todo), args.batch_size):
+                batch = todo[start:start + args.batch_size]
+                futures[pool.submit(embed_and_store, provider, collection, batch)] = (page, len(batch))
+                page["pending"] += 1
+            # Keep the workers busy while bounding how far reading runs ahead
+            collect(block=len(futures) >= args.workers * 2)
+        while futures or pages:
+            collect(block=True)
+    except KeyboardInterrupt:
+        pool.shutdown(wait=False, cancel_futures=True)
+        print(f"\n[INFO] Interrupted; progress saved. Run again to resume ({counts['processed']} visits done)")
+        sys.exit(130)
+    pool.shutdown()
+    clear_checkpoint(slot.name)
+    progress.update(0, 0, force=True)
+
+    print("=" * 60)
+    print("Summary:")
+    print("=" * 60)
+    print(f"  Embedded:   {counts['embedded']}")
+    print(f"  Skipped:    {counts['skipped']} (already embedded or no text)")
+    print(f"  Failed:     {counts['failed']}")
+    print(f"  Cache hits: {main.embedding_cache.hits}")
+    print(f"  Total:      {counts['processed']}")
+    print(f"  Collection: {slot.name} ({collection.count()} vectors)")
+    if counts["failed"]:
+        print(f"[WARNING] {counts['failed']} visits failed; run again to retry them")
+    main.db.close_all()
+
+
+def run_photos(args):
+    """Refresh the visit fields stored on photo vectors, a page of visits at a time"""
+    main.DATA_DIR.mkdir(exist_ok=True)
+    main.init_db()
+    vector_client = create_vector_client(VECTOR_BACKEND, main.CHROMA_DIR, main.VECTOR_DIR)
+    collection = main.open_image_collection(vector_client)
+    cursor_id, visits, updated = "", 0, 0
+    while True:
+        rows = main.db.fetchall("""
+            SELECT DISTINCT visit_id FROM photos
+            WHERE embedding_id IS NOT NULL AND visit_id > ?
+            ORDER BY visit_id LIMIT ?
+        """, (cursor_id, args.page_size))
+        if not rows:
+            break
+        cursor_id = rows[-1][0]
+        stored = main.visits_metadata([row[0] for row in rows])
+        if stored:
+            updated += main.refresh_photo_visit_metadata(collection, stored)
+        visits += len(rows)
+    print(f"[Backfill] Photos of {visits} visits checked, {updated} photo vectors updated ({collection.name})")
+    main.db.close_all()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--batch-size", type=int, default=128, help="visits per embedding call")
+    parser.add_argument("--workers", type=int, default=4, help="parallel embedding batches")
+    parser.add_argument("--page-size", type=int, default=1000, help="visits read from SQLite per page")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over")
+    parser.add_argument("--force", action="store_true", help="re-embed visits already in the collection")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="seconds between progress lines")
+    parser.add_argument("--photos", action="store_true", help="copy visit fields onto stored photo vectors instead")
+    args = parser.parse_args()
+    args.batch_size = max(1, args.batch_size)
+    args.workers = max(1, args.workers)
+    args.page_size = max(args.batch_size, args.page_size)
+    if args.photos:
+        run_photos(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,172 @@
+"""
+HNSW tuning benchmark: recall@k and query latency per parameter set.
+
+Builds a ChromaDB collection for every (M, construction_ef, search_ef)
+combination from the same vectors, runs the same queries against each and
+compares them with exact (brute-force) search: recall@k against the true
+top k, p50/p99 query latency and build time. The NumPy exact backend
+(vector_store.NumpyVectorStore) is measured too, as the recall = 1 baseline.
+
+Vectors are synthetic clustered unit vectors by default; --collection uses
+the real vectors of an existing collection in DATA_DIR (queries are
+perturbed copies of stored vectors).
+
+Run: python benchmarks/bench_hnsw.py [--n 20000] [--dims 384] [--queries 200] [--k 10]
+         [--m 16,32] [--construction-ef 100,200] [--search-ef 10,50,100]
+         [--collection farm_visits__all-MiniLM-L6-v2__384]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from vector_store import NumpyVectorStore, create_vector_client, hnsw_metadata  # noqa: E402
+
+BATCH = 1000
+
+
+def _int_list(value: str):
+    return [int(v) for v in value.split(",") if v]
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def synthetic_vectors(n: int, dims: int, queries: int, seed: int = 0):
+    """Clustered unit vectors (like real embeddings) and queries near them"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n // 200), dims))
+    data = centers[rng.integers(len(centers), size=n)] + 0.5 * rng.normal(size=(n, dims))
+    picks = data[rng.integers(n, size=queries)]
+    query = picks + 0.3 * rng.normal(size=(queries, dims))
+    return _normalize(data).astype(np.float32), _normalize(query).astype(np.float32)
+
+
+def collection_vectors(name: str, queries: int, seed: int = 0):
+    """Vectors of an existing collection, queries perturbed from stored ones"""
+    data_dir = Path(os.getenv("DATA_DIR", "./data"))
+    client = create_vector_client(os.getenv("VECTOR_BACKEND", "chroma"), data_dir / "chroma", data_dir / "vectors")
+    collection = client.get_collection(name)
+    total = collection.count()
+    vectors = []
+    for offset in range(0, total, BATCH):
+        vectors.extend(collection.get(limit=BATCH, offset=offset, include=["embeddings"])["embeddings"])
+    data = _normalize(np.asarray(vectors, dtype=np.float32))
+    rng = np.random.default_rng(seed)
+    picks = data[rng.integers(len(data), size=queries)]
+    query = picks + 0.05 * rng.normal(size=picks.shape).astype(np.float32)
+    return data, _normalize(query).astype(np.float32)
+
+
+def exact_top_k(data: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ data.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+
+
+def _fill(collection, data: np.ndarray) -> float:
+    start = time.perf_counter()
+    for offset in range(0, len(data), BATCH):
+        chunk = data[offset:offset + BATCH]
+        collection.upsert(ids=[str(i) for i in range(offset, offset + len(chunk))], embeddings=chunk.tolist())
+    return time.perf_counter() - start
+
+
+def _measure(collection, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(int(i) for i in result["ids"][0]) & set(expected.tolist()))
+    return {
+        f"recall@{k}": round(hits / (len(queries) * k), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+    }
+
+
+def bench_hnsw(data, queries, truth, k, m, construction_ef, search_ef) -> dict:
+    import chromadb
+    from chromadb.config import Settings
+
+    with tempfile.TemporaryDirectory() as tmp:
+        client = chromadb.PersistentClient(path=tmp, settings=Settings(anonymized_telemetry=False))
+        collection = client.create_collection(
+            "bench",
+            metadata={"hnsw:space": "cosine", **hnsw_metadata(
+                {"M": m, "construction_ef": construction_ef, "search_ef": search_ef}
+            )}
+        )
+        build_s = _fill(collection, data)
+        _measure(collection, queries[:10], truth[:10], k)  # Load the index before timing
+        return {"build_s": round(build_s, 2), **_measure(collection, queries, truth, k)}
+
+
+def bench_numpy(data, queries, truth, k) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = NumpyVectorStore(Path(tmp))
+        collection = store.get_or_create_collection("bench")
+        build_s = _fill(collection, data)
+        result = {"build_s": round(build_s, 2), **_measure(collection, queries, truth, k)}
+        store.delete_collection("bench")
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--n", type=int, default=20000, help="synthetic vectors")
+    parser.add_argument("--dims", type=int, default=384, help="synthetic vector size")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--m", type=_int_list, default=[16, 32])
+    parser.add_argument("--construction-ef", type=_int_list, default=[100, 200])
+    parser.add_argument("--search-ef", type=_int_list, default=[10, 50, 100])
+    parser.add_argument("--collection", help="benchmark the vectors of this collection instead")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    if args.collection:
+        data, queries = collection_vectors(args.collection, args.queries)
+    else:
+        data, queries = synthetic_vectors(args.n, args.dims, args.queries)
+    k = min(args.k, len(data))
+    truth = exact_top_k(data, queries, k)
+
+    report = {
+        "vectors": len(data), "dims": int(data.shape[1]), "queries": len(queries), "k": k,
+        "exact_numpy": bench_numpy(data, queries, truth, k),
+        "hnsw": [],
+    }
+    for m, construction_ef, search_ef in itertools.product(args.m, args.construction_ef, args.search_ef):
+        result = bench_hnsw(data, queries, truth, k, m, construction_ef, search_ef)
+        report["hnsw"].append({"M": m, "construction_ef": construction_ef, "search_ef": search_ef, **result})
+
+    print("=" * 72)
+    print(f"HNSW benchmark: {len(data)} x {data.shape[1]} vectors, {len(queries)} queries, k={k}")
+    print("=" * 72)
+    print(f"{'M':>4} {'constr_ef':>10} {'search_ef':>10} {'recall@' + str(k):>10} {'p50 ms':>8} {'p99 ms':>8} {'build s':>8}")
+    for row in report["hnsw"]:
+        print(f"{row['M']:>4} {row['construction_ef']:>10} {row['search_ef']:>10} "
+              f"{row[f'recall@{k}']:>10.4f} {row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['build_s']:>8.2f}")
+    exact = report["exact_numpy"]
+    print(f"{'exact (numpy backend)':>26} {exact[f'recall@{k}']:>10.4f} {exact['p50_ms']:>8.2f} "
+          f"{exact['p99_ms']:>8.2f} {exact['build_s']:>8.2f}")
+    print()
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+SQLite access benchmark: connect-per-request vs the pooled WAL connection layer.
+
+Compares the access pattern the endpoints used to have (sqlite3.connect +
+commit + close per request, default rollback journal) with db.Database
+(per-thread connections, WAL, synchronous=NORMAL, tuned cache/mmap).
+
+Run: python benchmarks/bench_sqlite.py [--ops 5000] [--threads 4]
+"""
+
+import argparse
+import json
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db import Database  # noqa: E402
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS visits (
+        id TEXT PRIMARY KEY,
+        created_at INTEGER NOT NULL,
+        updated_at INTEGER NOT NULL,
+        task_type TEXT NOT NULL,
+        note TEXT,
+        field_id TEXT,
+        data TEXT
+    )
+"""
+
+UPSERT_SQL = """
+    INSERT OR REPLACE INTO visits (id, created_at, updated_at, task_type, note, field_id, data)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+GET_SQL = "SELECT data FROM visits WHERE id = ?"
+
+
+def _row(i: int) -> tuple:
+    now = int(time.time() * 1000)
+    record = {"id": f"visit-{i}", "note": f"Inspection of field {i % 50}", "crop": "corn"}
+    return (f"visit-{i}", now, now, "field_visit", record["note"], str(i % 50), json.dumps(record))
+
+
+class ConnectPerOp:
+    """The previous pattern: a fresh connection for every request"""
+
+    name = "connect-per-op"
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def upsert(self, row: tuple):
+        conn = sqlite3.connect(self.path)
+        conn.execute(UPSERT_SQL, row)
+        conn.commit()
+        conn.close()
+
+    def get(self, visit_id: str):
+        conn = sqlite3.connect(self.path)
+        row = conn.execute(GET_SQL, (visit_id,)).fetchone()
+        conn.close()
+        return row
+
+
+class Pooled:
+    """db.Database: per-thread WAL connections with cached statements"""
+
+    name = "pooled-wal"
+
+    def __init__(self, path: Path):
+        self.db = Database(path)
+
+    def upsert(self, row: tuple):
+        with self.db.transaction() as cursor:
+            cursor.execute(UPSERT_SQL, row)
+
+    def get(self, visit_id: str):
+        return self.db.fetchone(GET_SQL, (visit_id,))
+
+
+def _run_threads(threads: int, target, ops: int) -> float:
+    per_thread = ops // threads
+    workers = [
+        threading.Thread(target=target, args=(t * per_thread, per_thread))
+        for t in range(threads)
+    ]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+def bench(backend_cls, ops: int, threads: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "visits.db"
+        conn = sqlite3.connect(path)
+        conn.execute(SCHEMA)
+        conn.commit()
+        conn.close()
+        backend = backend_cls(path)
+
+        def do_upserts(offset, count):
+            for i in range(offset, offset + count):
+                backend.upsert(_row(i))
+
+        def do_gets(offset, count):
+            rng = random.Random(offset)
+            for _ in range(count):
+                backend.get(f"visit-{rng.randrange(ops)}")
+
+        def do_mixed(offset, count):
+            rng = random.Random(offset)
+            for i in range(offset, offset + count):
+                if rng.random() < 0.2:
+                    backend.upsert(_row(i))
+                else:
+                    backend.get(f"visit-{rng.randrange(ops)}")
+
+        results = {
+            "upsert_ops_per_s": _run_threads(1, do_upserts, ops),
+            "get_ops_per_s": _run_threads(1, do_gets, ops),
+            f"mixed_{threads}_threads_ops_per_s": _run_threads(threads, do_mixed, ops),
+        }
+        if isinstance(backend, Pooled):
+            backend.db.close_all()
+        return {k: round(v, 1) for k, v in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--ops", type=int, default=5000, help="operations per phase")
+    parser.add_argument("--threads", type=int, default=4, help="threads for the mixed phase")
+    args = parser.parse_args()
+
+    report = {}
+    for backend_cls in (ConnectPerOp, Pooled):
+        report[backend_cls.name] = bench(backend_cls, args.ops, args.threads)
+
+    print("=" * 60)
+    print(f"SQLite benchmark ({args.ops} ops per phase)")
+    print("=" * 60)
+    before, after = report[ConnectPerOp.name], report[Pooled.name]
+    for metric in before:
+        speedup = after[metric] / before[metric] if before[metric] else float("nan")
+        print(f"{metric:32} {before[metric]:>10.1f} -> {after[metric]:>10.1f}  ({speedup:.1f}x)")
+    print()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
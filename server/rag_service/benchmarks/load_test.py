@@ -0,0 +1,502 @@
+"""
+End-to-end load test with synthetic farm visits and photos.
+
+Starts the service on a fresh DATA_DIR with CLIP_PROVIDER=hash and text
+embeddings from the stub OpenAI server (benchmarks/stub_openai_server.py) or,
+with --text-provider hash, the hash provider; then drives the HTTP API phase
+by phase at a fixed concurrency:
+
+  upsert         POST /sync/visits/upsert (or /sync/visits/upsert-batch with --batch-size)
+  embed          waits for the embedding queue to drain (visits embedded per second)
+  embed-image    POST /rag/embed-image with small generated PNGs
+  search         POST /rag/search, vector / lexical / hybrid, with random filters
+  search-images  POST /rag/search-images
+
+Each phase records throughput, latency percentiles and status codes into a
+JSON report; --compare prints the change between two reports (e.g. two commits).
+Everything runs offline. Service settings (VECTOR_BACKEND, EMBED_QUEUE_WORKERS,
+...) are taken from the environment and recorded in the report.
+
+Run: python benchmarks/load_test.py [--visits 1000] [--concurrency 16] [--out report.json]
+     python benchmarks/load_test.py --url http://localhost:8000    # an already running service
+     python benchmarks/load_test.py --compare before.json after.json
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import requests
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+BENCH_DIR = Path(__file__).resolve().parent
+
+CROPS = ["corn", "soybean", "wheat", "sunflower", "barley", "sorghum"]
+ISSUES = ["aphids", "armyworm", "rust", "drought stress", "weeds", "hail damage", "nitrogen deficiency", "none"]
+TASK_TYPES = ["field_visit", "scouting", "spraying", "sampling", "harvest_check"]
+NOTES = [
+    "Found {issue} on {crop} near the north edge of {field}, about {pct}% of plants affected.",
+    "{crop} looks uniform in {field}; checked for {issue}, low pressure. Recommend follow-up in {days} days.",
+    "Applied glyphosate on {field} before {crop} planting. Residual {issue} patches along the drainage.",
+    "Soil moisture low in {field}. {crop} at V{stage}, signs of {issue} in the lower leaves.",
+    "Sampled {field} for {issue}; {crop} stand count lower than expected on the east side.",
+]
+QUERIES = [
+    "{issue} on {crop}",
+    "fields with {issue}",
+    "{crop} stand count problems",
+    "where did we apply glyphosate",
+    "low soil moisture {crop}",
+    "{issue} in {field}",
+    "damage after the storm",
+    "follow-up visits for {crop}",
+]
+# Visit and photo positions: a farming region around Pergamino, Argentina
+CENTER_LAT, CENTER_LON, SPREAD_DEG = -33.89, -60.57, 0.5
+
+# Service settings worth recording next to the numbers
+RECORDED_ENV = (
+    "VECTOR_BACKEND", "VECTOR_DTYPE", "HASH_EMBEDDING_DIMS", "EMBED_QUEUE_WORKERS", "EMBED_QUEUE_BATCH_SIZE",
+    "SEARCH_CACHE_SIZE", "QUERY_CACHE_SIZE", "HNSW_M", "HNSW_SEARCH_EF", "OPENAI_MAX_CONCURRENCY",
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR,
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# ----------------------------------------------------------------------------
+# Synthetic data
+# ----------------------------------------------------------------------------
+
+def _field(rng: random.Random, fields: int) -> str:
+    return f"Lote {rng.randrange(1, fields + 1)}"
+
+
+def synthetic_visit(i: int, fields: int, seed: int) -> Dict[str, Any]:
+    """Visit ``i`` (deterministic for a seed)"""
+    rng = random.Random(seed * 1_000_003 + i)
+    crop, issue, field = rng.choice(CROPS), rng.choice(ISSUES), _field(rng, fields)
+    created = 1_700_000_000_000 + i * 60_000
+    note = rng.choice(NOTES).format(
+        crop=crop, issue=issue, field=field,
+        pct=rng.randrange(5, 60), days=rng.randrange(3, 15), stage=rng.randrange(2, 12)
+    )
+    return {
+        "id": f"bench-visit-{i}",
+        "createdAt": created,
+        "updatedAt": created,
+        "task_type": rng.choice(TASK_TYPES),
+        "lat": CENTER_LAT + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+        "lon": CENTER_LON + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+        "acc": rng.randrange(3, 30),
+        "note": note,
+        "photo_present": rng.random() < 0.3,
+        "field_id": field,
+        "crop": crop,
+        "issue": issue,
+        "severity": rng.randrange(1, 6),
+    }
+
+
+def synthetic_png(i: int, size: int = 32) -> bytes:
+    """A small valid RGB PNG whose pixels depend on ``i``"""
+    rng = np.random.default_rng(i)
+    pixels = rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8)
+    raw = b"".join(b"\x00" + row.tobytes() for row in pixels)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+def synthetic_query(rng: random.Random, fields: int) -> str:
+    return rng.choice(QUERIES).format(crop=rng.choice(CROPS), issue=rng.choice(ISSUES), field=_field(rng, fields))
+
+
+def synthetic_filters(rng: random.Random, fields: int) -> Optional[Dict[str, Any]]:
+    roll = rng.random()
+    if roll < 0.5:
+        return None
+    if roll < 0.7:
+        return {"crop": rng.choice(CROPS)}
+    if roll < 0.85:
+        return {"field_id": _field(rng, fields)}
+    return {"near": {
+        "lat": CENTER_LAT + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+        "lon": CENTER_LON + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+        "radius_m": rng.choice([2000, 10000, 25000]),
+    }}
+
+
+# ----------------------------------------------------------------------------
+# Load generation
+# ----------------------------------------------------------------------------
+
+def latency_summary(latencies_ms: List[float]) -> Dict[str, float]:
+    if not latencies_ms:
+        return {}
+    values = np.asarray(latencies_ms)
+    return {
+        "mean": round(float(values.mean()), 2),
+        **{f"p{p}": round(float(np.percentile(values, p)), 2) for p in (50, 90, 95, 99)},
+        "max": round(float(values.max()), 2),
+    }
+
+
+def run_phase(
+    name: str,
+    items: Iterator[Any],
+    send: Callable[[requests.Session, Any], requests.Response],
+    concurrency: int,
+    units: Callable[[Any], int] = lambda item: 1,
+    accept: Optional[Callable[[requests.Response], bool]] = None,
+) -> Dict[str, Any]:
+    """
+    Send every item with ``concurrency`` threads (one keep-alive session each)
+    and summarize throughput, latency and status codes. ``units`` counts the
+    records in an item (visits per batch) for the records/s figure; 2xx
+    responses failing ``accept`` are counted as "<code>-rejected" errors.
+    """
+    lock = threading.Lock()
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    totals = {"requests": 0, "records": 0}
+
+    def worker():
+        session = requests.Session()
+        while True:
+            with lock:
+                item = next(items, None)
+            if item is None:
+                return
+            start = time.perf_counter()
+            try:
+                response = send(session, item)
+                status = str(response.status_code)
+                if accept is not None and response.ok and not accept(response):
+                    status += "-rejected"
+            except requests.RequestException as e:
+                status = type(e).__name__
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+                totals["requests"] += 1
+                totals["records"] += units(item)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, name=f"{name}-{n}") for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    errors = sum(count for status, count in statuses.items() if not (status.isdigit() and status.startswith("2")))
+    result = {
+        "requests": totals["requests"],
+        "records": totals["records"],
+        "errors": errors,
+        "status_codes": statuses,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(totals["requests"] / wall, 2) if wall else None,
+        "records_per_s": round(totals["records"] / wall, 2) if wall else None,
+        "latency_ms": latency_summary(latencies),
+    }
+    print(f"  {name:<14} {result['requests']:>8} req  {result['throughput_rps'] or 0:>9.1f} req/s  "
+          f"p50 {result['latency_ms'].get('p50', 0):>8.2f} ms  p99 {result['latency_ms'].get('p99', 0):>8.2f} ms  "
+          f"errors {errors}")
+    return result
+
+
+def queue_stats(url: str) -> Dict[str, Any]:
+    return requests.get(f"{url}/embeddings/queue", timeout=30).json()
+
+
+def wait_for_queue(url: str, timeout: float, poll: float = 0.5) -> Dict[str, Any]:
+    """Wait until no embedding jobs are pending"""
+    started = time.perf_counter()
+    first = stats = queue_stats(url)
+    while stats["pending"] > 0 and time.perf_counter() - started < timeout:
+        time.sleep(poll)
+        stats = queue_stats(url)
+    wall = time.perf_counter() - started
+    print(f"  {'embed':<14} {first['pending']:>8} still queued, drained in {wall:.1f}s"
+          f"{'' if stats['pending'] == 0 else ' (TIMED OUT)'}")
+    return {
+        "wall_s": round(wall, 3),
+        "pending_at_start": first["pending"],
+        "pending_at_end": stats["pending"],
+        "failed": stats.get("failed", 0),
+        "processed": stats.get("processed", 0),
+    }
+
+
+def run_load(url: str, args) -> Dict[str, Any]:
+    fields = max(1, args.visits // 50)
+    photos = args.photos if args.photos is not None else args.visits // 10
+    phases: Dict[str, Any] = {}
+
+    print(f"Load test against {url}: {args.visits} visits, {photos} photos, concurrency {args.concurrency}")
+
+    processed_before = queue_stats(url).get("processed", 0)
+    visits = (synthetic_visit(i, fields, args.seed) for i in range(args.visits))
+    if args.batch_size > 1:
+        def batches():
+            batch = []
+            for visit in visits:
+                batch.append(visit)
+                if len(batch) == args.batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        phases["upsert"] = run_phase(
+            "upsert", batches(),
+            lambda s, batch: s.post(f"{url}/sync/visits/upsert-batch", json={"visits": batch}, timeout=120),
+            args.concurrency, units=len
+        )
+    else:
+        phases["upsert"] = run_phase(
+            "upsert", visits,
+            lambda s, visit: s.post(f"{url}/sync/visits/upsert", json=visit, timeout=60),
+            args.concurrency
+        )
+
+    # Embedding runs in the background from the first upsert: rate over upsert + drain
+    embed = wait_for_queue(url, args.drain_timeout)
+    embed["embedded"] = embed.pop("processed") - processed_before
+    ingest_s = phases["upsert"]["wall_s"] + embed["wall_s"]
+    embed["records_per_s"] = round(embed["embedded"] / ingest_s, 2) if ingest_s else None
+    phases["embed"] = embed
+
+    rng = random.Random(args.seed)
+    photo_visits = [rng.randrange(args.visits) for _ in range(photos)] if args.visits else []
+    phases["embed-image"] = run_phase(
+        "embed-image", iter(enumerate(photo_visits)),
+        lambda s, item: s.post(
+            f"{url}/rag/embed-image",
+            files={"file": (f"bench_{item[0]}.png", synthetic_png(item[0]), "image/png")},
+            data={"visit_id": f"bench-visit-{item[1]}"},
+            timeout=60
+        ),
+        args.concurrency,
+        accept=lambda response: response.json().get("embedding_generated", False)
+    )
+
+    modes = args.modes.split(",")
+    searches = [
+        {"query": synthetic_query(rng, fields), "k": args.k, "mode": rng.choice(modes),
+         "filters": synthetic_filters(rng, fields)}
+        for _ in range(args.searches)
+    ]
+    phases["search"] = run_phase(
+        "search", iter(searches),
+        lambda s, body: s.post(f"{url}/rag/search", json=body, timeout=60),
+        args.concurrency
+    )
+
+    image_searches = [{"query": synthetic_query(rng, fields), "k": args.k} for _ in range(args.image_searches)]
+    phases["search-images"] = run_phase(
+        "search-images", iter(image_searches),
+        lambda s, body: s.post(f"{url}/rag/search-images", json=body, timeout=60),
+        args.concurrency
+    )
+
+    server = {}
+    for name, path in (("queue", "/embeddings/queue"), ("models", "/embeddings/models"), ("startup", "/readyz")):
+        try:
+            server[name] = requests.get(f"{url}{path}", timeout=30).json()
+        except (requests.RequestException, ValueError) as e:
+            server[name] = {"error": str(e)}
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "url": url,
+            "env": {key: os.environ[key] for key in RECORDED_ENV if key in os.environ},
+        },
+        "config": {
+            "visits": args.visits, "photos": photos, "searches": args.searches,
+            "image_searches": args.image_searches, "concurrency": args.concurrency,
+            "batch_size": args.batch_size, "k": args.k, "modes": modes, "seed": args.seed,
+            "text_provider": args.text_provider if not args.url else None,
+            "stub_latency_ms": args.stub_latency_ms if not args.url and args.text_provider == "stub-openai" else None,
+        },
+        "phases": phases,
+        "server": server,
+    }
+
+
+# ----------------------------------------------------------------------------
+# Offline service
+# ----------------------------------------------------------------------------
+
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Service exited with code {process.returncode}")
+        try:
+            if requests.get(f"{url}/readyz", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Service not ready after {timeout:.0f}s")
+
+
+def start_offline(args, data_dir: Path):
+    """Start the service (and the stub OpenAI server); returns (url, processes)"""
+    processes = []
+    env = {**os.environ, "DATA_DIR": str(data_dir), "CLIP_PROVIDER": "hash"}
+    if args.text_provider == "hash":
+        env["EMBEDDING_PROVIDER"] = "hash"
+    else:
+        stub_port = _free_port()
+        processes.append(subprocess.Popen([
+            sys.executable, str(BENCH_DIR / "stub_openai_server.py"),
+            "--port", str(stub_port), "--latency-ms", str(args.stub_latency_ms)
+        ]))
+        env.update({
+            "EMBEDDING_PROVIDER": "openai",
+            "OPENAI_API_KEY": "stub",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+        })
+
+    service_port = _free_port()
+    log = open(data_dir / "service.log", "w")
+    service = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(service_port), "--log-level", "warning"],
+        cwd=SERVICE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    processes.insert(0, service)
+    url = f"http://127.0.0.1:{service_port}"
+    try:
+        _wait_ready(url, service, args.startup_timeout)
+    except RuntimeError:
+        for process in processes:
+            process.terminate()
+        print(f"[ERROR] Service failed to start; see {data_dir / 'service.log'}")
+        raise
+    return url, processes
+
+
+# ----------------------------------------------------------------------------
+# Report comparison
+# ----------------------------------------------------------------------------
+
+def _change(before: Optional[float], after: Optional[float]) -> str:
+    if not before or after is None:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def compare(before_path: str, after_path: str):
+    before = json.loads(Path(before_path).read_text())
+    after = json.loads(Path(after_path).read_text())
+    print(f"{before_path} ({before['meta'].get('commit')}) -> {after_path} ({after['meta'].get('commit')})")
+    if before["config"] != after["config"]:
+        print("[WARNING] Reports were produced with different settings; numbers may not be comparable")
+    print(f"{'phase':<14} {'metric':<14} {'before':>12} {'after':>12} {'change':>10}")
+    for phase in after["phases"]:
+        if phase not in before["phases"]:
+            continue
+        old, new = before["phases"][phase], after["phases"][phase]
+        rows = [("records/s", old.get("records_per_s"), new.get("records_per_s"))]
+        for p in ("p50", "p99"):
+            rows.append((f"{p} ms", old.get("latency_ms", {}).get(p), new.get("latency_ms", {}).get(p)))
+        for metric, a, b in rows:
+            if a is None and b is None:
+                continue
+            print(f"{phase:<14} {metric:<14} {a if a is not None else '-':>12} "
+                  f"{b if b is not None else '-':>12} {_change(a, b):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test with synthetic farm visits")
+    parser.add_argument("--visits", type=int, default=1000, help="synthetic visits to upsert (1k-1M)")
+    parser.add_argument("--photos", type=int, help="photos to upload (default: visits / 10)")
+    parser.add_argument("--searches", type=int, default=1000)
+    parser.add_argument("--image-searches", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=1, help=">1: use /sync/visits/upsert-batch")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--modes", default="vector,lexical,hybrid", help="search modes to mix")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--text-provider", choices=["stub-openai", "hash"], default="stub-openai",
+                        help="text embeddings for the started service")
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0, help="simulated OpenAI latency")
+    parser.add_argument("--drain-timeout", type=float, default=3600)
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--url", help="test this running service instead of starting one")
+    parser.add_argument("--data-dir", help="DATA_DIR for the started service (default: a temp dir, removed)")
+    parser.add_argument("--out", help="write the JSON report to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two reports")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.url:
+        report = run_load(args.url.rstrip("/"), args)
+    else:
+        tmp = None
+        if args.data_dir:
+            data_dir = Path(args.data_dir)
+            data_dir.mkdir(parents=True, exist_ok=True)
+        else:
+            tmp = tempfile.TemporaryDirectory(prefix="rag-load-")
+            data_dir = Path(tmp.name)
+        url, processes = start_offline(args, data_dir)
+        try:
+            report = run_load(url, args)
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait(timeout=30)
+            if tmp is not None:
+                tmp.cleanup()
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+        print(f"[OK] Report written to {args.out}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
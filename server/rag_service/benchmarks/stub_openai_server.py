@@ -0,0 +1,145 @@
+"""
+Stub OpenAI embeddings server for offline tests and benchmarks.
+
+Implements POST /v1/embeddings (and GET /v1/models/{id}) with deterministic vectors derived from a
+hash of each input, in both "float" and "base64" encodings. Latency and
+429/500 error injection exercise the client's rate limiting and retries.
+
+Run:  python benchmarks/stub_openai_server.py --port 8901 [--latency-ms 50] [--error-rate 0.1]
+Then: OPENAI_BASE_URL=http://127.0.0.1:8901/v1 OPENAI_API_KEY=stub python main.py
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def stub_embedding(text: str, dims: int) -> list:
+    """Deterministic unit vector for ``text``"""
+    values = []
+    counter = 0
+    while len(values) < dims:
+        digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        values.extend(b / 127.5 - 1.0 for b in digest)
+        counter += 1
+    values = values[:dims]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [v / norm for v in values]
+
+
+class StubState:
+    def __init__(self, dims: int, latency_ms: float, error_rate: float):
+        self.dims = dims
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.requests = 0
+        self.inputs = 0
+        self.lock = threading.Lock()
+
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+
+        def _send(self, status: int, body: dict, headers: dict = None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            path = self.path.rstrip("/")
+            if path == "/stats":
+                self._send(200, {"requests": state.requests, "inputs": state.inputs})
+            elif "/models/" in path:
+                # Model lookup, used by the service's health probe
+                model = path.rsplit("/", 1)[1]
+                self._send(200, {"id": model, "object": "model", "created": 0, "owned_by": "stub"})
+            else:
+                self._send(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.rstrip("/").endswith("/embeddings"):
+                self._send(404, {"error": {"message": "not found"}})
+                return
+
+            if state.latency:
+                time.sleep(state.latency)
+            if state.error_rate and random.random() < state.error_rate:
+                if random.random() < 0.5:
+                    self._send(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                               {"Retry-After": "0.05"})
+                else:
+                    self._send(500, {"error": {"message": "Internal error", "type": "server_error"}})
+                return
+
+            inputs = body.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            dims = int(body.get("dimensions") or state.dims)
+            data = []
+            for i, text in enumerate(inputs):
+                vector = stub_embedding(text, dims)
+                if body.get("encoding_format") == "base64":
+                    vector = base64.b64encode(struct.pack(f"<{dims}f", *vector)).decode("ascii")
+                data.append({"object": "embedding", "index": i, "embedding": vector})
+            with state.lock:
+                state.requests += 1
+                state.inputs += len(inputs)
+            tokens = sum(len(t) // 4 + 1 for t in inputs)
+            self._send(200, {
+                "object": "list",
+                "data": data,
+                "model": body.get("model", "text-embedding-3-small"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            })
+
+        def log_message(self, format, *args):
+            pass  # Keep benchmark output clean
+
+    return Handler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8901, dims: int = 1536,
+          latency_ms: float = 0.0, error_rate: float = 0.0) -> ThreadingHTTPServer:
+    """Start the stub in a background thread and return the server"""
+    state = StubState(dims, latency_ms, error_rate)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-openai", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OpenAI embeddings server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429/500")
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.dims, args.latency_ms, args.error_rate)
+    print(f"[Stub] OpenAI embeddings stub on http://{args.host}:{args.port}/v1 ({args.dims} dims)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
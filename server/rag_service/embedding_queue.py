@@ -0,0 +1,237 @@
+"""
+Embedding Job Queue
+Durable queue of pending visit embeddings, persisted in SQLite.
+
+Sync endpoints enqueue a job in the same transaction that stores the visit,
+and background workers drain the queue in batches with retries and
+exponential backoff. Ingestion latency therefore no longer depends on the
+embedding provider, and failures stay visible instead of being lost.
+"""
+
+import random
+import sqlite3
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from db import Database
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class EmbeddingJob(NamedTuple):
+    visit_id: str
+    updated_at: int
+    attempts: int
+
+
+class EmbeddingQueue:
+    """SQLite-backed job table keyed by visit id"""
+
+    def __init__(
+        self,
+        db: Database,
+        max_attempts: int = 8,
+        base_delay: float = 2.0,
+        max_delay: float = 300.0,
+        lease_seconds: float = 120.0,
+    ):
+        self.db = db
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self._wakeup = threading.Event()
+
+    def init_schema(self, cursor: sqlite3.Cursor):
+        """Create the job table (called from init_db)"""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_jobs (
+                visit_id TEXT PRIMARY KEY,
+                updated_at INTEGER NOT NULL,
+                enqueued_at INTEGER NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at INTEGER NOT NULL,
+                locked_until INTEGER,
+                status TEXT NOT NULL DEFAULT 'pending',
+                last_error TEXT
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_embedding_jobs_ready
+            ON embedding_jobs(status, next_attempt_at)
+        """)
+
+    def enqueue(self, cursor: sqlite3.Cursor, visit_id: str, updated_at: int):
+        """
+        Queue a visit for embedding using the caller's cursor, so the job is
+        committed atomically with the visit row. Re-enqueueing a visit resets
+        its retry state; an older ``updated_at`` never replaces a newer one.
+        """
+        now = _now_ms()
+        cursor.execute("""
+            INSERT INTO embedding_jobs (visit_id, updated_at, enqueued_at, next_attempt_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(visit_id) DO UPDATE SET
+                updated_at = excluded.updated_at,
+                attempts = 0,
+                next_attempt_at = excluded.next_attempt_at,
+                status = 'pending',
+                last_error = NULL
+            WHERE excluded.updated_at >= embedding_jobs.updated_at
+        """, (visit_id, updated_at, now, now))
+
+    def notify(self):
+        """Wake idle workers after new jobs were committed"""
+        self._wakeup.set()
+
+    def wait(self, timeout: float):
+        """Block until notified or the timeout elapses"""
+        self._wakeup.wait(timeout)
+        self._wakeup.clear()
+
+    def claim(self, limit: int) -> List[EmbeddingJob]:
+        """Lease up to ``limit`` ready jobs for one worker"""
+        now = _now_ms()
+        with self.db.transaction(immediate=True) as cursor:
+            cursor.execute("""
+                SELECT visit_id, updated_at, attempts FROM embedding_jobs
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                  AND (locked_until IS NULL OR locked_until < ?)
+                ORDER BY next_attempt_at
+                LIMIT ?
+            """, (now, now, limit))
+            jobs = [EmbeddingJob(*row) for row in cursor.fetchall()]
+            if jobs:
+                locked_until = now + int(self.lease_seconds * 1000)
+                cursor.executemany(
+                    "UPDATE embedding_jobs SET locked_until = ? WHERE visit_id = ?",
+                    [(locked_until, job.visit_id) for job in jobs]
+                )
+        return jobs
+
+    def complete(self, jobs: List[EmbeddingJob]):
+        """
+        Remove finished jobs. A job re-enqueued with a newer ``updated_at``
+        while it was being processed stays queued and is released for retry.
+        """
+        if not jobs:
+            return
+        with self.db.transaction(immediate=True) as cursor:
+            cursor.executemany(
+                "DELETE FROM embedding_jobs WHERE visit_id = ? AND updated_at = ?",
+                [(job.visit_id, job.updated_at) for job in jobs]
+            )
+            cursor.executemany(
+                "UPDATE embedding_jobs SET locked_until = NULL WHERE visit_id = ?",
+                [(job.visit_id,) for job in jobs]
+            )
+
+    def fail(self, failures: Dict[EmbeddingJob, str]):
+        """Schedule failed jobs for retry with exponential backoff and jitter"""
+        if not failures:
+            return
+        now = _now_ms()
+        rows = []
+        for job, error in failures.items():
+            attempts = job.attempts + 1
+            delay = min(self.max_delay, self.base_delay * (2 ** job.attempts))
+            delay *= random.uniform(0.8, 1.2)
+            status = "failed" if attempts >= self.max_attempts else "pending"
+            rows.append((
+                attempts, now + int(delay * 1000), status, error[:500],
+                job.visit_id, job.updated_at
+            ))
+        with self.db.transaction(immediate=True) as cursor:
+            cursor.executemany("""
+                UPDATE embedding_jobs
+                SET attempts = ?, next_attempt_at = ?, status = ?, last_error = ?,
+                    locked_until = NULL
+                WHERE visit_id = ? AND updated_at = ?
+            """, rows)
+            # Release jobs that were re-enqueued with a newer version meanwhile
+            cursor.executemany(
+                "UPDATE embedding_jobs SET locked_until = NULL WHERE visit_id = ?",
+                [(job.visit_id,) for job in failures]
+            )
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        """Queue depth, in-flight count and lag of the oldest pending job"""
+        now = _now_ms()
+        pending, in_flight, retrying, failed, oldest = self.db.fetchone("""
+            SELECT
+                SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END),
+                SUM(CASE WHEN status = 'pending' AND locked_until >= ? THEN 1 ELSE 0 END),
+                SUM(CASE WHEN status = 'pending' AND attempts > 0 THEN 1 ELSE 0 END),
+                SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END),
+                MIN(CASE WHEN status = 'pending' THEN enqueued_at END)
+            FROM embedding_jobs
+        """, (now,))
+        return {
+            "pending": pending or 0,
+            "in_flight": in_flight or 0,
+            "retrying": retrying or 0,
+            "failed": failed or 0,
+            "oldest_enqueued_at": oldest,
+            "lag_ms": now - oldest if oldest is not None else 0,
+        }
+
+
+# Handler contract: receives claimed jobs, returns {job: error} for failures
+JobHandler = Callable[[List[EmbeddingJob]], Dict[EmbeddingJob, str]]
+
+
+class EmbeddingWorker(threading.Thread):
+    """Background thread that drains the queue in batches"""
+
+    def __init__(
+        self,
+        queue: EmbeddingQueue,
+        handler: JobHandler,
+        batch_size: int = 64,
+        poll_interval: float = 1.0,
+        name: str = "embedding-worker",
+    ):
+        super().__init__(name=name, daemon=True)
+        self.queue = queue
+        self.handler = handler
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.processed = 0
+        self.failed = 0
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        self.queue.notify()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                jobs = self.queue.claim(self.batch_size)
+            except Exception as e:
+                print(f"[EmbedQueue] Claim failed: {e}")
+                jobs = []
+            if not jobs:
+                self.queue.wait(self.poll_interval)
+                continue
+
+            try:
+                failures = self.handler(jobs)
+            except Exception as e:
+                traceback.print_exc()
+                failures = {job: str(e) for job in jobs}
+
+            try:
+                self.queue.complete([job for job in jobs if job not in failures])
+                self.queue.fail(failures)
+            except Exception as e:
+                # Leases expire, so the jobs are picked up again later
+                print(f"[EmbedQueue] Failed to record job results: {e}")
+            self.processed += len(jobs) - len(failures)
+            self.failed += len(failures)
+            if failures:
+                print(f"[EmbedQueue] {len(failures)}/{len(jobs)} jobs failed, scheduled for retry")
@@ -0,0 +1,114 @@
+"""
+Embedding Micro-Batcher
+Coalesces concurrent single-item embedding requests into batched model calls.
+
+MiniLM and CLIP run one matrix multiply per batch, so encoding 16 strings at
+once costs little more than encoding one. Callers submit items and block on
+a future; a dedicated thread collects items for up to ``max_wait_ms`` (or
+until ``max_batch`` items are waiting), runs one batched call and fans the
+results back out.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "32"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "10"))
+
+# Batch function: one result per input item, or None if the batch failed
+BatchFn = Callable[[List[Any]], Optional[List[Any]]]
+
+
+class MicroBatcher:
+    """Collects items from many threads and processes them in batches"""
+
+    def __init__(
+        self,
+        batch_fn: BatchFn,
+        max_batch: int = EMBED_BATCH_MAX,
+        max_wait_ms: float = EMBED_BATCH_WAIT_MS,
+        name: str = "batcher",
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.name = name
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+
+    def _ensure_started(self):
+        # Started on first use so constructing a batcher has no side effects
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        """Queue one item; the future resolves to its result"""
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def embed(self, items: List[Any]) -> Optional[List[Any]]:
+        """
+        Blocking batch-of-items API matching the underlying batch function.
+        Returns None if any item failed, like a failed direct call would.
+        """
+        if not items:
+            return []
+        futures = [self.submit(item) for item in items]
+        results = [f.result() for f in futures]
+        if any(r is None for r in results):
+            return None
+        return results
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = self.batch_fn(items)
+                if results is None or len(results) != len(batch):
+                    results = [None] * len(batch)
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+            "largest_batch": self.largest_batch,
+        }
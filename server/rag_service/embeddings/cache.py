@@ -0,0 +1,128 @@
+"""
+Embedding Cache
+Persistent cache of text embeddings keyed by (provider, model, sha256(text)).
+
+Re-synced visits whose embedding text did not change (client retries, edits
+to lat/acc, backfill re-runs) are served from SQLite instead of paying for
+another OpenAI call or another MiniLM forward pass.
+"""
+
+import hashlib
+import sqlite3
+import time
+from array import array
+from typing import Callable, List, Optional
+
+from db import Database
+
+# Batch embedding function: returns one vector per input, or None on failure
+BatchEmbedFn = Callable[[List[str]], Optional[List[List[float]]]]
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_CHUNK = 500
+
+
+def text_hash(text: str) -> str:
+    """Stable content hash of the text that gets embedded"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _pack(embedding: List[float]) -> bytes:
+    return array("f", embedding).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding cache shared by the service and the scripts"""
+
+    def __init__(self, db: Database):
+        self.db = db
+        self.hits = 0
+        self.misses = 0
+
+    def init_schema(self, cursor: sqlite3.Cursor):
+        """Create the cache table (called from init_db)"""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dims INTEGER NOT NULL,
+                embedding BLOB NOT NULL,
+                created_at INTEGER NOT NULL,
+                PRIMARY KEY (provider, model, text_hash)
+            ) WITHOUT ROWID
+        """)
+
+    def get_many(self, provider: str, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up cached vectors; misses map to None"""
+        hashes = [text_hash(t) for t in texts]
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), _LOOKUP_CHUNK):
+            chunk = unique[start:start + _LOOKUP_CHUNK]
+            placeholders = ",".join("?" for _ in chunk)
+            rows = self.db.fetchall(f"""
+                SELECT text_hash, embedding FROM embedding_cache
+                WHERE provider = ? AND model = ? AND text_hash IN ({placeholders})
+            """, [provider, model, *chunk])
+            for h, blob in rows:
+                found[h] = _unpack(blob)
+        results = [found.get(h) for h in hashes]
+        hit_count = sum(1 for r in results if r is not None)
+        self.hits += hit_count
+        self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, provider: str, model: str, texts: List[str], embeddings: List[List[float]]):
+        """Store freshly computed vectors"""
+        now = int(time.time() * 1000)
+        rows = [
+            (provider, model, text_hash(t), len(e), _pack(e), now)
+            for t, e in zip(texts, embeddings) if e
+        ]
+        if not rows:
+            return
+        with self.db.transaction() as cursor:
+            cursor.executemany("""
+                INSERT OR REPLACE INTO embedding_cache
+                    (provider, model, text_hash, dims, embedding, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+
+    def embed(self, provider: str, model: str, texts: List[str], compute: BatchEmbedFn) -> Optional[List[List[float]]]:
+        """
+        Return embeddings for ``texts``, calling ``compute`` only for cache
+        misses (deduplicated). Returns None if the misses could not be embedded.
+        """
+        try:
+            results = self.get_many(provider, model, texts)
+        except sqlite3.Error as e:
+            print(f"[EmbedCache] Lookup failed, bypassing cache: {e}")
+            return compute(texts)
+
+        missing = list(dict.fromkeys(t for t, r in zip(texts, results) if r is None))
+        if missing:
+            computed = compute(missing)
+            if computed is None:
+                return None
+            try:
+                self.put_many(provider, model, missing, computed)
+            except sqlite3.Error as e:
+                print(f"[EmbedCache] Store failed: {e}")
+            by_text = dict(zip(missing, computed))
+            results = [r if r is not None else by_text[t] for t, r in zip(texts, results)]
+        return results
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+        }
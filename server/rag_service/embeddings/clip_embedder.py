@@ -9,12 +9,21 @@ from pathlib import Path
 from typing import List, Optional, Tuple
 import base64
 import io
+import threading
+
+from metrics import stage
 
 # SSL workaround for Windows Anaconda OpenSSL compatibility issues
 # This fixes "module 'lib' has no attribute 'X509_V_FLAG_NOTIFY_POLICY'" error
-# Must be applied BEFORE importing transformers/huggingface_hub
+# Must be applied BEFORE importing transformers/huggingface_hub, so it runs
+# when the model is first loaded, not when this module is imported
+_ssl_fixed = None
+
 def _apply_ssl_workaround():
-    """Apply SSL fixes for Anaconda OpenSSL conflicts"""
+    """Apply SSL fixes for Anaconda OpenSSL conflicts (once)"""
+    global _ssl_fixed
+    if _ssl_fixed is not None:
+        return _ssl_fixed
     try:
         import ssl
         import certifi
@@ -35,17 +44,18 @@ def _apply_ssl_workaround():
             pass
         
         print("[CLIP] Applied SSL workaround for HuggingFace downloads")
-        return True
+        _ssl_fixed = True
     except Exception as e:
         print(f"[CLIP] SSL workaround failed: {e}")
-        return False
-
-_ssl_fixed = _apply_ssl_workaround()
+        _ssl_fixed = False
+    return _ssl_fixed
 
 # Lazy loading flags
 _clip_model = None
 _clip_processor = None
 _device = None
+_load_error = None  # Why the last load attempt failed (health checks)
+_load_lock = threading.Lock()
 
 
 def _get_device():
@@ -71,54 +81,92 @@ def _get_device():
 
 
 def _load_clip_model():
-    """Lazy load CLIP model and processor"""
-    global _clip_model, _clip_processor
+    """Lazy load CLIP model and processor (once, even with concurrent callers)"""
+    global _clip_model, _clip_processor, _load_error
     
     if _clip_model is not None:
         return _clip_model, _clip_processor
     
-    try:
-        from transformers import CLIPModel, CLIPProcessor
-        import torch
-        
-        device = _get_device()
-        model_name = "openai/clip-vit-base-patch32"
-        
-        print(f"[CLIP] Loading model: {model_name}...")
-        _clip_processor = CLIPProcessor.from_pretrained(model_name)
-        _clip_model = CLIPModel.from_pretrained(model_name)
-        _clip_model = _clip_model.to(device)
-        _clip_model.eval()  # Set to evaluation mode
-        
-        print(f"[CLIP] Model loaded on {device}")
-        return _clip_model, _clip_processor
+    # The text and image batchers and the startup warmup may all get here at once
+    with _load_lock:
+        if _clip_model is not None:
+            return _clip_model, _clip_processor
         
-    except ImportError as e:
-        print(f"[CLIP] Failed to import transformers: {e}")
-        print("[CLIP] Install with: pip install transformers torch torchvision")
-        return None, None
-    except Exception as e:
-        print(f"[CLIP] Failed to load model: {e}")
-        return None, None
+        _apply_ssl_workaround()
+        try:
+            from transformers import CLIPModel, CLIPProcessor
+            import torch
+            
+            device = _get_device()
+            model_name = "openai/clip-vit-base-patch32"
+            
+            print(f"[CLIP] Loading model: {model_name}...")
+            processor = CLIPProcessor.from_pretrained(model_name)
+            model = CLIPModel.from_pretrained(model_name).to(device)
+            model.eval()  # Set to evaluation mode
+            
+            # Publish only the fully initialized model: callers check _clip_model unlocked
+            _clip_processor = processor
+            _clip_model = model
+            print(f"[CLIP] Model loaded on {device}")
+            _load_error = None
+            return _clip_model, _clip_processor
+            
+        except ImportError as e:
+            _load_error = f"Failed to import transformers: {e}"
+            print(f"[CLIP] Failed to import transformers: {e}")
+            print("[CLIP] Install with: pip install transformers torch torchvision")
+            return None, None
+        except Exception as e:
+            _load_error = f"Failed to load model: {e}"
+            print(f"[CLIP] Failed to load model: {e}")
+            return None, None
 
 
-def get_image_embedding(image_input, return_numpy: bool = True) -> Optional[List[float]]:
+def _load_image(image_input):
     """
-    Generate CLIP embedding for an image.
+    Open an image input as an RGB PIL image.
+    
+    Accepts a file path, raw bytes, a base64 string (data URL or raw base64)
+    or a PIL Image.
+    """
+    from PIL import Image
+    
+    if isinstance(image_input, str):
+        if image_input.startswith('data:image'):
+            # Base64 data URL
+            base64_data = image_input.split(',')[1]
+            image = Image.open(io.BytesIO(base64.b64decode(base64_data)))
+        elif image_input.startswith('/9j/') or len(image_input) > 1000:
+            # Raw base64 (JPEG starts with /9j/)
+            image = Image.open(io.BytesIO(base64.b64decode(image_input)))
+        else:
+            # File path
+            image = Image.open(image_input)
+    elif isinstance(image_input, bytes):
+        image = Image.open(io.BytesIO(image_input))
+    else:
+        # Assume PIL Image
+        image = image_input
+    
+    # Convert to RGB if necessary
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def get_image_embeddings(image_inputs: list) -> Optional[List[Optional[List[float]]]]:
+    """
+    Generate CLIP embeddings for a batch of images in one forward pass.
     
     Args:
-        image_input: One of:
-            - str: File path to image
-            - bytes: Raw image bytes
-            - PIL.Image: PIL Image object
-            - str: Base64 encoded image (data URL or raw base64)
-        return_numpy: If True, return as list of floats
+        image_inputs: Images in any form accepted by get_image_embedding
         
     Returns:
-        List of 512 floats (CLIP embedding) or None if failed
+        One list of 512 floats per image (None for an image that could not
+        be decoded), or None if the model failed
     """
     try:
-        from PIL import Image
         import torch
         
         model, processor = _load_clip_model()
@@ -127,44 +175,28 @@ def get_image_embedding(image_input, return_numpy: bool = True) -> Optional[List
         
         device = _get_device()
         
-        # Handle different input types
-        if isinstance(image_input, str):
-            if image_input.startswith('data:image'):
-                # Base64 data URL
-                base64_data = image_input.split(',')[1]
-                image_bytes = base64.b64decode(base64_data)
-                image = Image.open(io.BytesIO(image_bytes))
-            elif image_input.startswith('/9j/') or len(image_input) > 1000:
-                # Raw base64 (JPEG starts with /9j/)
-                image_bytes = base64.b64decode(image_input)
-                image = Image.open(io.BytesIO(image_bytes))
-            else:
-                # File path
-                image = Image.open(image_input)
-        elif isinstance(image_input, bytes):
-            image = Image.open(io.BytesIO(image_input))
-        else:
-            # Assume PIL Image
-            image = image_input
+        # Decode each image on its own: one corrupt upload must not fail the batch
+        with stage("clip_preprocess", "image"):
+            images = {}
+            for i, image_input in enumerate(image_inputs):
+                try:
+                    images[i] = _load_image(image_input)
+                except Exception as e:
+                    print(f"[CLIP] Could not decode image {i + 1}/{len(image_inputs)}: {e}")
+            results: List[Optional[List[float]]] = [None] * len(image_inputs)
+            if not images:
+                return results
+            inputs = processor(images=list(images.values()), return_tensors="pt")
+            inputs = {k: v.to(device) for k, v in inputs.items()}
         
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Process image
-        inputs = processor(images=image, return_tensors="pt")
-        inputs = {k: v.to(device) for k, v in inputs.items()}
-        
-        # Generate embedding
-        with torch.no_grad():
+        # Generate embeddings
+        with stage("clip_inference", "image"), torch.no_grad():
             image_features = model.get_image_features(**inputs)
-            # Normalize embedding
+            # Normalize each embedding
             image_features = image_features / image_features.norm(dim=-1, keepdim=True)
-        
-        # Convert to list
-        embedding = image_features.cpu().numpy().flatten().tolist()
-        
-        return embedding
+            for i, embedding in zip(images, image_features.cpu().numpy().tolist()):
+                results[i] = embedding
+            return results
         
     except Exception as e:
         print(f"[CLIP] Image embedding error: {e}")
@@ -173,19 +205,35 @@ def get_image_embedding(image_input, return_numpy: bool = True) -> Optional[List
         return None
 
 
-def get_text_embedding_clip(text: str) -> Optional[List[float]]:
+def get_image_embedding(image_input, return_numpy: bool = True) -> Optional[List[float]]:
     """
-    Generate CLIP text embedding for cross-modal search.
+    Generate CLIP embedding for an image.
     
     Args:
-        text: Text to embed
+        image_input: One of:
+            - str: File path to image
+            - bytes: Raw image bytes
+            - PIL.Image: PIL Image object
+            - str: Base64 encoded image (data URL or raw base64)
+        return_numpy: If True, return as list of floats
         
     Returns:
-        List of 512 floats (CLIP text embedding) or None if failed
+        List of 512 floats (CLIP embedding) or None if failed
     """
-    if not text or not text.strip():
-        return None
+    embeddings = get_image_embeddings([image_input])
+    return embeddings[0] if embeddings else None
+
+
+def get_text_embeddings_clip(texts: List[str]) -> Optional[List[List[float]]]:
+    """
+    Generate CLIP text embeddings for a batch of texts in one forward pass.
+    
+    Args:
+        texts: Non-empty texts to embed
         
+    Returns:
+        One list of 512 floats per text, or None if failed
+    """
     try:
         import torch
         
@@ -195,20 +243,17 @@ def get_text_embedding_clip(text: str) -> Optional[List[float]]:
         
         device = _get_device()
         
-        # Process text
-        inputs = processor(text=text, return_tensors="pt", padding=True, truncation=True)
-        inputs = {k: v.to(device) for k, v in inputs.items()}
+        # Process text (padded to the longest text in the batch)
+        with stage("clip_preprocess", "text"):
+            inputs = processor(text=texts, return_tensors="pt", padding=True, truncation=True)
+            inputs = {k: v.to(device) for k, v in inputs.items()}
         
-        # Generate embedding
-        with torch.no_grad():
+        # Generate embeddings
+        with stage("clip_inference", "text"), torch.no_grad():
             text_features = model.get_text_features(**inputs)
-            # Normalize embedding
+            # Normalize each embedding
             text_features = text_features / text_features.norm(dim=-1, keepdim=True)
-        
-        # Convert to list
-        embedding = text_features.cpu().numpy().flatten().tolist()
-        
-        return embedding
+            return text_features.cpu().numpy().tolist()
         
     except Exception as e:
         print(f"[CLIP] Text embedding error: {e}")
@@ -217,6 +262,24 @@ def get_text_embedding_clip(text: str) -> Optional[List[float]]:
         return None
 
 
+def get_text_embedding_clip(text: str) -> Optional[List[float]]:
+    """
+    Generate CLIP text embedding for cross-modal search.
+    The service goes through embeddings.providers.ClipTextProvider, which
+    micro-batches concurrent queries.
+    
+    Args:
+        text: Text to embed
+        
+    Returns:
+        List of 512 floats (CLIP text embedding) or None if failed
+    """
+    if not text or not text.strip():
+        return None
+    embeddings = get_text_embeddings_clip([text])
+    return embeddings[0] if embeddings else None
+
+
 def get_image_metadata(image_path: str) -> dict:
     """
     Extract metadata from image file.
@@ -0,0 +1,164 @@
+"""
+OpenAI Embedding Client
+Long-lived, pooled client for the embeddings endpoint.
+
+- One ``openai.OpenAI`` instance per process, so HTTP keep-alive and TLS
+  sessions are reused instead of rebuilt on every call.
+- Bounded concurrency (semaphore sized to the HTTP connection pool).
+- Token-bucket budgeting against the account's RPM and TPM quotas, so bursts
+  wait locally instead of tripping 429s.
+- Exponential backoff with jitter on 429, 5xx and connection errors,
+  honouring ``Retry-After`` when the server sends it.
+- Native multi-input requests, split into chunks of ``max_batch`` inputs.
+
+Set ``OPENAI_BASE_URL`` to point it at a local stub server
+(``benchmarks/stub_openai_server.py``) for tests and benchmarks.
+"""
+
+import os
+import random
+import threading
+import time
+from typing import List, Optional
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "4"))
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "3000"))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "1000000"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+OPENAI_MAX_BATCH = int(os.getenv("OPENAI_MAX_BATCH", "256"))
+OPENAI_PROBE_TIMEOUT = float(os.getenv("OPENAI_PROBE_TIMEOUT", "5"))
+
+
+class EmbeddingProviderError(Exception):
+    """Raised when the provider could not return embeddings after retries"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap upper-bound token estimate (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at ``rate_per_minute``"""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = max(1.0, rate_per_minute)
+        self.rate = self.capacity / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0):
+        """Block until ``amount`` tokens are available, then take them"""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(min(wait, 1.0))
+
+
+class OpenAIEmbeddingClient:
+    """Pooled, rate-limited, retrying embeddings client"""
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        base_url: Optional[str] = OPENAI_BASE_URL,
+        max_concurrency: int = OPENAI_MAX_CONCURRENCY,
+        rpm: float = OPENAI_RPM,
+        tpm: float = OPENAI_TPM,
+        max_retries: int = OPENAI_MAX_RETRIES,
+        timeout: float = OPENAI_TIMEOUT,
+        max_batch: int = OPENAI_MAX_BATCH,
+    ):
+        import httpx
+        import openai
+
+        self.model = model
+        self.max_retries = max_retries
+        self.max_batch = max(1, max_batch)
+        self._semaphore = threading.BoundedSemaphore(max(1, max_concurrency))
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._client = openai.OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,  # Retries are handled here, with the rate budget
+            timeout=timeout,
+            http_client=httpx.Client(
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=max_concurrency,
+                    max_keepalive_connections=max_concurrency,
+                ),
+            ),
+        )
+        self.requests_sent = 0
+        self.retries = 0
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, splitting into chunks of at most ``max_batch`` inputs"""
+        results: List[List[float]] = []
+        for start in range(0, len(texts), self.max_batch):
+            results.extend(self._embed_chunk(texts[start:start + self.max_batch]))
+        return results
+
+    def ping(self, timeout: float = OPENAI_PROBE_TIMEOUT):
+        """Reachability check for /health: retrieve the model, no retries or rate budget"""
+        self._client.with_options(timeout=timeout, max_retries=0).models.retrieve(self.model)
+
+    def _embed_chunk(self, texts: List[str]) -> List[List[float]]:
+        import openai
+
+        tokens = sum(estimate_tokens(t) for t in texts)
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            self._requests.acquire(1)
+            self._tokens.acquire(tokens)
+            try:
+                with self._semaphore:
+                    self.requests_sent += 1
+                    response = self._client.embeddings.create(model=self.model, input=texts)
+                # The API returns one item per input, tagged with its index
+                ordered = sorted(response.data, key=lambda d: d.index)
+                return [d.embedding for d in ordered]
+            except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+                last_error = e
+                delay = self._retry_delay(e, attempt)
+            except openai.APIStatusError as e:
+                # Other 4xx (bad key, bad request) will not succeed on retry
+                raise EmbeddingProviderError(f"OpenAI returned {e.status_code}: {e.message}") from e
+            if attempt < self.max_retries:
+                self.retries += 1
+                print(f"[OpenAI] {type(last_error).__name__}, retrying in {delay:.1f}s "
+                      f"(attempt {attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+        raise EmbeddingProviderError(
+            f"OpenAI embeddings failed after {self.max_retries + 1} attempts: {last_error}"
+        ) from last_error
+
+    @staticmethod
+    def _retry_delay(error: Exception, attempt: int) -> float:
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return min(30.0, 0.5 * (2 ** attempt)) * random.uniform(0.8, 1.2)
+
+    def stats(self) -> dict:
+        return {"requests": self.requests_sent, "retries": self.retries}
+
+    def close(self):
+        self._client.close()
@@ -0,0 +1,493 @@
+"""
+Embedding Providers
+One interface for every embedding backend used by the service and scripts.
+
+``embed_batch(items)`` is batch-first: it takes a list and returns one vector
+per item, or None if the batch could not be embedded. Every provider reports
+its ``model_id`` and ``dims`` and can be warmed up before the first request.
+
+- OpenAIProvider: OpenAI embeddings via the pooled OpenAIEmbeddingClient
+- SentenceTransformerProvider: local MiniLM, micro-batched
+- ClipTextProvider / ClipImageProvider: CLIP ViT-B/32, micro-batched
+- CachedProvider: serves repeated texts from the SQLite embedding cache
+- HashEmbeddingProvider / HashClipTextProvider / HashClipImageProvider:
+  deterministic feature-hashing vectors for tests, benchmarks and offline
+  development (EMBEDDING_PROVIDER=hash, CLIP_PROVIDER=hash)
+
+There is deliberately no per-call fallback between text models: OpenAI and
+MiniLM vectors have different sizes and live in separate collections
+(see model_registry.py).
+
+Model libraries are imported on first use, so importing this module is cheap.
+``probe()`` reports load state and availability for /health without loading
+anything.
+Provider calls are timed as the ``embedding`` stage in /metrics.
+"""
+
+import base64
+import importlib.util
+import math
+import os
+import re
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from embeddings.batcher import MicroBatcher
+from embeddings.cache import EmbeddingCache
+from embeddings.openai_client import EmbeddingProviderError, OpenAIEmbeddingClient
+from metrics import stage
+from tracing import span
+
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
+LOCAL_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+HASH_EMBEDDING_MODEL = "feature-hash-v1"
+HASH_CLIP_MODEL = "feature-hash-clip-v1"
+HASH_EMBEDDING_DIMS = int(os.getenv("HASH_EMBEDDING_DIMS", "384"))
+HASH_IMAGE_MAX_BYTES = 256 * 1024  # Leading image bytes hashed per image
+
+# Output sizes of the models above (sentence-transformers reports its own once loaded)
+MODEL_DIMS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+    "all-MiniLM-L6-v2": 384,
+    CLIP_MODEL_NAME: 512,
+}
+
+TEXT_PROVIDERS = ("openai", "local", "hash")
+CLIP_PROVIDERS = ("clip", "hash")
+
+
+class EmbeddingProvider(ABC):
+    """Batch-first embedding backend"""
+
+    name: str = "base"
+    model_id: str = ""
+    dims: int = 0
+    # Modules the model loads with (probe() checks they are installed, without importing)
+    requires: Tuple[str, ...] = ()
+    load_error: Optional[str] = None
+
+    @abstractmethod
+    def embed_batch(self, items: List[Any]) -> Optional[List[List[float]]]:
+        """One vector per item, or None if the batch failed"""
+
+    def embed(self, item: Any) -> Optional[List[float]]:
+        """Convenience wrapper for a single item"""
+        result = self.embed_batch([item])
+        return result[0] if result else None
+
+    def warmup(self) -> bool:
+        """Load models / open clients ahead of traffic. Returns True when ready"""
+        return True
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the model / client is loaded (never loads it)"""
+        return True
+
+    def probe(self) -> Dict[str, Any]:
+        """
+        Health: ``loaded``, ``available`` (None: not loaded yet, loads on first
+        use) and ``error``. Never loads a model.
+        """
+        if self.loaded:
+            return {"loaded": True, "available": True, "error": None}
+        missing = [m for m in self.requires if importlib.util.find_spec(m) is None]
+        if missing:
+            return {"loaded": False, "available": False, "error": f"Not installed: {', '.join(missing)}"}
+        if self.load_error:
+            return {"loaded": False, "available": False, "error": self.load_error}
+        return {"loaded": False, "available": None, "error": None}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"provider": self.name, "model": self.model_id, "dims": self.dims}
+
+
+class OpenAIProvider(EmbeddingProvider):
+    """OpenAI embeddings API (rate-limited, retried, pooled)"""
+
+    name = "openai"
+
+    def __init__(self, api_key: Optional[str], model: str = OPENAI_EMBEDDING_MODEL):
+        self.api_key = api_key
+        self.model_id = model
+        self.dims = MODEL_DIMS.get(model, 1536)
+        self._client: Optional[OpenAIEmbeddingClient] = None
+        self._lock = threading.Lock()
+
+    def _get_client(self) -> OpenAIEmbeddingClient:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = OpenAIEmbeddingClient(self.api_key, self.model_id)
+        return self._client
+
+    def embed_batch(self, texts: List[str]) -> Optional[List[List[float]]]:
+        if not self.api_key:
+            print("[ERROR] OpenAI provider selected but API key not set")
+            return None
+        try:
+            with stage("embedding", self.name):
+                return self._get_client().embed(texts)
+        except EmbeddingProviderError as e:
+            print(f"[ERROR] OpenAI embedding error: {e}")
+            return None
+        except Exception as e:
+            print(f"[ERROR] OpenAI client error: {e}")
+            return None
+
+    def warmup(self) -> bool:
+        if not self.api_key:
+            return False
+        self._get_client()
+        return True
+
+    @property
+    def loaded(self) -> bool:
+        return self._client is not None
+
+    def probe(self) -> Dict[str, Any]:
+        """Reachability of the API with one models request (once the client is open)"""
+        if not self.api_key:
+            return {"loaded": False, "available": False, "error": "OPENAI_API_KEY not set"}
+        if self._client is None:
+            return {"loaded": False, "available": None, "error": None}
+        try:
+            self._client.ping()
+            return {"loaded": True, "available": True, "error": None}
+        except Exception as e:
+            return {"loaded": True, "available": False, "error": f"{type(e).__name__}: {e}"}
+
+    def stats(self) -> Dict[str, Any]:
+        result = super().stats()
+        result["client"] = self._client.stats() if self._client else None
+        return result
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+
+
+class SentenceTransformerProvider(EmbeddingProvider):
+    """Local sentence-transformers model; concurrent calls share one encode()"""
+
+    name = "local"
+    requires = ("sentence_transformers",)
+
+    def __init__(self, model: str = LOCAL_EMBEDDING_MODEL):
+        self.model_id = model
+        self.dims = MODEL_DIMS.get(model, 0)
+        self._model = None
+        self._lock = threading.Lock()
+        self.batcher = MicroBatcher(self._encode, name="local-embedding-batcher")
+
+    def _load(self):
+        """Lazy load the sentence-transformers model"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    try:
+                        from sentence_transformers import SentenceTransformer
+                        model = SentenceTransformer(self.model_id)
+                        self.dims = model.get_sentence_embedding_dimension() or self.dims
+                        self._model = model
+                        self.load_error = None
+                        print(f"[INFO] Loaded local embedding model: {self.model_id}")
+                    except ImportError:
+                        self.load_error = "sentence-transformers not installed"
+                        print("[WARNING] sentence-transformers not installed. Install with: pip install sentence-transformers")
+                    except Exception as e:
+                        self.load_error = str(e)
+                        print(f"[WARNING] Failed to load local embedding model: {e}")
+        return self._model
+
+    def _encode(self, texts: List[str]) -> Optional[List[List[float]]]:
+        model = self._load()
+        if model is None:
+            return None
+        try:
+            with stage("embedding", self.name):
+                embeddings = model.encode(texts, normalize_embeddings=True)
+            return [e.tolist() for e in embeddings]
+        except Exception as e:
+            print(f"[ERROR] Local batch embedding error: {e}")
+            return None
+
+    def embed_batch(self, texts: List[str]) -> Optional[List[List[float]]]:
+        # The batch runs on the batcher thread: record the wait in the request trace
+        with span("embedding", self.name):
+            return self.batcher.embed(texts)
+
+    def warmup(self) -> bool:
+        return self._load() is not None
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def stats(self) -> Dict[str, Any]:
+        result = super().stats()
+        result["batching"] = self.batcher.stats()
+        return result
+
+
+class _ClipProvider(EmbeddingProvider):
+    """Shared model handling for the CLIP text and image towers"""
+
+    model_id = CLIP_MODEL_NAME
+    dims = MODEL_DIMS[CLIP_MODEL_NAME]
+    requires = ("transformers", "torch")
+
+    def __init__(self):
+        self.batcher = MicroBatcher(self._run_batch, name=f"{self.name}-batcher")
+
+    @abstractmethod
+    def _run_batch(self, items: List[Any]) -> Optional[List[List[float]]]:
+        """One batched forward pass (on the batcher thread); None if it failed"""
+
+    def embed_batch(self, items: List[Any]) -> Optional[List[List[float]]]:
+        with span("embedding", self.name):
+            return self.batcher.embed(items)
+
+    def warmup(self) -> bool:
+        from embeddings import clip_embedder
+        model, _ = clip_embedder._load_clip_model()
+        return model is not None
+
+    @property
+    def loaded(self) -> bool:
+        from embeddings import clip_embedder
+        return clip_embedder._clip_model is not None
+
+    @property
+    def load_error(self) -> Optional[str]:
+        from embeddings import clip_embedder
+        return clip_embedder._load_error
+
+    @property
+    def device(self) -> str:
+        from embeddings import clip_embedder
+        return clip_embedder._get_device()
+
+    def stats(self) -> Dict[str, Any]:
+        result = super().stats()
+        result["batching"] = self.batcher.stats()
+        return result
+
+
+class ClipTextProvider(_ClipProvider):
+    """CLIP text encoder, for text → image search"""
+
+    name = "clip-text"
+
+    def _run_batch(self, texts: List[str]) -> Optional[List[List[float]]]:
+        from embeddings import clip_embedder
+        with stage("embedding", self.name):
+            return clip_embedder.get_text_embeddings_clip(texts)
+
+
+class ClipImageProvider(_ClipProvider):
+    """CLIP image encoder; items are file paths, bytes, base64 or PIL images"""
+
+    name = "clip-image"
+
+    def _run_batch(self, images: List[Any]) -> Optional[List[Optional[List[float]]]]:
+        # None in the position of an image that could not be decoded
+        from embeddings import clip_embedder
+        with stage("embedding", self.name):
+            return clip_embedder.get_image_embeddings(images)
+
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _unit(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm == 0:
+        vector = [0.0] * len(vector)
+        vector[0] = norm = 1.0  # Empty input: a fixed unit vector (cosine needs norm > 0)
+    return [v / norm for v in vector]
+
+
+def hash_text_embedding(text: str, dims: int) -> List[float]:
+    """
+    Signed feature hashing of lowercased word tokens (weight 1) and their
+    character trigrams (weight 0.5) into a unit vector. Texts sharing words
+    get high cosine similarity, shared word stems ("aphid" / "aphids") some.
+    """
+    vector = [0.0] * dims
+    for token in _TOKEN_RE.findall(text.lower()):
+        features = [(token, 1.0)]
+        padded = f"#{token}#"
+        features.extend((padded[i:i + 3], 0.5) for i in range(len(padded) - 2))
+        for feature, weight in features:
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % dims] += weight if h & 0x80000000 else -weight
+    return _unit(vector)
+
+
+def _image_bytes(image: Any) -> bytes:
+    """Raw bytes of an image input, accepting what clip_embedder._load_image does"""
+    if isinstance(image, bytes):
+        return image
+    if isinstance(image, str):
+        if image.startswith("data:image"):
+            return base64.b64decode(image.split(",")[1])
+        if image.startswith("/9j/") or len(image) > 1000:
+            return base64.b64decode(image)
+        return Path(image).read_bytes()
+    return image.tobytes()  # PIL Image
+
+
+def hash_image_embedding(content: bytes, dims: int) -> List[float]:
+    """
+    Signed feature hashing of the file's byte 4-grams into a unit vector.
+    Identical files get identical vectors and files sharing most of their
+    bytes similar ones; there is no visual similarity.
+    """
+    import numpy as np
+
+    data = np.frombuffer(content[:HASH_IMAGE_MAX_BYTES], dtype=np.uint8).astype(np.uint32)
+    if len(data) < 4:
+        return hash_text_embedding(content.hex(), dims)
+    grams = data[:-3] | (data[1:-2] << 8) | (data[2:-1] << 16) | (data[3:] << 24)
+    h = grams * np.uint32(2654435761)  # Knuth multiplicative hash (wraps mod 2^32)
+    signs = (h >> 31).astype(np.float64) * 2 - 1
+    vector = np.bincount(h % np.uint32(dims), weights=signs, minlength=dims)
+    return _unit(vector.tolist())
+
+
+class HashEmbeddingProvider(EmbeddingProvider):
+    """Feature-hashing text embeddings: deterministic, no model, no network"""
+
+    name = "hash"
+
+    def __init__(self, model: str = HASH_EMBEDDING_MODEL, dims: int = HASH_EMBEDDING_DIMS):
+        self.model_id = model
+        self.dims = dims
+
+    def embed_batch(self, texts: List[str]) -> Optional[List[List[float]]]:
+        with stage("embedding", self.name):
+            return [hash_text_embedding(text, self.dims) for text in texts]
+
+
+class HashClipTextProvider(EmbeddingProvider):
+    """Stand-in for the CLIP text encoder (same size, no model)"""
+
+    name = "hash-clip-text"
+    model_id = HASH_CLIP_MODEL
+    dims = MODEL_DIMS[CLIP_MODEL_NAME]
+    device = "cpu"
+
+    def embed_batch(self, texts: List[str]) -> Optional[List[List[float]]]:
+        with stage("embedding", self.name):
+            return [hash_text_embedding(text, self.dims) for text in texts]
+
+
+class HashClipImageProvider(EmbeddingProvider):
+    """Stand-in for the CLIP image encoder (same size, no model)"""
+
+    name = "hash-clip-image"
+    model_id = HASH_CLIP_MODEL
+    dims = MODEL_DIMS[CLIP_MODEL_NAME]
+    device = "cpu"
+
+    def embed_batch(self, images: List[Any]) -> Optional[List[List[float]]]:
+        try:
+            with stage("embedding", self.name):
+                return [hash_image_embedding(_image_bytes(image), self.dims) for image in images]
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] Hash image embedding error: {e}")
+            return None
+
+
+class CachedProvider(EmbeddingProvider):
+    """Text provider wrapper that only computes embedding-cache misses"""
+
+    def __init__(self, inner: EmbeddingProvider, cache: EmbeddingCache):
+        self.inner = inner
+        self.cache = cache
+
+    @property
+    def name(self) -> str:
+        return self.inner.name
+
+    @property
+    def model_id(self) -> str:
+        return self.inner.model_id
+
+    @property
+    def dims(self) -> int:
+        return self.inner.dims
+
+    def embed_batch(self, texts: List[str]) -> Optional[List[List[float]]]:
+        return self.cache.embed(self.inner.name, self.inner.model_id, texts, self.inner.embed_batch)
+
+    def warmup(self) -> bool:
+        return self.inner.warmup()
+
+    @property
+    def loaded(self) -> bool:
+        return self.inner.loaded
+
+    def probe(self) -> Dict[str, Any]:
+        return self.inner.probe()
+
+    def stats(self) -> Dict[str, Any]:
+        return self.inner.stats()
+
+
+def resolve_text_provider(config: str, openai_api_key: Optional[str]) -> str:
+    """
+    Map the EMBEDDING_PROVIDER setting to the text provider that will run.
+    auto prefers OpenAI when a key is set (never hash); unknown values fall
+    back to local.
+    """
+    config = (config or "auto").lower()
+    if config == "auto":
+        return "openai" if openai_api_key else "local"
+    if config in TEXT_PROVIDERS:
+        return config
+    return "local"
+
+
+def create_provider(
+    name: str,
+    model: Optional[str] = None,
+    openai_api_key: Optional[str] = None,
+    cache: Optional[EmbeddingCache] = None,
+) -> EmbeddingProvider:
+    """Build text provider ``name`` (openai/local/hash) for ``model`` (None: the default)"""
+    if name == "openai":
+        provider: EmbeddingProvider = OpenAIProvider(openai_api_key, model or OPENAI_EMBEDDING_MODEL)
+    elif name == "local":
+        provider = SentenceTransformerProvider(model or LOCAL_EMBEDDING_MODEL)
+    elif name == "hash":
+        # Hashing is cheaper than a cache lookup: never cached
+        return HashEmbeddingProvider(model or HASH_EMBEDDING_MODEL)
+    else:
+        raise ValueError(f"Unknown text embedding provider: {name}")
+    return CachedProvider(provider, cache) if cache is not None else provider
+
+
+def resolve_clip_provider(config: str) -> str:
+    """Map the CLIP_PROVIDER setting (clip/hash) to the encoders that will run"""
+    config = (config or "clip").lower()
+    return config if config in CLIP_PROVIDERS else "clip"
+
+
+def image_collection_name(clip_provider: str) -> str:
+    """Image collection for a resolved CLIP provider; hash vectors never mix with CLIP ones"""
+    return "farm_visits_images" if clip_provider == "clip" else f"farm_visits_images__{clip_provider}"
+
+
+def create_clip_providers(name: str) -> Tuple[EmbeddingProvider, EmbeddingProvider]:
+    """(text encoder, image encoder) for CLIP provider ``name``"""
+    if name == "hash":
+        return HashClipTextProvider(), HashClipImageProvider()
+    return ClipTextProvider(), ClipImageProvider()
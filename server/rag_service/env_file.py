@@ -0,0 +1,36 @@
+"""
+.env Loading
+Kept free of project imports: modules such as tracing.py and startup.py
+read their settings from the environment when imported, so entry points
+(``python main.py``, backfill.py) must load .env before importing them.
+"""
+
+import os
+from pathlib import Path
+
+
+def load_env(path: Path):
+    """Load .env into os.environ (its values take precedence)"""
+    try:
+        from dotenv import load_dotenv
+        if path.exists():
+            load_dotenv(dotenv_path=path, override=True)
+            print(f"[INFO] Loaded .env from: {path}")
+        else:
+            load_dotenv(override=True)  # Try current directory as fallback
+    except ImportError:
+        # python-dotenv not installed, try reading .env manually
+        if path.exists():
+            with open(path, 'r', encoding='utf-8-sig') as f:  # utf-8-sig strips BOM
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#') and '=' in line:
+                        key, value = line.split('=', 1)
+                        # Strip BOM from key if present
+                        key = key.strip().lstrip('\ufeff')
+                        os.environ[key] = value.strip().strip('"').strip("'")
+            print(f"[INFO] Loaded .env manually from: {path}")
+    except Exception as e:
+        print(f"[WARNING] Failed to load .env file: {e}")
+        print(f"[INFO] .env path attempted: {path}")
+        print("[INFO] Using system environment variables only")
@@ -0,0 +1,87 @@
+"""
+Execution Layer
+Bounded thread pools that keep blocking work off the asyncio event loop.
+
+- I/O pool (``run_io``): SQLite, ChromaDB and file writes.
+- Embedding pool (``run_embed``): embedding calls. Their threads wait on a
+  micro-batcher (embeddings/batcher.py, where sentence-transformers and CLIP
+  run one forward pass at a time) or on OpenAI, including its rate-limit
+  and retry-backoff sleeps.
+
+A burst of image uploads or an OpenAI 429 storm parks embedding threads
+only, so /health and /visits/{id} never queue behind inference or backoff.
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+import tracing
+
+T = TypeVar("T")
+
+IO_POOL_SIZE = int(os.getenv("IO_POOL_SIZE", "16"))
+EMBED_POOL_SIZE = int(os.getenv("EMBED_POOL_SIZE", "16"))
+
+POOL_SIZES = {"io": IO_POOL_SIZE, "embed": EMBED_POOL_SIZE}
+
+_pools: Dict[str, ThreadPoolExecutor] = {}
+_lock = threading.Lock()
+
+
+def _get_pool(kind: str) -> ThreadPoolExecutor:
+    """Create pools lazily so importing this module has no side effects"""
+    with _lock:
+        if kind not in _pools:
+            _pools[kind] = ThreadPoolExecutor(max_workers=POOL_SIZES[kind], thread_name_prefix=kind)
+        return _pools[kind]
+
+
+def _call(fn: Callable[..., T], args: tuple, kwargs: dict) -> T:
+    # Profiled requests sample the pool threads working for them
+    with tracing.bind_thread():
+        return fn(*args, **kwargs)
+
+
+async def _run(kind: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    loop = asyncio.get_running_loop()
+    # Copy the caller's context so request-scoped contextvars survive the hop
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, _call, fn, args, kwargs)
+    return await loop.run_in_executor(_get_pool(kind), call)
+
+
+async def run_io(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run blocking I/O (SQLite, ChromaDB, files) on the I/O pool"""
+    return await _run("io", fn, *args, **kwargs)
+
+
+async def run_embed(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run an embedding call (model batcher or OpenAI) on the embedding pool"""
+    return await _run("embed", fn, *args, **kwargs)
+
+
+def shutdown(wait: bool = True):
+    """Stop all pools (called on application shutdown)"""
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """Configured pool sizes and current backlog"""
+    result = {}
+    for name, size in POOL_SIZES.items():
+        pool = _pools.get(name)
+        result[name] = {
+            "max_workers": size,
+            "threads": len(pool._threads) if pool else 0,
+            "queued": pool._work_queue.qsize() if pool else 0,
+        }
+    return result
@@ -0,0 +1,215 @@
+"""
+Geo Index
+SQLite R*Tree indexes over visit locations and photo EXIF GPS positions.
+
+``visits_geo`` (keyed by ``visits.rowid``) and ``photos_geo`` (keyed by
+``photos.rowid``) are kept in sync by triggers, so every visit upsert and
+every /rag/embed-image call updates them in the same transaction. Radius and
+bounding-box filters look up candidate ids in the R*Tree (only the index
+pages covering the area are read) and the vector query is then restricted
+to those ids, instead of scanning every visit.
+
+Filters (in /rag/search and /rag/search-images ``filters``):
+- ``near``: ``{"lat": .., "lon": .., "radius_m": ..}``
+- ``bbox``: ``{"min_lat": .., "min_lon": .., "max_lat": .., "max_lon": ..}``
+
+An area crossing the antimeridian has ``min_lon > max_lon`` (e.g. 170 to
+-170) and is looked up as two boxes, one on each side.
+"""
+
+import math
+import sqlite3
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from db import Database
+from search_filters import FilterError
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE_LAT = 111320.0
+
+# indexed table -> (R*Tree table, latitude column, longitude column)
+GEO_TABLES = {
+    "visits": ("visits_geo", "lat", "lon"),
+    "photos": ("photos_geo", "exif_lat", "exif_lon"),
+}
+
+
+class GeoArea(NamedTuple):
+    """
+    Bounding box, plus a center and radius for ``near`` filters.
+    ``min_lon > max_lon``: the box crosses the antimeridian.
+    """
+    min_lat: float
+    max_lat: float
+    min_lon: float
+    max_lon: float
+    center: Optional[tuple] = None  # (lat, lon)
+    radius_m: Optional[float] = None
+
+    def contains(self, lat: float, lon: float) -> bool:
+        if self.center is not None:
+            return haversine_m(self.center[0], self.center[1], lat, lon) <= self.radius_m
+        if not self.min_lat <= lat <= self.max_lat:
+            return False
+        if self.min_lon > self.max_lon:
+            return lon >= self.min_lon or lon <= self.max_lon
+        return self.min_lon <= lon <= self.max_lon
+
+    def boxes(self) -> List[tuple]:
+        """(min_lat, max_lat, min_lon, max_lon) boxes covering the area, split at the antimeridian"""
+        if self.min_lon > self.max_lon:
+            return [
+                (self.min_lat, self.max_lat, self.min_lon, 180.0),
+                (self.min_lat, self.max_lat, -180.0, self.max_lon),
+            ]
+        return [(self.min_lat, self.max_lat, self.min_lon, self.max_lon)]
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in meters"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _coordinate(name: str, value: Any, limit: float) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise FilterError(f"Geo filter '{name}' must be a number")
+    try:
+        number = float(value)
+    except ValueError:
+        raise FilterError(f"Geo filter '{name}' must be a number") from None
+    if not -limit <= number <= limit:
+        raise FilterError(f"Geo filter '{name}' must be between -{limit:g} and {limit:g}")
+    return number
+
+
+def _fields(key: str, value: Any, names: tuple) -> Dict[str, Any]:
+    if not isinstance(value, dict):
+        raise FilterError(f"Filter '{key}' must be an object with {', '.join(names)}")
+    missing = [n for n in names if value.get(n) is None]
+    if missing:
+        raise FilterError(f"Filter '{key}' is missing {', '.join(missing)}")
+    return value
+
+
+def geo_area(filters: Optional[Dict[str, Any]]) -> Optional[GeoArea]:
+    """
+    Parse the ``near`` / ``bbox`` filters into one GeoArea (None if neither
+    is given). Raises FilterError for malformed values or if both are given.
+    """
+    if not filters:
+        return None
+    near, bbox = filters.get("near"), filters.get("bbox")
+    if near is not None and bbox is not None:
+        raise FilterError("Use either 'near' or 'bbox', not both")
+
+    if near is not None:
+        near = _fields("near", near, ("lat", "lon", "radius_m"))
+        lat = _coordinate("near.lat", near["lat"], 90)
+        lon = _coordinate("near.lon", near["lon"], 180)
+        radius = _coordinate("near.radius_m", near["radius_m"], math.pi * EARTH_RADIUS_M)
+        if radius <= 0:
+            raise FilterError("Geo filter 'near.radius_m' must be positive")
+        dlat = radius / METERS_PER_DEGREE_LAT
+        # Longitude degrees shrink towards the poles; clamp to the whole range there
+        cos_lat = math.cos(math.radians(lat))
+        dlon = 180.0 if cos_lat < 1e-6 else min(180.0, dlat / cos_lat)
+        min_lon, max_lon = lon - dlon, lon + dlon
+        if dlon >= 180.0:
+            min_lon, max_lon = -180.0, 180.0
+        elif min_lon < -180.0:
+            min_lon += 360.0  # Wraps past the antimeridian
+        elif max_lon > 180.0:
+            max_lon -= 360.0
+        return GeoArea(
+            max(-90.0, lat - dlat), min(90.0, lat + dlat), min_lon, max_lon,
+            center=(lat, lon), radius_m=radius,
+        )
+
+    if bbox is not None:
+        bbox = _fields("bbox", bbox, ("min_lat", "min_lon", "max_lat", "max_lon"))
+        area = GeoArea(
+            _coordinate("bbox.min_lat", bbox["min_lat"], 90),
+            _coordinate("bbox.max_lat", bbox["max_lat"], 90),
+            _coordinate("bbox.min_lon", bbox["min_lon"], 180),
+            _coordinate("bbox.max_lon", bbox["max_lon"], 180),
+        )
+        # min_lon > max_lon is a box crossing the antimeridian
+        if area.min_lat > area.max_lat:
+            raise FilterError("Geo filter 'bbox' min_lat must not exceed max_lat")
+        return area
+    return None
+
+
+class GeoIndex:
+    """R*Tree lookups for visits and photos inside a GeoArea"""
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    def init_schema(self, cursor: sqlite3.Cursor, table: str):
+        """Create the R*Tree and sync triggers for ``table`` (called from init_db)"""
+        rtree, lat, lon = GEO_TABLES[table]
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (rtree,)
+        ).fetchone()
+
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {rtree} USING rtree(
+                id, min_lat, max_lat, min_lon, max_lon
+            )
+        """)
+        insert = f"""
+            INSERT INTO {rtree}(id, min_lat, max_lat, min_lon, max_lon)
+            SELECT new.rowid, new.{lat}, new.{lat}, new.{lon}, new.{lon}
+            WHERE new.{lat} IS NOT NULL AND new.{lon} IS NOT NULL;
+        """
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {rtree}_insert AFTER INSERT ON {table} BEGIN
+                {insert}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {rtree}_delete AFTER DELETE ON {table} BEGIN
+                DELETE FROM {rtree} WHERE id = old.rowid;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {rtree}_update AFTER UPDATE OF {lat}, {lon} ON {table} BEGIN
+                DELETE FROM {rtree} WHERE id = old.rowid;
+                {insert}
+            END
+        """)
+        if not exists:
+            # Index rows stored before the R*Tree existed
+            cursor.execute(f"""
+                INSERT INTO {rtree}(id, min_lat, max_lat, min_lon, max_lon)
+                SELECT rowid, {lat}, {lat}, {lon}, {lon} FROM {table}
+                WHERE {lat} IS NOT NULL AND {lon} IS NOT NULL
+            """)
+            print(f"[Geo] Built {rtree} index over existing {table}")
+
+    def _within(self, table: str, area: GeoArea) -> List[str]:
+        rtree, lat, lon = GEO_TABLES[table]
+        rows = []
+        for box in area.boxes():
+            rows += self.db.fetchall(f"""
+                SELECT t.id, t.{lat}, t.{lon}
+                FROM {rtree} g
+                JOIN {table} t ON t.rowid = g.id
+                WHERE g.max_lat >= ? AND g.min_lat <= ?
+                  AND g.max_lon >= ? AND g.min_lon <= ?
+            """, box)
+        # The R*Tree stores 32-bit floats and the radius is a circle: check exactly
+        ids = [row_id for row_id, row_lat, row_lon in rows if area.contains(row_lat, row_lon)]
+        return list(dict.fromkeys(ids))  # A point on the antimeridian can fall in both boxes
+
+    def visits_within(self, area: GeoArea) -> List[str]:
+        """Ids of visits located inside ``area``"""
+        return self._within("visits", area)
+
+    def photos_within(self, area: GeoArea) -> List[str]:
+        """Ids of photos whose EXIF position is inside ``area``"""
+        return self._within("photos", area)
@@ -0,0 +1,78 @@
+"""
+Health Snapshot
+/health returns a snapshot kept fresh by a background thread, so a probe
+never waits on a model load, a collection count or a provider round trip.
+
+The monitor calls ``collect`` every ``HEALTH_REFRESH_S`` seconds (and when
+woken, e.g. after model warmup). ``collect`` must not load models: providers
+report their state with ``probe()`` (embeddings/providers.py). A failing
+``collect`` keeps the previous snapshot and reports the error.
+"""
+
+import os
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, Optional
+
+HEALTH_REFRESH_S = float(os.getenv("HEALTH_REFRESH_S", "15"))
+
+
+class HealthMonitor(threading.Thread):
+    """Background thread that rebuilds the health snapshot"""
+
+    def __init__(self, collect: Callable[[], Dict[str, Any]], interval: float = HEALTH_REFRESH_S):
+        super().__init__(name="health-monitor", daemon=True)
+        self.collect = collect
+        self.interval = max(0.1, interval)
+        self.refreshes = 0
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._refreshed_at: Optional[float] = None
+        self._refresh_ms = 0.0
+        self._error: Optional[str] = None
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+    def wake(self):
+        """Refresh now instead of at the next interval"""
+        self._wake.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.refresh()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def refresh(self):
+        start = time.perf_counter()
+        try:
+            snapshot = self.collect()
+            self._error = None
+        except Exception as e:
+            traceback.print_exc()
+            self._error = f"{type(e).__name__}: {e}"
+            snapshot = self._snapshot
+        self._refresh_ms = (time.perf_counter() - start) * 1000
+        self._snapshot = snapshot
+        self._refreshed_at = time.monotonic()
+        self.refreshes += 1
+
+    @property
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """Last collected snapshot (None before the first refresh)"""
+        return self._snapshot
+
+    def status(self) -> Dict[str, Any]:
+        """Age and cost of the snapshot; stale when older than three intervals"""
+        age = None if self._refreshed_at is None else time.monotonic() - self._refreshed_at
+        return {
+            "age_s": None if age is None else round(age, 2),
+            "stale": age is None or age > 3 * self.interval,
+            "refresh_ms": round(self._refresh_ms, 1),
+            "refresh_interval_s": self.interval,
+            "error": self._error,
+        }
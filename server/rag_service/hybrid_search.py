@@ -0,0 +1,104 @@
+"""
+Hybrid Search
+Reciprocal-rank fusion (RRF) of lexical (BM25) and vector result lists, and
+score fusion of text and image (CLIP) hits into one visit ranking.
+
+RRF scores each visit by ``sum(weight / (rrf_k + rank))`` over the lists it
+appears in. It uses only ranks, so BM25 scores and cosine similarities never
+have to be put on the same scale, and a visit found by both searches rises
+above one found by only one of them. Exact field ids and product names
+("Lote 14", "glyphosate") come from BM25, paraphrases from the embeddings.
+
+Multimodal search min-max normalizes each list's scores to [0, 1] first
+(CLIP text-image similarities sit around 0.2-0.35, text similarities much
+higher), then scores a visit by its weighted text score plus its best
+weighted photo score, so a visit matched by both its note and a photo wins.
+"""
+
+import os
+from typing import Any, Dict, List, Sequence, Tuple
+
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0"))
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "1.0"))
+MULTIMODAL_TEXT_WEIGHT = float(os.getenv("MULTIMODAL_TEXT_WEIGHT", "1.0"))
+MULTIMODAL_IMAGE_WEIGHT = float(os.getenv("MULTIMODAL_IMAGE_WEIGHT", "1.0"))
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: Sequence[Tuple[List[Dict[str, Any]], float]],
+    limit: int,
+    rrf_k: int = HYBRID_RRF_K,
+) -> List[Dict[str, Any]]:
+    """
+    Fuse result lists (each best-first, paired with its weight) into the top
+    ``limit`` results. Items are SearchResult dicts keyed by ``id``; the
+    first list that contains an id provides its snippet and metadata, and
+    ``score`` becomes the fused RRF score.
+    """
+    scores: Dict[str, float] = {}
+    items: Dict[str, Dict[str, Any]] = {}
+    for results, weight in ranked_lists:
+        if weight <= 0:
+            continue
+        for rank, item in enumerate(results, start=1):
+            scores[item["id"]] = scores.get(item["id"], 0.0) + weight / (rrf_k + rank)
+            items.setdefault(item["id"], item)
+
+    ranked = sorted(scores, key=lambda visit_id: scores[visit_id], reverse=True)[:limit]
+    return [{**items[visit_id], "score": scores[visit_id]} for visit_id in ranked]
+
+
+def normalize_scores(results: List[Dict[str, Any]]) -> List[float]:
+    """Min-max normalize ``score`` to [0, 1] (all 1.0 if the scores are equal)"""
+    if not results:
+        return []
+    scores = [item["score"] for item in results]
+    low, high = min(scores), max(scores)
+    if high - low <= 1e-12:
+        return [1.0] * len(scores)
+    return [(score - low) / (high - low) for score in scores]
+
+
+def fuse_visits_and_photos(
+    text_results: List[Dict[str, Any]],
+    photo_results: List[Dict[str, Any]],
+    limit: int,
+    text_weight: float = MULTIMODAL_TEXT_WEIGHT,
+    image_weight: float = MULTIMODAL_IMAGE_WEIGHT,
+) -> List[Dict[str, Any]]:
+    """
+    Group text hits (SearchResult dicts, ``id`` = visit id) and photo hits
+    (dicts with ``visit_id``) by visit into the top ``limit`` visits. Each
+    visit gets ``score``, ``text_score`` and ``image_score`` (normalized)
+    and its matching ``photos``, best first. Visits found only through a
+    photo have no snippet or metadata; the caller fills them in.
+    """
+    visits: Dict[str, Dict[str, Any]] = {}
+
+    def visit(visit_id: str) -> Dict[str, Any]:
+        if visit_id not in visits:
+            visits[visit_id] = {
+                "id": visit_id, "snippet": "", "metadata": {},
+                "text_score": None, "image_score": None, "photos": [],
+            }
+        return visits[visit_id]
+
+    for item, norm in zip(text_results, normalize_scores(text_results)):
+        entry = visit(item["id"])
+        entry.update(snippet=item["snippet"], metadata=item["metadata"], text_score=norm)
+
+    for photo, norm in zip(photo_results, normalize_scores(photo_results)):
+        entry = visit(photo["visit_id"])
+        entry["photos"].append({**photo, "score": norm})
+        # Photo hits arrive best first: the first one is the visit's image score
+        if entry["image_score"] is None:
+            entry["image_score"] = norm
+
+    for entry in visits.values():
+        entry["score"] = (
+            text_weight * (entry["text_score"] or 0.0)
+            + image_weight * (entry["image_score"] or 0.0)
+        )
+    ranked = sorted(visits.values(), key=lambda entry: entry["score"], reverse=True)
+    return ranked[:limit]
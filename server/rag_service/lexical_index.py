@@ -0,0 +1,135 @@
+"""
+Lexical Index
+SQLite FTS5 full-text index over visits, ranked with BM25.
+
+``visits_fts`` is an external-content FTS5 table over the ``visits`` rows
+(note, photo caption, audio transcript, issue, crop, field id), kept in sync
+by triggers, so it is always as fresh as SQLite itself. Lexical search needs
+no embedding model or network: it keeps /rag/search working when the
+embedding provider is unavailable, and finds exact field ids and product
+names that embeddings handle poorly.
+"""
+
+import json
+import re
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+from db import Database
+from search_filters import build_sql_where
+
+FTS_COLUMNS = ("note", "photo_caption", "audio_transcript", "issue", "crop", "field_id")
+
+# BM25 column weights, in FTS_COLUMNS order: short, specific fields count more
+BM25_WEIGHTS = (1.0, 1.0, 1.0, 2.0, 2.0, 3.0)
+
+# Words (letters/digits incl. accented), so user input can never be FTS5 syntax
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_query(text: str) -> Optional[str]:
+    """
+    Turn free text into an FTS5 query: every word as a quoted prefix term,
+    OR-ed together (BM25 ranks visits matching more words higher).
+    """
+    tokens = list(dict.fromkeys(t.lower() for t in _TOKEN_RE.findall(text)))
+    if not tokens:
+        return None
+    return " OR ".join(f'"{t}"*' for t in tokens)
+
+
+class LexicalIndex:
+    """FTS5/BM25 search over the visits table"""
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    def init_schema(self, cursor: sqlite3.Cursor):
+        """Create the FTS table and sync triggers (called from init_db)"""
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'visits_fts'"
+        ).fetchone()
+        columns = ", ".join(FTS_COLUMNS)
+        new_values = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+        old_values = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS visits_fts USING fts5(
+                {columns},
+                content='visits',
+                content_rowid='rowid',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS visits_fts_insert AFTER INSERT ON visits BEGIN
+                INSERT INTO visits_fts(rowid, {columns}) VALUES (new.rowid, {new_values});
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS visits_fts_delete AFTER DELETE ON visits BEGIN
+                INSERT INTO visits_fts(visits_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS visits_fts_update AFTER UPDATE ON visits BEGIN
+                INSERT INTO visits_fts(visits_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+                INSERT INTO visits_fts(rowid, {columns}) VALUES (new.rowid, {new_values});
+            END
+        """)
+        if not exists:
+            # Index visits stored before the FTS table existed
+            cursor.execute("INSERT INTO visits_fts(visits_fts) VALUES ('rebuild')")
+            print("[FTS] Built lexical index over existing visits")
+
+    def search(
+        self,
+        query: str,
+        k: int = 10,
+        filters: Optional[Dict[str, Any]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> List[Tuple[str, float, str, Dict[str, Any]]]:
+        """
+        Top-k visits for ``query`` as (id, score, snippet, metadata), best
+        first. ``score`` is the BM25 relevance (higher is better). ``ids``
+        restricts the search to those visits (e.g. geo candidates).
+        Raises search_filters.FilterError for invalid filters.
+        """
+        match = fts_query(query)
+        if match is None:
+            return []
+        where, params = build_sql_where(filters, table="v")
+        if ids is not None:
+            # One JSON parameter, however many ids
+            where = " AND ".join(filter(None, [where, "v.id IN (SELECT value FROM json_each(?))"]))
+            params.append(json.dumps(list(ids)))
+        weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+        rows = self.db.fetchall(f"""
+            SELECT v.id, v.created_at, v.task_type, v.field_id, v.crop, v.issue,
+                   v.note, v.severity,
+                   bm25(visits_fts, {weights}) AS rank,
+                   snippet(visits_fts, -1, '', '', '...', 32)
+            FROM visits_fts
+            JOIN visits v ON v.rowid = visits_fts.rowid
+            WHERE visits_fts MATCH ? {"AND " + where if where else ""}
+            ORDER BY rank
+            LIMIT ?
+        """, [match, *params, k])
+
+        results = []
+        for visit_id, created_at, task_type, field_id, crop, issue, note, severity, rank, snippet in rows:
+            # Same fields as the vector metadata (see main.visit_metadata)
+            metadata = {
+                "id": visit_id,
+                "created_at": int(created_at),
+                "task_type": task_type,
+                "field_id": field_id or "",
+                "crop": crop or "",
+                "issue": issue or "",
+                "note": note or "",
+            }
+            if severity is not None:
+                metadata["severity"] = int(severity)
+            # FTS5's bm25() is negative, more negative = more relevant
+            results.append((visit_id, -rank, snippet or "", metadata))
+        return results
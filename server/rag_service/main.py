@@ -6,59 +6,96 @@ FastAPI service for semantic search and record management
 import os
 import sqlite3
 import json
+import asyncio
+import time
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 from datetime import datetime
 
-# Load environment variables from .env file
-# Use absolute path to ensure .env is found regardless of working directory
+# .env next to this file; loaded by `python main.py` (below) or `uvicorn --env-file`
 ENV_PATH = Path(__file__).resolve().parent / ".env"
-try:
-    from dotenv import load_dotenv
-    if ENV_PATH.exists():
-        # Load with override=True to ensure .env values take precedence
-        load_dotenv(dotenv_path=ENV_PATH, override=True)
-        print(f"[INFO] Loaded .env from: {ENV_PATH}")
-    else:
-        load_dotenv(override=True)  # Try current directory as fallback
-except ImportError:
-    # python-dotenv not installed, try reading .env manually
-    if ENV_PATH.exists():
-        with open(ENV_PATH, 'r', encoding='utf-8-sig') as f:  # utf-8-sig strips BOM
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    # Strip BOM from key if present
-                    key = key.strip().lstrip('\ufeff')
-                    os.environ[key] = value.strip().strip('"').strip("'")
-        print(f"[INFO] Loaded .env manually from: {ENV_PATH}")
-except Exception as e:
-    print(f"[WARNING] Failed to load .env file: {e}")
-    print(f"[INFO] .env path attempted: {ENV_PATH}")
-    print("[INFO] Using system environment variables only")
-
-# Sanity check: log whether OPENAI_API_KEY was loaded (never print full key)
-_openai_key_loaded = bool(os.getenv("OPENAI_API_KEY"))
-print(f"[INFO] OPENAI_API_KEY loaded: {'set' if _openai_key_loaded else 'not set'}")
-
-import chromadb
-from chromadb.config import Settings
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+
+if __name__ == "__main__":
+    # `python main.py`: load .env before any module reads its settings, then
+    # let uvicorn import this file as "main" (nothing below runs here)
+    import uvicorn
+    from env_file import load_env
+    load_env(ENV_PATH)
+    uvicorn.run("main:app", host="0.0.0.0", port=8000)
+    raise SystemExit(0)
+
+_IMPORT_START = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 
+from embedding_queue import EmbeddingJob, EmbeddingQueue, EmbeddingWorker
+import executors
+from db import Database
+from executors import run_embed, run_io
+from embeddings.cache import EmbeddingCache
+from embeddings.providers import (
+    EmbeddingProvider,
+    create_clip_providers,
+    create_provider,
+    image_collection_name,
+    resolve_clip_provider,
+    resolve_text_provider,
+)
+from model_registry import ModelRegistry, ModelSlot, TextIndex
+from search_cache import CollectionVersion, TTLCache
+from hybrid_search import (
+    HYBRID_LEXICAL_WEIGHT,
+    HYBRID_VECTOR_WEIGHT,
+    MULTIMODAL_IMAGE_WEIGHT,
+    MULTIMODAL_TEXT_WEIGHT,
+    fuse_visits_and_photos,
+    reciprocal_rank_fusion,
+)
+from lexical_index import LexicalIndex
+from geo_index import GeoIndex, geo_area
+from vector_store import VECTOR_BACKEND, create_vector_client, hnsw_config, open_collection
+from search_filters import (
+    FILTER_FIELDS,
+    GEO_FILTERS,
+    PHOTO_VISIT_PREFIX,
+    FilterError,
+    build_where,
+    limit_ids,
+)
+from metrics import COLLECTION_VECTORS, MODEL_LOADED, QUEUE_DEPTH, REGISTRY, observe_request, stage
+import tracing
+from startup import ServiceStartup
+from health import HealthMonitor
+
 # Configuration
 DATA_DIR = Path(os.getenv("DATA_DIR", "./data"))
 MEDIA_DIR = DATA_DIR / "media"
 DB_PATH = DATA_DIR / "visits.db"
 CHROMA_DIR = DATA_DIR / "chroma"
+VECTOR_DIR = DATA_DIR / "vectors"  # VECTOR_BACKEND=numpy
+
+# Background embedding queue
+EMBED_QUEUE_WORKERS = int(os.getenv("EMBED_QUEUE_WORKERS", "1"))
+EMBED_QUEUE_BATCH_SIZE = int(os.getenv("EMBED_QUEUE_BATCH_SIZE", "64"))
+EMBED_QUEUE_MAX_ATTEMPTS = int(os.getenv("EMBED_QUEUE_MAX_ATTEMPTS", "8"))
+
+# In-memory search caches
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "512"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))
 
-# Create directories
-DATA_DIR.mkdir(exist_ok=True)
-MEDIA_DIR.mkdir(exist_ok=True, parents=True)
-CHROMA_DIR.mkdir(exist_ok=True, parents=True)
+# Answer vector searches with BM25 when no query embedding can be computed
+LEXICAL_FALLBACK = os.getenv("LEXICAL_FALLBACK", "1") != "0"
+
+# Also load CLIP at startup (otherwise on the first image request)
+WARMUP_CLIP = os.getenv("WARMUP_CLIP", "0") == "1"
+
+# Startup phases and readiness (/livez, /readyz); see startup.py
+service_startup = ServiceStartup(started=_IMPORT_START)
 
 # Initialize FastAPI
 app = FastAPI(title="Farm Visit RAG Service")
@@ -72,111 +109,178 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize ChromaDB
-chroma_client = chromadb.PersistentClient(
-    path=str(CHROMA_DIR),
-    settings=Settings(anonymized_telemetry=False)
-)
+# Paths that answer while the service is still initializing
+STARTUP_PATHS = {"/livez", "/readyz", "/health", "/metrics", "/docs", "/openapi.json"}
 
-# Get or create collections - dual collection architecture for multimodal
-# Text collection (backward compatible with existing 'farm_visits')
-text_collection = chroma_client.get_or_create_collection(
-    name="farm_visits",
-    metadata={"hnsw:space": "cosine", "embedding_type": "text"}
-)
+@app.middleware("http")
+async def require_initialized(request: Request, call_next):
+    """503 until the background startup has opened the stores (startup.py)"""
+    if not service_startup.initialized.is_set() and request.url.path not in STARTUP_PATHS:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Service is starting", "startup": service_startup.report()},
+            headers={"Retry-After": "1"}
+        )
+    return await call_next(request)
 
-# Image collection for CLIP embeddings (512 dimensions)
-image_collection = chroma_client.get_or_create_collection(
-    name="farm_visits_images",
-    metadata={"hnsw:space": "cosine", "embedding_type": "clip", "dimensions": 512}
-)
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """
+    Count and time every request by route template (see /metrics), trace its
+    stages into a Server-Timing header and, with ?profile and a valid
+    X-Admin-Token, return a sampling profile instead of the body (tracing.py).
+    """
+    profile = "profile" in request.query_params
+    if profile and not tracing.admin_authorized(request.headers.get("X-Admin-Token")):
+        return JSONResponse(status_code=403, content={"detail": "Profiling requires a valid X-Admin-Token"})
+    
+    start = time.perf_counter()
+    trace, token = tracing.start(profile=profile)
+    if trace.profiler is not None:
+        trace.profiler.start()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        tracing.finish(token)
+        if trace.profiler is not None:
+            # Joins the sampler thread: off the event loop (after finish, so
+            # the joining pool thread is not profiled itself)
+            await run_io(trace.profiler.stop)
+        elapsed = time.perf_counter() - start
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        observe_request(request.method, route_path, status, elapsed)
+        tracing.log_request(request.method, route_path, request.url.path, status, elapsed, trace)
+    
+    if trace.profiler is not None:
+        response = PlainTextResponse(trace.profiler.folded(), headers={
+            "X-Profiled-Status": str(status),
+            "X-Profile-Samples": str(trace.profiler.samples),
+            "X-Profile-Interval-Ms": str(tracing.PROFILE_INTERVAL_MS),
+        })
+    response.headers["Server-Timing"] = trace.server_timing(elapsed)
+    return response
+
+
+# Image encoders: "clip" (CLIP ViT-B/32) or "hash" (feature hashing, no model; tests/benchmarks)
+CLIP_PROVIDER = resolve_clip_provider(os.getenv("CLIP_PROVIDER", "clip"))
+
+# Dual collection architecture for multimodal:
+# text collections are per embedding model (see model_registry.py / text_index below)
+# Image collection for CLIP embeddings (512 dimensions); hash vectors never mix with CLIP ones
+IMAGE_COLLECTION = image_collection_name(CLIP_PROVIDER)
+
+# Vector store: ChromaDB (HNSW) or in-process NumPy exact search (see vector_store.py).
+# Opened by initialize() at startup, like the collections and text_index below.
+vector_client = None
+image_collection = None
+
+# Bumped after every write to the text collection; part of the result cache key
+text_collection_version = CollectionVersion()
+query_embedding_cache = TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+search_result_cache = TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
 
-# Alias for backward compatibility
-collection = text_collection
+
+# Shared SQLite connection layer (per-thread connections, WAL)
+db = Database(DB_PATH)
+
+embedding_queue = EmbeddingQueue(db, max_attempts=EMBED_QUEUE_MAX_ATTEMPTS)
+_embedding_workers: List[EmbeddingWorker] = []
+embedding_cache = EmbeddingCache(db)
+model_registry = ModelRegistry(db)
+lexical_index = LexicalIndex(db)
+geo_index = GeoIndex(db)
 
 
 # Initialize SQLite
 def init_db():
     """Initialize SQLite database with visits and photos tables"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Visits table (existing)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS visits (
-            id TEXT PRIMARY KEY,
-            created_at INTEGER NOT NULL,
-            updated_at INTEGER NOT NULL,
-            task_type TEXT NOT NULL,
-            lat REAL,
-            lon REAL,
-            acc INTEGER,
-            note TEXT,
-            photo_present INTEGER DEFAULT 0,
-            audio_present INTEGER DEFAULT 0,
-            photo_caption TEXT,
-            audio_transcript TEXT,
-            audio_summary TEXT,
-            ai_status TEXT,
-            sync_status TEXT DEFAULT 'pending',
-            synced_at INTEGER,
-            field_id TEXT,
-            crop TEXT,
-            issue TEXT,
-            severity INTEGER,
-            data TEXT,
-            created_at_db TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_created_at ON visits(created_at)
-    """)
-    
-    cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_sync_status ON visits(sync_status)
-    """)
-    
-    # Photos table (new - multimodal support)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS photos (
-            id TEXT PRIMARY KEY,
-            visit_id TEXT NOT NULL,
-            filename TEXT NOT NULL,
-            file_path TEXT NOT NULL,
-            file_size INTEGER,
-            mime_type TEXT,
-            width INTEGER,
-            height INTEGER,
+    with db.transaction() as cursor:
+        # Visits table (existing)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS visits (
+                id TEXT PRIMARY KEY,
+                created_at INTEGER NOT NULL,
+                updated_at INTEGER NOT NULL,
+                task_type TEXT NOT NULL,
+                lat REAL,
+                lon REAL,
+                acc INTEGER,
+                note TEXT,
+                photo_present INTEGER DEFAULT 0,
+                audio_present INTEGER DEFAULT 0,
+                photo_caption TEXT,
+                audio_transcript TEXT,
+                audio_summary TEXT,
+                ai_status TEXT,
+                sync_status TEXT DEFAULT 'pending',
+                synced_at INTEGER,
+                field_id TEXT,
+                crop TEXT,
+                issue TEXT,
+                severity INTEGER,
+                data TEXT,
+                created_at_db TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_created_at ON visits(created_at)
+        """)
+    
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sync_status ON visits(sync_status)
+        """)
+    
+        # FTS5 full-text index and R*Tree location index over visits, synced by triggers
+        lexical_index.init_schema(cursor)
+        geo_index.init_schema(cursor, "visits")
+    
+        # Photos table (new - multimodal support)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS photos (
+                id TEXT PRIMARY KEY,
+                visit_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                file_size INTEGER,
+                mime_type TEXT,
+                width INTEGER,
+                height INTEGER,
             
-            -- Embedding metadata
-            embedding_id TEXT,
-            embedding_model TEXT,
-            embedding_dims INTEGER,
-            embedding_generated_at INTEGER,
+                -- Embedding metadata
+                embedding_id TEXT,
+                embedding_model TEXT,
+                embedding_dims INTEGER,
+                embedding_generated_at INTEGER,
             
-            -- GPS from EXIF (if available)
-            exif_lat REAL,
-            exif_lon REAL,
-            exif_timestamp INTEGER,
+                -- GPS from EXIF (if available)
+                exif_lat REAL,
+                exif_lon REAL,
+                exif_timestamp INTEGER,
             
-            created_at INTEGER NOT NULL,
-            FOREIGN KEY (visit_id) REFERENCES visits(id)
-        )
-    """)
+                created_at INTEGER NOT NULL,
+                FOREIGN KEY (visit_id) REFERENCES visits(id)
+            )
+        """)
     
-    cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_photos_visit_id ON photos(visit_id)
-    """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_photos_visit_id ON photos(visit_id)
+        """)
     
-    cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_photos_embedding_id ON photos(embedding_id)
-    """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_photos_embedding_id ON photos(embedding_id)
+        """)
     
-    conn.commit()
-    conn.close()
-
-init_db()
+        # R*Tree over photo EXIF GPS positions
+        geo_index.init_schema(cursor, "photos")
+    
+        # Embedding job queue and content-hash embedding cache
+        embedding_queue.init_schema(cursor)
+        embedding_cache.init_schema(cursor)
+        model_registry.init_schema(cursor)
 
 # Pydantic models
 class VisitUpsert(BaseModel):
@@ -199,10 +303,19 @@ class VisitUpsert(BaseModel):
     issue: Optional[str] = None
     severity: Optional[int] = None
 
+class VisitBatchUpsert(BaseModel):
+    visits: List[VisitUpsert]
+
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+
 class SearchRequest(BaseModel):
     query: str
     k: int = 10
     filters: Optional[Dict[str, Any]] = None
+    mode: str = "vector"  # "vector" | "lexical" | "hybrid"
+    # Hybrid mode: relative weight of each ranking in the fusion
+    vector_weight: float = HYBRID_VECTOR_WEIGHT
+    lexical_weight: float = HYBRID_LEXICAL_WEIGHT
 
 class SearchResult(BaseModel):
     id: str
@@ -214,110 +327,59 @@ class SearchResult(BaseModel):
 EMBEDDING_PROVIDER_CONFIG = os.getenv("EMBEDDING_PROVIDER", "auto").lower()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL") or None  # None: the provider's default model
+# When the configured model differs from the active one:
+# "online" migrates in the background, "switch" cuts search over at once
+EMBEDDING_MIGRATION_MODE = os.getenv("EMBEDDING_MIGRATION_MODE", "online").lower()
+
 # Determine actual provider (auto mode: prefer openai if key exists, else local)
-if EMBEDDING_PROVIDER_CONFIG == "auto":
-    if OPENAI_API_KEY:
-        EMBEDDING_PROVIDER = "openai"
-    else:
-        EMBEDDING_PROVIDER = "local"
-elif EMBEDDING_PROVIDER_CONFIG in ["openai", "local"]:
-    EMBEDDING_PROVIDER = EMBEDDING_PROVIDER_CONFIG
-else:
-    EMBEDDING_PROVIDER = "local"  # Default fallback
-
-# Initialize local embedding model (lazy load)
-_local_embedder = None
-
-def _get_local_embedder():
-    """Lazy load sentence-transformers model"""
-    global _local_embedder
-    if _local_embedder is None:
-        try:
-            from sentence_transformers import SentenceTransformer
-            _local_embedder = SentenceTransformer('all-MiniLM-L6-v2')
-            print("[INFO] Loaded local embedding model: all-MiniLM-L6-v2")
-        except ImportError:
-            print("[WARNING] sentence-transformers not installed. Install with: pip install sentence-transformers")
-            return None
-        except Exception as e:
-            print(f"[WARNING] Failed to load local embedding model: {e}")
-            return None
-    return _local_embedder
+EMBEDDING_PROVIDER = resolve_text_provider(EMBEDDING_PROVIDER_CONFIG, OPENAI_API_KEY)
 
-# Startup diagnostics
-def _redact_key(key):
-    """Redact API key for display (never print full key)"""
-    if not key:
-        return "not set"
-    if len(key) <= 8:
-        return "***"
-    return f"{key[:4]}...{key[-4:]}"
+# Every embedding goes through a provider (models load lazily on first use)
+_text_providers: Dict[tuple, EmbeddingProvider] = {}
 
-print("=" * 60)
-print("[INFO] RAG Service Startup Diagnostics")
-print("=" * 60)
-print(f"[INFO] Embedding provider config: {EMBEDDING_PROVIDER_CONFIG}")
-print(f"[INFO] Embedding provider active: {EMBEDDING_PROVIDER}")
-print(f"[INFO] OPENAI_API_KEY loaded: {_redact_key(OPENAI_API_KEY)}")
-print(f"[INFO] DATA_DIR: {DATA_DIR.resolve()}")
-print(f"[INFO] DB_PATH: {DB_PATH.resolve()}")
-print(f"[INFO] CHROMA_DIR: {CHROMA_DIR.resolve()}")
-if EMBEDDING_PROVIDER == "openai" and not OPENAI_API_KEY:
-    print("[WARNING] OPENAI_API_KEY not set but provider is 'openai' - will fail!")
-elif EMBEDDING_PROVIDER == "local":
-    # Test local embedder
-    embedder = _get_local_embedder()
-    if embedder:
-        print("[INFO] Local embedding model ready")
-    else:
-        print("[WARNING] Local embedding model not available - embeddings will fail!")
-print("=" * 60)
+def make_text_provider(name: str, model: Optional[str] = None) -> EmbeddingProvider:
+    """Cached text provider for (provider, model); one instance per model so it loads once"""
+    provider = create_provider(name, model, OPENAI_API_KEY, cache=embedding_cache)
+    return _text_providers.setdefault((provider.name, provider.model_id), provider)
 
-def get_embedding(text: str) -> Optional[List[float]]:
-    """Get embedding for text using configured provider"""
+clip_text_provider, clip_image_provider = create_clip_providers(CLIP_PROVIDER)
+
+def get_embedding(text: str, provider: Optional[EmbeddingProvider] = None) -> Optional[List[float]]:
+    """Get embedding for text using the active (or given) provider"""
     if not text or not text.strip():
         return None
+    return get_embeddings([text], provider)[0]
+
+def get_embeddings(texts: List[str], provider: Optional[EmbeddingProvider] = None) -> List[Optional[List[float]]]:
+    """Get embeddings for several texts with one provider call.
+
+    Vectors already in the embedding cache are reused; only cache misses are
+    sent to the provider. Returns a list aligned with ``texts``; empty texts
+    map to None.
+    """
+    provider = provider or text_index.active.provider
+    results: List[Optional[List[float]]] = [None] * len(texts)
+    indexed = [(i, t) for i, t in enumerate(texts) if t and t.strip()]
+    if not indexed:
+        return results
     
-    # Try OpenAI if configured
-    if EMBEDDING_PROVIDER == "openai":
-        if not OPENAI_API_KEY:
-            print("[ERROR] OpenAI provider selected but API key not set")
-            return None
-        try:
-            import openai
-            client = openai.OpenAI(api_key=OPENAI_API_KEY)
-            response = client.embeddings.create(
-                model="text-embedding-3-small",
-                input=text
-            )
-            return response.data[0].embedding
-        except Exception as e:
-            print(f"[ERROR] OpenAI embedding error: {e}")
-            # Fallback to local if OpenAI fails
-            if EMBEDDING_PROVIDER_CONFIG == "auto":
-                print("[INFO] Falling back to local embedding model")
-                return _get_local_embedding(text)
-            return None
-    
-    # Use local sentence-transformers
-    elif EMBEDDING_PROVIDER == "local":
-        return _get_local_embedding(text)
-    
-    else:
-        print(f"[ERROR] Unknown embedding provider: {EMBEDDING_PROVIDER}")
-        return None
+    embeddings = provider.embed_batch([t for _, t in indexed])
+    if embeddings:
+        for (i, _), embedding in zip(indexed, embeddings):
+            results[i] = embedding
+    return results
 
-def _get_local_embedding(text: str) -> Optional[List[float]]:
-    """Get embedding using local sentence-transformers model"""
-    embedder = _get_local_embedder()
-    if embedder is None:
-        return None
-    try:
-        embedding = embedder.encode(text, normalize_embeddings=True)
-        return embedding.tolist()
-    except Exception as e:
-        print(f"[ERROR] Local embedding error: {e}")
-        return None
+def get_query_embedding(query: str, provider: Optional[EmbeddingProvider] = None) -> Optional[List[float]]:
+    """Embed a search query, memoized in the in-memory LRU cache"""
+    provider = provider or text_index.active.provider
+    key = (provider.model_id, query)
+    embedding = query_embedding_cache.get(key)
+    if embedding is None:
+        embedding = get_embedding(query, provider)
+        if embedding:
+            query_embedding_cache.set(key, embedding)
+    return embedding
 
 def generate_embedding_text(visit: Dict[str, Any]) -> str:
     """Generate text for embedding from visit record"""
@@ -340,118 +402,514 @@ def generate_embedding_text(visit: Dict[str, Any]) -> str:
     
     return ". ".join(parts)
 
+# ON CONFLICT ... DO UPDATE (not INSERT OR REPLACE) keeps the rowid and
+# fires the UPDATE trigger that keeps visits_fts in sync
+VISIT_UPSERT_SQL = """
+    INSERT INTO visits (
+        id, created_at, updated_at, task_type, lat, lon, acc,
+        note, photo_present, audio_present, photo_caption,
+        audio_transcript, audio_summary, ai_status, sync_status,
+        field_id, crop, issue, severity, data
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        created_at = excluded.created_at,
+        updated_at = excluded.updated_at,
+        task_type = excluded.task_type,
+        lat = excluded.lat,
+        lon = excluded.lon,
+        acc = excluded.acc,
+        note = excluded.note,
+        photo_present = excluded.photo_present,
+        audio_present = excluded.audio_present,
+        photo_caption = excluded.photo_caption,
+        audio_transcript = excluded.audio_transcript,
+        audio_summary = excluded.audio_summary,
+        ai_status = excluded.ai_status,
+        sync_status = excluded.sync_status,
+        field_id = excluded.field_id,
+        crop = excluded.crop,
+        issue = excluded.issue,
+        severity = excluded.severity,
+        data = excluded.data
+"""
+
+def visit_row(visit: VisitUpsert) -> tuple:
+    """Build the parameter tuple for VISIT_UPSERT_SQL"""
+    return (
+        visit.id, visit.createdAt, visit.updatedAt, visit.task_type,
+        visit.lat, visit.lon, visit.acc, visit.note,
+        1 if visit.photo_present else 0,
+        1 if visit.audio_present else 0,
+        visit.photo_caption, visit.audio_transcript, visit.audio_summary,
+        json.dumps(visit.aiStatus) if visit.aiStatus else None,
+        "synced",
+        visit.field_id, visit.crop, visit.issue, visit.severity,
+        json.dumps(visit.model_dump())  # Store full record as JSON
+    )
+
+def visit_metadata(visit: VisitUpsert) -> Dict[str, Any]:
+    """Build ChromaDB metadata for a visit (filterable fields, see search_filters.py)"""
+    metadata = {
+        "id": visit.id,
+        "created_at": int(visit.createdAt),  # Store as int (epoch ms) for range filters
+        "task_type": visit.task_type,
+        "field_id": visit.field_id or "",
+        "crop": visit.crop or "",
+        "issue": visit.issue or "",
+        "note": visit.note or "",
+    }
+    if visit.severity is not None:
+        metadata["severity"] = int(visit.severity)  # ChromaDB metadata cannot be None
+    return metadata
+
+def photo_visit_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """A visit's filterable fields, as stored on its photos (search_filters.PHOTO_VISIT_PREFIX)"""
+    return {PHOTO_VISIT_PREFIX + field: metadata[field] for field in FILTER_FIELDS if field in metadata}
+
+def refresh_photo_visit_metadata(collection, visits: Dict[str, Dict[str, Any]]) -> int:
+    """
+    Copy the filterable fields of ``visits`` (id -> visit metadata) onto their
+    stored photo vectors, so image search can filter on them. Returns the
+    number of photos rewritten.
+    """
+    rows = db.fetchall("""
+        SELECT embedding_id FROM photos
+        WHERE embedding_id IS NOT NULL AND visit_id IN (SELECT value FROM json_each(?))
+    """, (json.dumps(list(visits)),))
+    if not rows:
+        return 0
+    stored = collection.get(ids=[row[0] for row in rows], include=["embeddings", "documents", "metadatas"])
+    changed = []
+    for i, metadata in enumerate(stored["metadatas"]):
+        visit = visits.get(metadata.get("visit_id"))
+        if visit is None:
+            continue
+        updated = {k: v for k, v in metadata.items() if not k.startswith(PHOTO_VISIT_PREFIX)}
+        updated.update(photo_visit_metadata(visit))
+        if updated != metadata:
+            changed.append((i, updated))
+    if changed:
+        collection.upsert(
+            ids=[stored["ids"][i] for i, _ in changed],
+            embeddings=[stored["embeddings"][i] for i, _ in changed],
+            documents=[stored["documents"][i] for i, _ in changed],
+            metadatas=[metadata for _, metadata in changed]
+        )
+    return len(changed)
+
+def load_visit_documents(after_id: Optional[str], limit: int) -> List[tuple]:
+    """Visits after ``after_id`` in id order, as (id, updated_at, text, metadata)"""
+    rows = db.fetchall(
+        "SELECT id, updated_at, data FROM visits WHERE id > ? ORDER BY id LIMIT ?",
+        (after_id or "", limit)
+    )
+    documents = []
+    for visit_id, updated_at, data in rows:
+        try:
+            visit = VisitUpsert(**json.loads(data))
+        except Exception:
+            documents.append((visit_id, updated_at, "", {}))  # Skipped, like the queue does
+            continue
+        documents.append((visit_id, updated_at, generate_embedding_text(visit.model_dump()), visit_metadata(visit)))
+    return documents
+
+def visit_versions(ids: List[str]) -> Dict[str, int]:
+    """Current updated_at for each visit id"""
+    placeholders = ",".join("?" for _ in ids)
+    return dict(db.fetchall(f"SELECT id, updated_at FROM visits WHERE id IN ({placeholders})", ids))
+
+def _on_model_switch(slot: ModelSlot):
+    """Search moved to another collection: cached results are stale"""
+    text_collection_version.bump()
+    search_result_cache.clear()
+
+# Active text collection (per embedding model) plus an optional migration target;
+# created by initialize()
+text_index: Optional[TextIndex] = None
+
+# Startup diagnostics
+def _redact_key(key):
+    """Redact API key for display (never print full key)"""
+    if not key:
+        return "not set"
+    if len(key) <= 8:
+        return "***"
+    return f"{key[:4]}...{key[-4:]}"
+
+def print_diagnostics():
+    print("=" * 60)
+    print("[INFO] RAG Service Startup Diagnostics")
+    print("=" * 60)
+    print(f"[INFO] Embedding provider config: {EMBEDDING_PROVIDER_CONFIG}")
+    print(f"[INFO] Embedding provider active: {text_index.active.provider.name} ({text_index.active.provider.model_id})")
+    print(f"[INFO] Image embedding provider: {CLIP_PROVIDER} ({clip_image_provider.model_id})")
+    print(f"[INFO] Text collection: {text_index.active.name}")
+    if text_index.target is not None:
+        print(f"[INFO] Migrating to: {text_index.target.name}")
+    print(f"[INFO] OPENAI_API_KEY loaded: {_redact_key(OPENAI_API_KEY)}")
+    print(f"[INFO] DATA_DIR: {DATA_DIR.resolve()}")
+    print(f"[INFO] DB_PATH: {DB_PATH.resolve()}")
+    print(f"[INFO] CHROMA_DIR: {CHROMA_DIR.resolve()}")
+    if EMBEDDING_PROVIDER == "openai" and not OPENAI_API_KEY:
+        print("[WARNING] OPENAI_API_KEY not set but provider is 'openai' - will fail!")
+    print("=" * 60)
+
+def process_embedding_jobs(jobs: List[EmbeddingJob]) -> Dict[EmbeddingJob, str]:
+    """
+    Queue handler: embed a batch of visits with one provider call and one
+    ChromaDB upsert per write collection. Returns the jobs that failed with
+    their error.
+    """
+    placeholders = ",".join("?" for _ in jobs)
+    rows = dict(db.fetchall(
+        f"SELECT id, data FROM visits WHERE id IN ({placeholders})",
+        [job.visit_id for job in jobs]
+    ))
+    
+    failures: Dict[EmbeddingJob, str] = {}
+    to_embed = []
+    stored_visits: Dict[str, Dict[str, Any]] = {}
+    for job in jobs:
+        data = rows.get(job.visit_id)
+        if data is None:
+            continue  # Visit deleted since it was queued
+        try:
+            visit = VisitUpsert(**json.loads(data))
+        except Exception as e:
+            failures[job] = f"Invalid stored record: {e}"
+            continue
+        stored_visits[visit.id] = visit_metadata(visit)
+        embedding_text = generate_embedding_text(visit.model_dump())
+        if embedding_text:
+            to_embed.append((job, visit, embedding_text))
+    
+    # Photos carry the visit's filterable fields; keep them in step with the visit
+    if stored_visits:
+        refresh_photo_visit_metadata(image_collection, stored_visits)
+    
+    if not to_embed:
+        return failures
+    
+    # Embedded with the active model and, during a migration, the new one too
+    errors = text_index.upsert(
+        [visit.id for _, visit, _ in to_embed],
+        [text for _, _, text in to_embed],
+        [visit_metadata(visit) for _, visit, _ in to_embed]
+    )
+    for i, error in errors.items():
+        failures[to_embed[i][0]] = error
+    
+    embedded = len(to_embed) - len(errors)
+    if embedded:
+        text_collection_version.bump()
+        print(f"[EmbedQueue] Embedded {embedded} visit(s)")
+    return failures
+
+def start_embedding_workers():
+    """Start background workers that drain the embedding queue (and any model backfill)"""
+    text_index.start()
+    for i in range(EMBED_QUEUE_WORKERS):
+        worker = EmbeddingWorker(
+            embedding_queue,
+            process_embedding_jobs,
+            batch_size=EMBED_QUEUE_BATCH_SIZE,
+            name=f"embedding-worker-{i}"
+        )
+        worker.start()
+        _embedding_workers.append(worker)
+    print(f"[EmbedQueue] Started {EMBED_QUEUE_WORKERS} worker(s)")
+
+def open_image_collection(client):
+    """The CLIP photo collection (created on first use)"""
+    return open_collection(
+        client,
+        IMAGE_COLLECTION,
+        metadata={"hnsw:space": "cosine", "embedding_type": CLIP_PROVIDER, "dimensions": 512},
+        hnsw=hnsw_config("image")
+    )
+
+def initialize():
+    """Open the stores and start the workers (startup thread; requests wait for it)"""
+    global vector_client, image_collection, text_index
+    with service_startup.phase("directories"):
+        DATA_DIR.mkdir(exist_ok=True)
+        MEDIA_DIR.mkdir(exist_ok=True, parents=True)
+        CHROMA_DIR.mkdir(exist_ok=True, parents=True)
+    
+    with service_startup.phase("vector_store"):
+        vector_client = create_vector_client(VECTOR_BACKEND, CHROMA_DIR, VECTOR_DIR)
+        image_collection = open_image_collection(vector_client)
+    
+    with service_startup.phase("sqlite_schema"):
+        init_db()
+    
+    with service_startup.phase("text_index"):
+        index = TextIndex(
+            model_registry,
+            vector_client,
+            make_text_provider,
+            load_documents=load_visit_documents,
+            current_versions=visit_versions,
+            on_switch=_on_model_switch,
+        )
+        index.load(EMBEDDING_PROVIDER, EMBEDDING_MODEL, mode=EMBEDDING_MIGRATION_MODE)
+        text_index = index
+    
+    print_diagnostics()
+    with service_startup.phase("workers"):
+        start_embedding_workers()
+        health_monitor.start()
+
+def warmup_models():
+    """Load the search model before reporting ready (and CLIP with WARMUP_CLIP=1)"""
+    provider = text_index.active.provider
+    with service_startup.phase("text_model"):
+        if provider.warmup():
+            print(f"[INFO] Text embedding model ready: {provider.name} ({provider.model_id})")
+        else:
+            print(f"[WARNING] Text embedding model not available ({provider.name}) - embeddings will fail!")
+    if WARMUP_CLIP:
+        with service_startup.phase("clip_model"):
+            if not clip_image_provider.warmup():
+                print("[WARNING] CLIP model not available - image embeddings will fail!")
+    health_monitor.wake()  # Report the loaded models now
+
+@app.on_event("startup")
+def start_service():
+    """Initialize and warm up in the background: the server accepts connections at once"""
+    service_startup.start(initialize, warmup_models)
+
+@app.on_event("shutdown")
+def stop_embedding_workers():
+    for worker in _embedding_workers:
+        worker.stop()
+    for worker in _embedding_workers:
+        worker.join(timeout=5)
+    _embedding_workers.clear()
+    health_monitor.stop()
+    if text_index is not None:
+        text_index.stop()
+    executors.shutdown()
+    db.close_all()
+
+# Embedding calls wait on the embedding pool (executors.py): OpenAI calls are
+# network-bound with rate-limit and backoff sleeps, and local inference runs on
+# the micro-batcher thread, so the calling thread only waits (and many waiting
+# requests can share one batch). SQLite and ChromaDB never queue behind them.
+async def embed_query(query: str, provider: Optional[EmbeddingProvider] = None) -> Optional[List[float]]:
+    """Await a (memoized) query embedding off the event loop"""
+    return await run_embed(get_query_embedding, query, provider)
+
 # API Endpoints
 
-@app.get("/health")
-async def health():
-    """Health check with embedding provider status (text + CLIP)"""
-    # Text embedding status
-    text_embedder_available = False
-    if EMBEDDING_PROVIDER == "openai":
-        text_embedder_available = bool(OPENAI_API_KEY)
-    elif EMBEDDING_PROVIDER == "local":
-        text_embedder_available = _get_local_embedder() is not None
-    
-    # CLIP embedding status
-    clip_status = {"available": False, "device": None, "model": None}
-    try:
-        from embeddings.clip_embedder import check_clip_availability
-        clip_status = check_clip_availability()
-    except ImportError:
-        clip_status["error"] = "CLIP module not installed"
-    except Exception as e:
-        clip_status["error"] = str(e)
+@app.get("/livez")
+async def livez():
+    """Liveness: the process serves HTTP (503 only if startup failed)"""
+    if service_startup.state == service_startup.FAILED:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": service_startup.error})
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: stores open and models warm; the startup timing breakdown"""
+    report = service_startup.report()
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
+
+def collect_health() -> Dict[str, Any]:
+    """Health snapshot (health monitor thread): never loads a model"""
+    active = text_index.active
+    text_probe = active.provider.probe()
+    clip_probe = clip_image_provider.probe()
     
-    # Collection stats
-    text_count = text_collection.count()
-    image_count = image_collection.count()
+    # Collection sizes, also used for the rag_collection_vectors gauge
+    slots = [slot for slot in (active, text_index.target) if slot is not None]
+    collections = {c.name: c.count() for c in [slot.collection for slot in slots] + [image_collection]}
+    index_status = text_index.status()
     
     return {
-        "status": "ok",
-        "timestamp": datetime.now().isoformat(),
+        "status": "ok" if text_probe["available"] is not False else "degraded",
         "text_embedding": {
             "provider_config": EMBEDDING_PROVIDER_CONFIG,
-            "provider_active": EMBEDDING_PROVIDER,
-            "available": text_embedder_available,
-            "collection_count": text_count
+            "provider_active": active.provider.name,
+            "model": active.provider.model_id,
+            "dims": active.provider.dims,
+            "collection": active.name,
+            "loaded": text_probe["loaded"],
+            "available": text_probe["available"],
+            "error": text_probe["error"],
+            "collection_count": collections[active.name],
+            "migration": index_status["migration"],
+            "cache": embedding_cache.stats(),
+            "provider": active.provider.stats()
         },
         "clip_embedding": {
-            "available": clip_status.get("available", False),
-            "device": clip_status.get("device"),
-            "model": clip_status.get("model_name"),
-            "collection_count": image_count,
-            "error": clip_status.get("error")
+            "loaded": clip_probe["loaded"],
+            "available": clip_probe["available"],
+            "device": clip_image_provider.device if clip_probe["loaded"] else None,
+            "model": clip_image_provider.model_id,
+            "provider": CLIP_PROVIDER,
+            "collection_count": collections[image_collection.name],
+            "text_provider": clip_text_provider.stats(),
+            "image_provider": clip_image_provider.stats(),
+            "error": clip_probe["error"]
         },
+        "collections": collections,
+        "embedding_queue": embedding_queue.stats(),
+        "search_cache": {
+            "query_embeddings": query_embedding_cache.stats(),
+            "results": search_result_cache.stats(),
+            "collection_version": text_collection_version.value
+        },
+        "executors": executors.stats(),
         "openai_key_set": bool(OPENAI_API_KEY),
+        "vector_backend": VECTOR_BACKEND,
         "chroma_dir": str(CHROMA_DIR.resolve()),
         "db_path": str(DB_PATH.resolve())
     }
 
+# Refreshed in the background (health.py); started by initialize()
+health_monitor = HealthMonitor(collect_health)
+
+@app.get("/health")
+async def health():
+    """Last health snapshot (text + CLIP providers, counts); constant time, never loads models"""
+    snapshot = health_monitor.snapshot
+    if snapshot is None:
+        snapshot = {"status": service_startup.state}
+    return {
+        **snapshot,
+        "timestamp": datetime.now().isoformat(),
+        "startup": service_startup.report(),
+        "snapshot": health_monitor.status()
+    }
+
+def sample_gauges():
+    """Set the scrape-time gauges: collection sizes (health snapshot), queue depths, model state"""
+    COLLECTION_VECTORS.clear()
+    snapshot = health_monitor.snapshot
+    for name, count in (snapshot["collections"] if snapshot else {}).items():
+        COLLECTION_VECTORS.set(count, collection=name)
+    
+    QUEUE_DEPTH.clear()
+    queue = embedding_queue.stats()
+    for state in ("pending", "in_flight", "retrying", "failed"):
+        QUEUE_DEPTH.set(queue[state], queue="embedding_jobs", state=state)
+    for pool, pool_stats in executors.stats().items():
+        QUEUE_DEPTH.set(pool_stats["queued"], queue=f"{pool}_pool", state="queued")
+    
+    MODEL_LOADED.clear()
+    providers = [("text", p) for p in _text_providers.values()]
+    providers += [("clip_text", clip_text_provider), ("clip_image", clip_image_provider)]
+    for role, provider in providers:
+        MODEL_LOADED.set(1 if provider.loaded else 0, role=role, provider=provider.name, model=provider.model_id)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics: request counts/latency, stage latency, gauges"""
+    await run_io(sample_gauges)
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+def write_media(path: Path, content: bytes):
+    """Write an uploaded file (timed as the file_write stage)"""
+    with stage("file_write", "media"):
+        path.write_bytes(content)
+
+def _store_visits(visits: List[VisitUpsert]) -> List[Dict[str, Any]]:
+    """Write visits and their embedding jobs in one transaction"""
+    items = []
+    with db.transaction(immediate=True) as cursor:
+        for visit in visits:
+            try:
+                cursor.execute(VISIT_UPSERT_SQL, visit_row(visit))
+                embedding_queue.enqueue(cursor, visit.id, visit.updatedAt)
+                items.append({"id": visit.id, "status": "ok", "embedding": "queued"})
+            except sqlite3.Error as e:
+                items.append({"id": visit.id, "status": "error", "error": str(e)})
+    embedding_queue.notify()
+    # Lexical results reflect the write immediately; drop cached results
+    text_collection_version.bump()
+    return items
+
 @app.post("/sync/visits/upsert")
 async def upsert_visit(visit: VisitUpsert):
-    """Upsert visit record and automatically generate embedding"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Store full record as JSON
-    data_json = json.dumps(visit.model_dump())
-    
-    cursor.execute("""
-        INSERT OR REPLACE INTO visits (
-            id, created_at, updated_at, task_type, lat, lon, acc,
-            note, photo_present, audio_present, photo_caption,
-            audio_transcript, audio_summary, ai_status, sync_status,
-            field_id, crop, issue, severity, data
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        visit.id, visit.createdAt, visit.updatedAt, visit.task_type,
-        visit.lat, visit.lon, visit.acc, visit.note,
-        1 if visit.photo_present else 0,
-        1 if visit.audio_present else 0,
-        visit.photo_caption, visit.audio_transcript, visit.audio_summary,
-        json.dumps(visit.aiStatus) if visit.aiStatus else None,
-        "synced",
-        visit.field_id, visit.crop, visit.issue, visit.severity,
-        data_json
-    ))
+    """Upsert visit record and queue it for embedding"""
+    items = await run_io(_store_visits, [visit])
+    if items[0]["status"] != "ok":
+        raise HTTPException(status_code=500, detail=items[0]["error"])
     
-    conn.commit()
-    conn.close()
+    return {"status": "ok", "id": visit.id, "embedding": "queued"}
+
+@app.post("/sync/visits/upsert-batch")
+async def upsert_visits_batch(request: VisitBatchUpsert):
+    """
+    Upsert many visit records at once.
+    Writes all rows and their embedding jobs in a single SQLite transaction;
+    the queue workers then embed them in batches.
+    Returns a status entry per submitted visit.
+    """
+    items = await run_io(_store_visits, request.visits)
     
-    # Automatically generate embedding after sync
+    stored = sum(1 for item in items if item["status"] == "ok")
+    return {
+        "status": "ok" if stored == len(items) else "partial",
+        "total": len(items),
+        "stored": stored,
+        "items": items
+    }
+
+@app.get("/embeddings/queue")
+async def embedding_queue_status():
+    """Embedding queue depth, lag and worker counters"""
+    stats = await run_io(embedding_queue.stats)
+    stats["workers"] = len(_embedding_workers)
+    stats["processed"] = sum(w.processed for w in _embedding_workers)
+    stats["failed_attempts"] = sum(w.failed for w in _embedding_workers)
+    return stats
+
+class MigrationRequest(BaseModel):
+    provider: str  # "openai" | "local" | "hash"
+    model: Optional[str] = None  # Provider default if omitted
+
+@app.get("/embeddings/models")
+async def embedding_models():
+    """Active text collection, migration progress and all registered models"""
+    return await run_io(text_index.status)
+
+@app.post("/embeddings/migrations")
+async def start_migration(request: MigrationRequest):
+    """
+    Migrate search to another embedding model without downtime: writes are
+    embedded with both models while existing visits backfill in the
+    background, then search switches over.
+    """
     try:
-        visit_dict = visit.model_dump()
-        embedding_text = generate_embedding_text(visit_dict)
-        if embedding_text:
-            embedding = get_embedding(embedding_text)
-            if embedding:
-                metadata = {
-                    "id": visit.id,
-                    "created_at": int(visit.createdAt),  # Store as int (epoch ms) for filtering
-                    "task_type": visit.task_type,
-                    "field_id": visit.field_id or "",
-                    "crop": visit.crop or "",
-                    "issue": visit.issue or "",
-                    "note": visit.note or "",
-                }
-                collection.upsert(
-                    ids=[visit.id],
-                    embeddings=[embedding],
-                    documents=[embedding_text],
-                    metadatas=[metadata]
-                )
-                print(f"[Auto-embed] Generated embedding for visit {visit.id}")
-            else:
-                print(f"[Auto-embed] Failed to generate embedding (provider unavailable)")
-        else:
-            print(f"[Auto-embed] No embedding text generated for visit {visit.id}")
-    except Exception as e:
-        print(f"[Auto-embed] Failed to generate embedding: {e}")
-        import traceback
-        traceback.print_exc()
-        # Non-critical, continue
-    
-    return {"status": "ok", "id": visit.id}
+        return await run_embed(text_index.migrate, request.provider, request.model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+class RebuildRequest(BaseModel):
+    """HNSW parameters for the rebuilt collection (unset: HNSW_TEXT_* / HNSW_* config)"""
+    M: Optional[int] = None
+    construction_ef: Optional[int] = None
+    search_ef: Optional[int] = None
+
+@app.post("/embeddings/rebuild")
+async def rebuild_text_collection(request: RebuildRequest):
+    """
+    Rebuild the active text collection online, e.g. with new HNSW parameters.
+    Progress is reported like a migration in /embeddings/models.
+    """
+    hnsw = {**hnsw_config("text"), **request.model_dump(exclude_none=True)}
+    try:
+        return await run_io(text_index.rebuild, hnsw)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/embeddings/migrations")
+async def abort_migration():
+    """Stop the running migration; search stays on the active model"""
+    aborted = await run_io(text_index.abort_migration)
+    return {"status": "aborted" if aborted else "none"}
 
 @app.post("/sync/media/upload")
 async def upload_media(
@@ -466,9 +924,8 @@ async def upload_media(
     
     # Save file
     file_path = visit_dir / f"{type}_{file.filename}"
-    with open(file_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
+    content = await file.read()
+    await run_io(write_media, file_path, content)
     
     # Return URI
     uri = f"/media/{visit_id}/{type}_{file.filename}"
@@ -496,100 +953,82 @@ async def upsert_embedding(visit: VisitUpsert):
     if not embedding_text:
         return {"status": "skipped", "reason": "No embedding text generated"}
     
-    # Get embedding
-    embedding = get_embedding(embedding_text)
+    # Embed and upsert into ChromaDB (every write collection)
+    errors = await run_embed(text_index.upsert, [visit.id], [embedding_text], [visit_metadata(visit)])
     
-    if not embedding:
-        return {"status": "pending", "reason": "Embedding provider unavailable"}
-    
-    # Prepare metadata
-    metadata = {
-        "id": visit.id,
-        "created_at": int(visit.createdAt),  # Store as int (epoch ms) for filtering
-        "task_type": visit.task_type,
-        "field_id": visit.field_id or "",
-        "crop": visit.crop or "",
-        "issue": visit.issue or "",
-        "note": visit.note or "",
-    }
-    
-    # Upsert into ChromaDB
-    collection.upsert(
-        ids=[visit.id],
-        embeddings=[embedding],
-        documents=[embedding_text],
-        metadatas=[metadata]
-    )
+    if errors:
+        return {"status": "pending", "reason": errors[0]}
+    text_collection_version.bump()
     
     return {"status": "ok", "id": visit.id}
 
-@app.post("/rag/search", response_model=List[SearchResult])
-async def search_visits(request: SearchRequest):
-    """Semantic search with time and field filtering"""
-    # Get query embedding
-    query_embedding = get_embedding(request.query)
-    
+async def lexical_search(request: SearchRequest, visit_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """BM25 search over the FTS5 index (no embedding model needed), optionally within ``visit_ids``"""
+    hits = await run_io(lexical_index.search, request.query, request.k, request.filters, visit_ids)
+    return [
+        {
+            "id": visit_id,
+            "score": float(score),
+            "snippet": snippet,
+            "metadata": metadata
+        }
+        for visit_id, score, snippet, metadata in hits
+    ]
+
+def query_collection(
+    collection,
+    query_embedding: List[float],
+    k: int,
+    where_clause: Optional[Dict[str, Any]],
+    allowed: Optional[Set[str]] = None,
+    field: str = "id"
+) -> Dict[str, Any]:
+    """
+    Top k of ``collection`` for one query vector. With ``allowed`` (a geo
+    candidate set too large for a $in clause, see search_filters.limit_ids)
+    the query over-fetches, doubling until k hits have metadata ``field`` in
+    ``allowed`` or the collection has no more matches.
+    """
+    include = ['documents', 'metadatas', 'distances']
+    if allowed is None:
+        return collection.query(
+            query_embeddings=[query_embedding], n_results=k, where=where_clause, include=include
+        )
+    n_results = k * 4
+    while True:
+        results = collection.query(
+            query_embeddings=[query_embedding], n_results=n_results, where=where_clause, include=include
+        )
+        found = results["ids"][0] if results["ids"] else []
+        metadatas = results["metadatas"][0] if found else []
+        keep = [i for i, metadata in enumerate(metadatas) if metadata.get(field) in allowed]
+        if len(keep) >= k or len(found) < n_results:
+            keep = keep[:k]
+            return {key: [[results[key][0][i] for i in keep]] for key in ["ids"] + include}
+        n_results *= 2
+
+async def vector_search(
+    request: SearchRequest,
+    where_clause: Optional[Dict[str, Any]],
+    slot: ModelSlot,
+    allowed: Optional[Set[str]] = None
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Semantic search in ``slot``'s collection, within the ``allowed`` visit
+    ids if given; None if the query could not be embedded
+    """
+    query_embedding = await embed_query(request.query, slot.provider)
     if not query_embedding:
-        # Provide clear error message based on provider configuration
-        if EMBEDDING_PROVIDER == "openai" and not OPENAI_API_KEY:
-            raise HTTPException(
-                status_code=503,
-                detail={
-                    "error": "Embedding provider unavailable",
-                    "reason": "OPENAI_API_KEY not set but provider is 'openai'",
-                    "provider_config": EMBEDDING_PROVIDER_CONFIG,
-                    "provider_active": EMBEDDING_PROVIDER,
-                    "suggestion": "Set OPENAI_API_KEY environment variable or use EMBEDDING_PROVIDER=auto to fallback to local embeddings"
-                }
-            )
-        else:
-            raise HTTPException(
-                status_code=503,
-                detail={
-                    "error": "Embedding provider unavailable",
-                    "reason": "Failed to generate embedding",
-                    "provider_config": EMBEDDING_PROVIDER_CONFIG,
-                    "provider_active": EMBEDDING_PROVIDER
-                }
-            )
+        return None
     
-    # Build ChromaDB where clause from filters
-    where_clause = {}
-    if request.filters:
-        # Field filter
-        if "field_id" in request.filters:
-            where_clause["field_id"] = request.filters["field_id"]
-        
-        # Time filter (created_at >= timestamp)
-        if "created_at_min" in request.filters:
-            # ChromaDB metadata filtering - we'll filter in Python after query
-            pass
-    
-    # Search in ChromaDB
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=request.k * 2 if request.filters and "created_at_min" in request.filters else request.k,  # Get more results if time filtering
-        where=where_clause if where_clause else None,
-        include=['documents', 'metadatas', 'distances']
-    )
+    # Search in ChromaDB, filtered natively so the top k all match
+    results = await run_io(query_collection, slot.collection, query_embedding, request.k, where_clause, allowed)
     
-    # Format results with time filtering
+    # Format results
     search_results = []
     if results["ids"] and len(results["ids"][0]) > 0:
-        created_at_min = request.filters.get("created_at_min") if request.filters else None
-        
         for i, visit_id in enumerate(results["ids"][0]):
             metadata = results["metadatas"][0][i]
-            
-            # Apply time filter if specified
-            if created_at_min:
-                visit_created_at = metadata.get("created_at", 0)
-                # Handle both int and string timestamps
-                if isinstance(visit_created_at, str):
-                    visit_created_at = int(visit_created_at)
-                if visit_created_at < created_at_min:
-                    continue  # Skip visits before the time threshold
-            
             score = 1 - results["distances"][0][i]  # Convert distance to similarity
             doc = results["documents"][0][i]
             
@@ -599,21 +1038,118 @@ async def search_visits(request: SearchRequest):
                 "snippet": doc[:200] + "..." if len(doc) > 200 else doc,
                 "metadata": metadata
             })
-        
-        # Limit to requested k after filtering
-        search_results = search_results[:request.k]
+    return search_results
+
+def _embedding_unavailable(slot: ModelSlot) -> HTTPException:
+    """503 with a clear reason, based on provider configuration"""
+    if slot.provider.name == "openai" and not OPENAI_API_KEY:
+        return HTTPException(
+            status_code=503,
+            detail={
+                "error": "Embedding provider unavailable",
+                "reason": "OPENAI_API_KEY not set but provider is 'openai'",
+                "provider_config": EMBEDDING_PROVIDER_CONFIG,
+                "provider_active": slot.provider.name,
+                "suggestion": "Set OPENAI_API_KEY environment variable or use EMBEDDING_PROVIDER=auto to fallback to local embeddings"
+            }
+        )
+    return HTTPException(
+        status_code=503,
+        detail={
+            "error": "Embedding provider unavailable",
+            "reason": "Failed to generate embedding",
+            "provider_config": EMBEDDING_PROVIDER_CONFIG,
+            "provider_active": slot.provider.name,
+            "model": slot.provider.model_id
+        }
+    )
+
+@app.post("/rag/search", response_model=List[SearchResult])
+async def search_visits(request: SearchRequest, response: Response):
+    """
+    Search visits with time, field, crop, issue, task type and severity filters.
+    mode="vector" (semantic), "lexical" (BM25 over FTS5) or "hybrid" (both,
+    run concurrently and fused with reciprocal-rank fusion). Vector and hybrid
+    searches fall back to lexical when no embedding can be computed; the mode
+    that answered is returned in the X-Search-Mode header.
+    """
+    if request.mode not in SEARCH_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown search mode '{request.mode}'. Supported: {', '.join(SEARCH_MODES)}"
+        )
     
+    # Repeated queries are answered from the result cache until the next upsert
+    cache_key = (
+        request.mode,
+        request.query,
+        json.dumps(request.filters, sort_keys=True) if request.filters else None,
+        request.k,
+        (request.vector_weight, request.lexical_weight) if request.mode == "hybrid" else None,
+        text_collection_version.value
+    )
+    cached = search_result_cache.get(cache_key)
+    if cached is not None:
+        response.headers["X-Search-Mode"] = request.mode
+        return cached
+    
+    # Translate filters into a ChromaDB where clause (400 on unknown filters)
+    try:
+        where_clause = build_where(request.filters)
+        area = geo_area(request.filters)
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # near / bbox: candidate visits from the R*Tree, then search only those
+    visit_ids, allowed = None, None
+    if area is not None:
+        visit_ids = await run_io(geo_index.visits_within, area)
+        if not visit_ids:
+            response.headers["X-Search-Mode"] = request.mode
+            search_result_cache.set(cache_key, [])
+            return []
+        where_clause, allowed = limit_ids(where_clause, visit_ids)
+    
+    # One snapshot of the active model: the query vector and the collection must match
+    slot = text_index.active
+    
+    if request.mode == "lexical":
+        search_results = await lexical_search(request, visit_ids)
+    elif request.mode == "hybrid":
+        # BM25 and vector search run concurrently, k results from each
+        vector_results, lexical_results = await asyncio.gather(
+            vector_search(request, where_clause, slot, allowed),
+            lexical_search(request, visit_ids)
+        )
+        if vector_results is None:
+            if not LEXICAL_FALLBACK:
+                raise _embedding_unavailable(slot)
+            print("[Search] Embedding provider unavailable, answering hybrid search lexically")
+            response.headers["X-Search-Mode"] = "lexical"
+            return lexical_results
+        search_results = reciprocal_rank_fusion(
+            [(vector_results, request.vector_weight), (lexical_results, request.lexical_weight)],
+            limit=request.k
+        )
+    else:
+        search_results = await vector_search(request, where_clause, slot, allowed)
+        if search_results is None:
+            if not LEXICAL_FALLBACK:
+                raise _embedding_unavailable(slot)
+            # No embedder (offline, no key, model missing): still answer, lexically.
+            # Not cached, so vector results return as soon as the provider does.
+            print("[Search] Embedding provider unavailable, answering with lexical search")
+            response.headers["X-Search-Mode"] = "lexical"
+            return await lexical_search(request, visit_ids)
+    
+    response.headers["X-Search-Mode"] = request.mode
+    search_result_cache.set(cache_key, search_results)
     return search_results
 
 @app.get("/visits/{visit_id}")
 async def get_visit(visit_id: str):
     """Get full visit record"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT data FROM visits WHERE id = ?", (visit_id,))
-    row = cursor.fetchone()
-    conn.close()
+    row = await run_io(db.fetchone, "SELECT data FROM visits WHERE id = ?", (visit_id,))
     
     if not row:
         raise HTTPException(status_code=404, detail="Visit not found")
@@ -637,6 +1173,7 @@ class ImageSearchRequest(BaseModel):
     query: str
     k: int = 10
     visit_id: Optional[str] = None  # Filter by specific visit
+    filters: Optional[Dict[str, Any]] = None  # near / bbox on the photo EXIF position
 
 class ImageEmbeddingResponse(BaseModel):
     """Response for image embedding"""
@@ -646,6 +1183,17 @@ class ImageEmbeddingResponse(BaseModel):
     model: str
     device: str
 
+def _store_photo(row: tuple):
+    """Insert one photos row"""
+    with db.transaction(immediate=True) as cursor:
+        cursor.execute("""
+            INSERT INTO photos (
+                id, visit_id, filename, file_path, file_size, mime_type,
+                width, height, embedding_id, embedding_model, embedding_dims,
+                embedding_generated_at, exif_lat, exif_lon, exif_timestamp, created_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, row)
+
 @app.post("/rag/embed-image")
 async def embed_image(
     file: UploadFile = File(...),
@@ -669,9 +1217,7 @@ async def embed_image(
     filename = f"photo_{photo_id}_{file.filename}"
     file_path = visit_dir / filename
     content = await file.read()
-    
-    with open(file_path, "wb") as f:
-        f.write(content)
+    await run_io(write_media, file_path, content)
     
     file_size = len(content)
     
@@ -687,7 +1233,7 @@ async def embed_image(
     # Extract image metadata
     try:
         from embeddings.clip_embedder import get_image_metadata
-        metadata = get_image_metadata(str(file_path))
+        metadata = await run_io(get_image_metadata, str(file_path))
         result.update(metadata)
     except Exception as e:
         print(f"[CLIP] Metadata extraction failed: {e}")
@@ -696,32 +1242,38 @@ async def embed_image(
     embedding_id = None
     if generate_embedding:
         try:
-            from embeddings.clip_embedder import get_image_embedding, _get_device
-            
-            embedding = get_image_embedding(str(file_path))
+            # Batched on the CLIP image batcher thread; this thread only waits
+            embedding = await run_embed(clip_image_provider.embed, str(file_path))
             if embedding:
-                embedding_id = f"img_{photo_id}"
+                photo_metadata = {
+                    "photo_id": photo_id,
+                    "visit_id": visit_id,
+                    "filename": filename,
+                    "width": result.get("width"),
+                    "height": result.get("height"),
+                    "created_at": int(datetime.now().timestamp() * 1000)
+                }
+                # Visit fields for filtered image search (the embedding queue
+                # adds them later if the visit is not synced yet)
+                visit = (await run_io(visits_metadata, [visit_id])).get(visit_id)
+                if visit is not None:
+                    photo_metadata.update(photo_visit_metadata(visit))
                 
-                # Store in image collection
-                image_collection.upsert(
-                    ids=[embedding_id],
+                # Store in image collection (metadata values may not be None)
+                await run_io(
+                    image_collection.upsert,
+                    ids=[f"img_{photo_id}"],
                     embeddings=[embedding],
                     documents=[f"Photo from visit {visit_id}: {file.filename}"],
-                    metadatas=[{
-                        "photo_id": photo_id,
-                        "visit_id": visit_id,
-                        "filename": filename,
-                        "width": result.get("width"),
-                        "height": result.get("height"),
-                        "created_at": int(datetime.now().timestamp() * 1000)
-                    }]
+                    metadatas=[{k: v for k, v in photo_metadata.items() if v is not None}]
                 )
+                embedding_id = f"img_{photo_id}"
                 
                 result["embedding_generated"] = True
                 result["embedding_id"] = embedding_id
                 result["embedding_dims"] = len(embedding)
-                result["embedding_model"] = "clip-vit-base-patch32"
-                result["embedding_device"] = _get_device()
+                result["embedding_model"] = clip_image_provider.model_id
+                result["embedding_device"] = clip_image_provider.device
                 
                 print(f"[CLIP] Generated embedding for {filename}: {len(embedding)} dims")
         except Exception as e:
@@ -732,44 +1284,79 @@ async def embed_image(
     
     # Store photo metadata in SQLite
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO photos (
-                id, visit_id, filename, file_path, file_size, mime_type,
-                width, height, embedding_id, embedding_model, embedding_dims,
-                embedding_generated_at, exif_lat, exif_lon, exif_timestamp, created_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+        await run_io(_store_photo, (
             photo_id, visit_id, filename, str(file_path), file_size,
             file.content_type,
             result.get("width"), result.get("height"),
             embedding_id,
-            "clip-vit-base-patch32" if embedding_id else None,
+            clip_image_provider.model_id if embedding_id else None,
             result.get("embedding_dims"),
             int(datetime.now().timestamp() * 1000) if embedding_id else None,
             result.get("exif_lat"), result.get("exif_lon"), result.get("exif_timestamp"),
             int(datetime.now().timestamp() * 1000)
         ))
-        conn.commit()
-        conn.close()
     except Exception as e:
         print(f"[CLIP] Failed to store photo metadata: {e}")
         result["db_error"] = str(e)
     
     return result
 
+async def query_images(
+    query_embedding: List[float],
+    k: int,
+    where_clause: Optional[Dict[str, Any]] = None,
+    allowed: Optional[Set[str]] = None,
+    field: str = "photo_id"
+) -> List[Dict[str, Any]]:
+    """Top-k photos in the image collection for a CLIP query vector (``field`` in ``allowed`` if given)"""
+    results = await run_io(query_collection, image_collection, query_embedding, k, where_clause, allowed, field)
+    
+    # Format results
+    search_results = []
+    if results["ids"] and len(results["ids"][0]) > 0:
+        for i, img_id in enumerate(results["ids"][0]):
+            metadata = results["metadatas"][0][i]
+            score = 1 - results["distances"][0][i]  # Convert distance to similarity
+            
+            # Get photo URI
+            photo_uri = f"/media/{metadata.get('visit_id')}/{metadata.get('filename')}"
+            
+            search_results.append({
+                "embedding_id": img_id,
+                "photo_id": metadata.get("photo_id"),
+                "visit_id": metadata.get("visit_id"),
+                "filename": metadata.get("filename"),
+                "photo_uri": photo_uri,
+                "score": float(score),
+                "width": metadata.get("width"),
+                "height": metadata.get("height")
+            })
+    return search_results
+
 @app.post("/rag/search-images")
 async def search_images(request: ImageSearchRequest):
     """
     Cross-modal search: Text query → Similar images.
     Uses CLIP text encoder to embed query, then searches image collection.
     """
+    if request.filters:
+        unknown = sorted(set(request.filters) - set(GEO_FILTERS))
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown filter(s): {', '.join(unknown)}. Supported: {', '.join(GEO_FILTERS)}"
+            )
+    try:
+        area = geo_area(request.filters)
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     try:
-        from embeddings.clip_embedder import get_text_embedding_clip
-        
         # Get CLIP text embedding for the query
-        query_embedding = get_text_embedding_clip(request.query)
+        # Batched on the CLIP text batcher thread; this thread only waits
+        query_embedding = None
+        if request.query and request.query.strip():
+            query_embedding = await run_embed(clip_text_provider.embed, request.query)
         
         if not query_embedding:
             raise HTTPException(
@@ -778,38 +1365,19 @@ async def search_images(request: ImageSearchRequest):
             )
         
         # Build where clause
-        where_clause = None
+        where_clause, allowed = None, None
         if request.visit_id:
             where_clause = {"visit_id": request.visit_id}
         
-        # Search in image collection
-        results = image_collection.query(
-            query_embeddings=[query_embedding],
-            n_results=request.k,
-            where=where_clause,
-            include=['documents', 'metadatas', 'distances']
-        )
+        # Photos taken inside the area, from the R*Tree
+        if area is not None:
+            photo_ids = await run_io(geo_index.photos_within, area)
+            if not photo_ids:
+                return {"query": request.query, "results": [], "total": 0}
+            where_clause, allowed = limit_ids(where_clause, photo_ids, field="photo_id")
         
-        # Format results
-        search_results = []
-        if results["ids"] and len(results["ids"][0]) > 0:
-            for i, img_id in enumerate(results["ids"][0]):
-                metadata = results["metadatas"][0][i]
-                score = 1 - results["distances"][0][i]  # Convert distance to similarity
-                
-                # Get photo URI
-                photo_uri = f"/media/{metadata.get('visit_id')}/{metadata.get('filename')}"
-                
-                search_results.append({
-                    "embedding_id": img_id,
-                    "photo_id": metadata.get("photo_id"),
-                    "visit_id": metadata.get("visit_id"),
-                    "filename": metadata.get("filename"),
-                    "photo_uri": photo_uri,
-                    "score": float(score),
-                    "width": metadata.get("width"),
-                    "height": metadata.get("height")
-                })
+        # Search in image collection
+        search_results = await query_images(query_embedding, request.k, where_clause, allowed)
         
         return {
             "query": request.query,
@@ -817,6 +1385,8 @@ async def search_images(request: ImageSearchRequest):
             "total": len(search_results)
         }
         
+    except HTTPException:
+        raise
     except ImportError:
         raise HTTPException(
             status_code=503,
@@ -825,15 +1395,179 @@ async def search_images(request: ImageSearchRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+class MultimodalSearchRequest(BaseModel):
+    """Request model for combined text + image search"""
+    query: str
+    k: int = 10
+    filters: Optional[Dict[str, Any]] = None  # same filters as /rag/search
+    # Relative weight of the text and photo match in a visit's score
+    text_weight: float = MULTIMODAL_TEXT_WEIGHT
+    image_weight: float = MULTIMODAL_IMAGE_WEIGHT
+
+def visits_metadata(ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Search metadata (as in visit_metadata) for stored visits"""
+    rows = db.fetchall("""
+        SELECT id, created_at, task_type, field_id, crop, issue, note, severity
+        FROM visits WHERE id IN (SELECT value FROM json_each(?))
+    """, (json.dumps(ids),))
+    result = {}
+    for visit_id, created_at, task_type, field_id, crop, issue, note, severity in rows:
+        metadata = {
+            "id": visit_id,
+            "created_at": int(created_at),
+            "task_type": task_type,
+            "field_id": field_id or "",
+            "crop": crop or "",
+            "issue": issue or "",
+            "note": note or "",
+        }
+        if severity is not None:
+            metadata["severity"] = int(severity)
+        result[visit_id] = metadata
+    return result
+
+@app.post("/rag/search-multimodal")
+async def search_multimodal(request: MultimodalSearchRequest):
+    """
+    One ranked visit list from the text and image collections.
+    The text model and the CLIP text encoder embed the query in parallel and
+    both collections are queried concurrently; scores are normalized, hits
+    grouped by visit and matching photos attached to each visit.
+    """
+    try:
+        where_clause = build_where(request.filters)
+        # Photos carry their visit's filterable fields (search_filters.PHOTO_VISIT_PREFIX)
+        image_where = build_where(request.filters, prefix=PHOTO_VISIT_PREFIX)
+        area = geo_area(request.filters)
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    visit_ids, allowed = None, None
+    if area is not None:
+        visit_ids = await run_io(geo_index.visits_within, area)
+        where_clause, allowed = limit_ids(where_clause, visit_ids)
+        image_where, _ = limit_ids(image_where, visit_ids, field="visit_id")
+    
+    text_request = SearchRequest(query=request.query, k=request.k, filters=request.filters)
+    slot = text_index.active
+    
+    async def text_side():
+        if visit_ids == []:
+            return [], "vector"
+        results = await vector_search(text_request, where_clause, slot, allowed)
+        if results is None and LEXICAL_FALLBACK:
+            return await lexical_search(text_request, visit_ids), "lexical"
+        return results, "vector"
+    
+    async def image_side():
+        if not request.query.strip():
+            return None
+        query_embedding = await run_embed(clip_text_provider.embed, request.query)
+        if not query_embedding:
+            return None
+        if visit_ids == []:
+            return []
+        return await query_images(query_embedding, request.k, image_where, allowed, field="visit_id")
+    
+    (text_results, text_mode), photo_results = await asyncio.gather(text_side(), image_side())
+    if text_results is None and photo_results is None:
+        raise _embedding_unavailable(slot)
+    
+    results = fuse_visits_and_photos(
+        text_results or [], photo_results or [], request.k,
+        text_weight=request.text_weight, image_weight=request.image_weight
+    )
+    
+    # Visits found only through a photo: load their snippet and metadata
+    missing = [r["id"] for r in results if not r["metadata"]]
+    if missing:
+        stored = await run_io(visits_metadata, missing)
+        for r in results:
+            if r["id"] in stored:
+                r["metadata"] = stored[r["id"]]
+                note = r["metadata"]["note"]
+                r["snippet"] = note[:200] + "..." if len(note) > 200 else note
+    
+    return {
+        "query": request.query,
+        "results": results,
+        "total": len(results),
+        "sources": {
+            "text": text_mode if text_results is not None else None,
+            "image": photo_results is not None
+        }
+    }
+
+def stored_image_embedding(photo_id: str) -> Optional[List[float]]:
+    """The CLIP vector already stored for ``photo_id`` (no model inference)"""
+    stored = image_collection.get(ids=[f"img_{photo_id}"], include=["embeddings"])
+    if not stored["ids"]:
+        return None
+    return list(stored["embeddings"][0])
+
+@app.post("/rag/search-by-image")
+async def search_by_image(
+    file: Optional[UploadFile] = File(None),
+    photo_id: Optional[str] = Form(None),
+    k: int = Form(10),
+    visit_id: Optional[str] = Form(None),
+    field_id: Optional[str] = Form(None),
+    created_at_min: Optional[int] = Form(None),
+    created_at_max: Optional[int] = Form(None)
+):
+    """
+    Image → similar images.
+    For an existing photo_id the stored CLIP vector is reused (no model
+    inference); an uploaded image is embedded with the CLIP image encoder
+    and not stored. Optionally filtered by visit, field or visit date.
+    """
+    if (file is None) == (photo_id is None):
+        raise HTTPException(status_code=400, detail="Provide either an image file or a photo_id")
+    
+    if photo_id is not None:
+        query_embedding = await run_io(stored_image_embedding, photo_id)
+        if query_embedding is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No image embedding for photo {photo_id}. Upload it with /rag/embed-image first."
+            )
+    else:
+        content = await file.read()
+        # Batched on the CLIP image batcher thread; this thread only waits
+        query_embedding = await run_embed(clip_image_provider.embed, content)
+        if not query_embedding:
+            raise HTTPException(
+                status_code=503,
+                detail="CLIP embedding unavailable. Ensure PyTorch and transformers are installed."
+            )
+    
+    # Field and date are visit fields stored on each photo (search_filters.PHOTO_VISIT_PREFIX)
+    visit_filters = {
+        "field_id": field_id,
+        "created_at_min": created_at_min,
+        "created_at_max": created_at_max,
+    }
+    where_clause = build_where(visit_filters, prefix=PHOTO_VISIT_PREFIX)
+    if visit_id:
+        where_clause = {"$and": [where_clause, {"visit_id": visit_id}]} if where_clause else {"visit_id": visit_id}
+    
+    # One extra neighbour: a stored photo is always its own nearest match
+    n_results = k + 1 if photo_id is not None else k
+    results = await query_images(query_embedding, n_results, where_clause)
+    results = [r for r in results if photo_id is None or r["photo_id"] != photo_id][:k]
+    
+    return {
+        "photo_id": photo_id,
+        "results": results,
+        "total": len(results)
+    }
+
 @app.get("/photos/{visit_id}")
 async def get_photos(visit_id: str):
     """
     Get all photos for a visit with embedding status.
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
+    rows = await run_io(db.fetchall, """
         SELECT id, filename, file_path, file_size, width, height,
                embedding_id, embedding_model, embedding_dims,
                exif_lat, exif_lon, created_at
@@ -841,9 +1575,6 @@ async def get_photos(visit_id: str):
         ORDER BY created_at DESC
     """, (visit_id,))
     
-    rows = cursor.fetchall()
-    conn.close()
-    
     photos = []
     for row in rows:
         photos.append({
@@ -870,8 +1601,5 @@ async def get_photos(visit_id: str):
         "with_embeddings": sum(1 for p in photos if p["has_embedding"])
     }
 
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
-
-
+# Everything above only defines things; the startup event does the rest
+service_startup.record("import", time.perf_counter() - _IMPORT_START)
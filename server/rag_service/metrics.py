@@ -0,0 +1,224 @@
+"""
+Metrics
+Prometheus counters, gauges and histograms served by GET /metrics, in the
+text exposition format (no client library needed).
+
+- ``rag_http_requests_total`` / ``rag_http_request_duration_seconds``:
+  per route template (``/visits/{visit_id}``), method and status
+- ``rag_stage_duration_seconds{stage, target}``: where the time goes inside
+  a request: ``embedding`` (target: provider), ``vector_query`` /
+  ``vector_upsert`` / ``vector_get`` / ``vector_delete`` / ``vector_count``
+  (target: collection), ``sqlite_read`` / ``sqlite_write``,
+  ``clip_preprocess`` / ``clip_inference`` (target: text / image) and
+  ``file_write``
+- gauges (collection sizes, queue depths, model loaded state), set by the
+  /metrics endpoint when scraped, and startup phase durations (startup.py)
+
+Stages are also recorded as spans of the current request trace (tracing.py,
+Server-Timing header).
+
+A slow /rag/search shows up as a high ``embedding`` (OpenAI / model),
+``vector_query`` (HNSW) or ``sqlite_read`` stage.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import tracing
+
+# Seconds; covers sub-millisecond SQLite reads up to slow first model loads
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Value that is set, e.g. a size sampled at scrape time"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def clear(self):
+        """Drop all label sets (before re-sampling values that may disappear)"""
+        with self._lock:
+            self._values.clear()
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [count per bucket..., +Inf count], sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the duration of the block in seconds (also when it raises)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._values.items())
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """The metrics exposed by /metrics"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "rag_http_requests_total", "HTTP requests by route, method and status",
+    ("method", "route", "status")
+))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "rag_http_request_duration_seconds", "HTTP request latency by route and method",
+    ("method", "route")
+))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "rag_stage_duration_seconds", "Time spent in one stage of request or background processing",
+    ("stage", "target")
+))
+COLLECTION_VECTORS = REGISTRY.register(Gauge(
+    "rag_collection_vectors", "Vectors stored per collection", ("collection",)
+))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "rag_queue_depth", "Items waiting in queues and pools", ("queue", "state")
+))
+MODEL_LOADED = REGISTRY.register(Gauge(
+    "rag_model_loaded", "1 if the embedding model is loaded and ready", ("role", "provider", "model")
+))
+STARTUP_PHASE = REGISTRY.register(Gauge(
+    "rag_startup_phase_seconds", "Duration of each service startup phase", ("phase",)
+))
+
+
+@contextmanager
+def stage(name: str, target: str = "") -> Iterator[None]:
+    """Time a block as stage ``name``, also as a span of the current request"""
+    trace = tracing.current()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_LATENCY.observe(seconds, stage=name, target=target)
+        if trace is not None:
+            trace.add(name, target, seconds)
+
+
+def observe_request(method: str, route: str, status: int, seconds: float):
+    HTTP_REQUESTS.inc(method=method, route=route, status=str(status))
+    HTTP_LATENCY.observe(seconds, method=method, route=route)
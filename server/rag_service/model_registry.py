@@ -0,0 +1,566 @@
+"""
+Embedding Model Registry
+Per-model vector collections and online migration between embedding models.
+
+Vectors from different models never share a collection. Each text model gets
+its own Chroma collection named after the model and its dimension, e.g.
+``farm_visits__text-embedding-3-small__1536``, and the ``embedding_models``
+table records which collection is active (serving search), which one is
+being migrated to, and how far its backfill has got.
+
+Online migration to a new model:
+1. The new model's collection is registered as ``migrating``.
+2. Every visit write is embedded with both models (dual-write).
+3. A background thread backfills existing visits into the new collection,
+   saving its cursor so a restart resumes where it stopped.
+4. When the backfill reaches the end, the registry and the in-memory active
+   slot switch together; the old collection is kept as ``retired``.
+
+A rebuild (``TextIndex.rebuild``, e.g. to apply new HNSW parameters) is the
+same process for the active model: a new generation of its collection
+(``...__1536__r2``) is backfilled from SQLite and then replaces it. Vectors
+come from the embedding cache, so a rebuild does not call the provider again.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from db import Database
+from embeddings.providers import EmbeddingProvider
+from vector_store import InstrumentedCollection, hnsw_config, open_collection
+
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "64"))
+MIGRATION_RETRY_SECONDS = float(os.getenv("MIGRATION_RETRY_SECONDS", "30"))
+
+# Collection written by earlier versions, before collections were per-model
+LEGACY_COLLECTION = "farm_visits"
+# Which model produced a legacy collection, by vector size
+LEGACY_MODELS = {
+    1536: ("openai", "text-embedding-3-small"),
+    384: ("local", "all-MiniLM-L6-v2"),
+}
+
+# Builds the provider for (provider name, model id or None for the default)
+ProviderFactory = Callable[[str, Optional[str]], EmbeddingProvider]
+# Visits with id > cursor, in id order: (id, updated_at, text, metadata)
+DocumentLoader = Callable[[Optional[str], int], List[Tuple[str, int, str, Dict[str, Any]]]]
+# Current updated_at of the given visit ids
+VersionLookup = Callable[[List[str]], Dict[str, int]]
+
+
+def collection_name(model_id: str, dims: int, generation: int = 1) -> str:
+    """
+    Chroma collection name for a model (3-63 chars of [A-Za-z0-9._-]).
+    Rebuilt collections (generation 2 and up) get an ``__r<generation>`` suffix.
+    """
+    model = re.sub(r"[^A-Za-z0-9_-]+", "-", model_id).strip("-_") or "model"
+    suffix = f"__{dims}" + (f"__r{generation}" if generation > 1 else "")
+    prefix = f"{LEGACY_COLLECTION}__"
+    return prefix + model[:63 - len(prefix) - len(suffix)] + suffix
+
+
+class ModelSlot:
+    """An embedding provider bound to the collection holding its vectors"""
+
+    def __init__(self, name: str, provider: EmbeddingProvider, collection):
+        self.name = name
+        self.provider = provider
+        self.collection = collection
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "collection": self.name,
+            "provider": self.provider.name,
+            "model": self.provider.model_id,
+            "dims": self.provider.dims,
+            "hnsw": {k: v for k, v in (self.collection.metadata or {}).items() if k.startswith("hnsw:")},
+        }
+
+
+class ModelRegistry:
+    """SQLite record of text embedding collections and their state"""
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    def init_schema(self, cursor: sqlite3.Cursor):
+        """Create the registry table (called from init_db)"""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_models (
+                collection TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                dims INTEGER NOT NULL,
+                status TEXT NOT NULL,              -- active | migrating | retired
+                backfill_cursor TEXT,              -- last visit id backfilled
+                backfilled INTEGER NOT NULL DEFAULT 0,
+                backfill_done INTEGER NOT NULL DEFAULT 0,
+                created_at INTEGER NOT NULL,
+                activated_at INTEGER
+            )
+        """)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        rows = self.db.fetchall("""
+            SELECT collection, provider, model, dims, status, backfill_cursor,
+                   backfilled, backfill_done, created_at, activated_at
+            FROM embedding_models ORDER BY created_at
+        """)
+        keys = ("collection", "provider", "model", "dims", "status", "backfill_cursor",
+                "backfilled", "backfill_done", "created_at", "activated_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def find(self, status: str) -> Optional[Dict[str, Any]]:
+        for entry in self.entries():
+            if entry["status"] == status:
+                return entry
+        return None
+
+    def register(self, slot: ModelSlot, status: str, backfill_done: bool = False):
+        """Record ``slot`` with ``status``, restarting its backfill"""
+        now = int(time.time() * 1000)
+        with self.db.transaction(immediate=True) as cursor:
+            if status == "active":
+                cursor.execute(
+                    "UPDATE embedding_models SET status = 'retired' WHERE status = 'active'"
+                )
+            cursor.execute("""
+                INSERT INTO embedding_models (
+                    collection, provider, model, dims, status,
+                    backfill_done, created_at, activated_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(collection) DO UPDATE SET
+                    status = excluded.status,
+                    backfill_cursor = NULL,
+                    backfilled = 0,
+                    backfill_done = excluded.backfill_done,
+                    activated_at = excluded.activated_at
+            """, (
+                slot.name, slot.provider.name, slot.provider.model_id, slot.provider.dims,
+                status, 1 if backfill_done else 0, now, now if status == "active" else None,
+            ))
+
+    def save_progress(self, collection: str, cursor_id: str, backfilled: int):
+        with self.db.transaction() as cursor:
+            cursor.execute("""
+                UPDATE embedding_models SET backfill_cursor = ?, backfilled = ?
+                WHERE collection = ?
+            """, (cursor_id, backfilled, collection))
+
+    def rewind(self, collection: str, cursor_id: str):
+        """Move the backfill cursor of ``collection`` back to ``cursor_id``"""
+        with self.db.transaction() as cursor:
+            cursor.execute("""
+                UPDATE embedding_models SET backfill_cursor = ?
+                WHERE collection = ? AND backfill_cursor > ?
+            """, (cursor_id, collection, cursor_id))
+
+    def finish_backfill(self, collection: str):
+        with self.db.transaction() as cursor:
+            cursor.execute(
+                "UPDATE embedding_models SET backfill_done = 1 WHERE collection = ?",
+                (collection,)
+            )
+
+    def activate(self, collection: str):
+        """Make ``collection`` the active one and retire the previous one (atomic)"""
+        with self.db.transaction(immediate=True) as cursor:
+            cursor.execute("""
+                UPDATE embedding_models SET status = 'retired'
+                WHERE status = 'active' AND collection != ?
+            """, (collection,))
+            cursor.execute("""
+                UPDATE embedding_models SET status = 'active', activated_at = ?
+                WHERE collection = ?
+            """, (int(time.time() * 1000), collection))
+
+    def retire(self, collection: str):
+        with self.db.transaction() as cursor:
+            cursor.execute(
+                "UPDATE embedding_models SET status = 'retired' WHERE collection = ?",
+                (collection,)
+            )
+
+
+class TextIndex:
+    """
+    The active text collection plus an optional migration target.
+
+    Search reads ``active``; writes go to every slot in ``write_slots()``.
+    ``write_lock`` serializes collection writes with the backfill's
+    version check, so the backfill never overwrites a newer dual-write.
+    """
+
+    def __init__(
+        self,
+        registry: ModelRegistry,
+        vector_client,
+        make_provider: ProviderFactory,
+        load_documents: Optional[DocumentLoader] = None,
+        current_versions: Optional[VersionLookup] = None,
+        on_switch: Optional[Callable[[ModelSlot], None]] = None,
+        batch_size: int = MIGRATION_BATCH_SIZE,
+    ):
+        self.registry = registry
+        self.vector_client = vector_client
+        self.make_provider = make_provider
+        self.load_documents = load_documents
+        self.current_versions = current_versions
+        self.on_switch = on_switch
+        self.batch_size = max(1, batch_size)
+        self.active: Optional[ModelSlot] = None
+        self.target: Optional[ModelSlot] = None
+        self.write_lock = threading.Lock()
+        self._backfill: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._rewind: Optional[str] = None  # Target backfill cursor to move back to
+
+    # Collections
+
+    def _open_collection(self, name: str, provider: EmbeddingProvider, hnsw: Optional[Dict[str, int]] = None):
+        return open_collection(
+            self.vector_client,
+            name,
+            metadata={
+                "hnsw:space": "cosine",
+                "embedding_type": "text",
+                "embedding_model": provider.model_id,
+                "dimensions": provider.dims,
+            },
+            hnsw=hnsw_config("text") if hnsw is None else hnsw,
+        )
+
+    def _provider(self, provider_name: str, model: Optional[str]) -> EmbeddingProvider:
+        provider = self.make_provider(provider_name, model)
+        if not provider.dims:
+            provider.warmup()  # Unknown model: dims are only known once loaded
+        return provider
+
+    def _new_slot(self, provider: EmbeddingProvider) -> ModelSlot:
+        name = collection_name(provider.model_id, provider.dims)
+        return ModelSlot(name, provider, self._open_collection(name, provider))
+
+    def _is_active(self, provider: EmbeddingProvider) -> bool:
+        active = self.active.provider
+        return (active.name, active.model_id, active.dims) == (provider.name, provider.model_id, provider.dims)
+
+    def _slot_for(self, entry: Dict[str, Any]) -> ModelSlot:
+        provider = self.make_provider(entry["provider"], entry["model"])
+        return ModelSlot(entry["collection"], provider, self._open_collection(entry["collection"], provider))
+
+    def registered_slot(self, status: str) -> Optional[ModelSlot]:
+        """
+        Open the collection registered with ``status`` without changing the
+        registry (offline tools); None if there is none
+        """
+        entry = self.registry.find(status)
+        return self._slot_for(entry) if entry is not None else None
+
+    def _adopt_legacy(self) -> Optional[ModelSlot]:
+        """Register a pre-registry ``farm_visits`` collection under the model that built it"""
+        if LEGACY_COLLECTION not in [c.name for c in self.vector_client.list_collections()]:
+            return None
+        legacy = InstrumentedCollection(self.vector_client.get_collection(LEGACY_COLLECTION))
+        if legacy.count() == 0:
+            return None
+        sample = legacy.get(limit=1, include=["embeddings"])
+        dims = len(sample["embeddings"][0])
+        if dims not in LEGACY_MODELS:
+            print(f"[Models] Legacy collection has unknown dimension {dims}, not adopting it")
+            return None
+        provider_name, model = LEGACY_MODELS[dims]
+        slot = ModelSlot(LEGACY_COLLECTION, self.make_provider(provider_name, model), legacy)
+        self.registry.register(slot, "active", backfill_done=True)
+        print(f"[Models] Adopted legacy collection '{LEGACY_COLLECTION}' as {model} ({dims} dims)")
+        return slot
+
+    # Startup
+
+    def load(self, provider_name: str, model: Optional[str] = None, mode: str = "online"):
+        """
+        Open the registered collections and reconcile them with the configured
+        model. If the configured model is not the active one, ``mode="online"``
+        migrates to it in the background while the old model keeps serving;
+        ``mode="switch"`` (or an unusable old model) switches immediately and
+        backfills the new collection.
+        """
+        entry = self.registry.find("active")
+        if entry is not None:
+            self.active = self._slot_for(entry)
+        else:
+            self.active = self._adopt_legacy()
+
+        provider = self._provider(provider_name, model)
+        if self.active is None:
+            self.active = self._new_slot(provider)
+            self.registry.register(self.active, "active")
+            print(f"[Models] Active text collection: {self.active.name}")
+            return
+
+        migrating = self.registry.find("migrating")
+        if self._is_active(provider):
+            if migrating is not None and self._is_rebuild(migrating):
+                self.target = self._slot_for(migrating)
+                print(f"[Models] Resuming rebuild {self.active.name} -> {self.target.name}")
+                return
+            if migrating is not None:
+                print(f"[Models] Configured model is active again, retiring {migrating['collection']}")
+                self.registry.retire(migrating["collection"])
+            return
+
+        desired = self._new_slot(provider)
+
+        if migrating is not None and migrating["collection"] == desired.name:
+            self.target = desired
+            print(f"[Models] Resuming migration {self.active.name} -> {desired.name}")
+            return
+        if migrating is not None:
+            self.registry.retire(migrating["collection"])
+
+        if mode == "switch" or not self.active.provider.warmup():
+            print(f"[Models] Switching to {desired.name} now; search results fill in as it backfills")
+            self.registry.register(desired, "active")
+            self.active = desired
+        else:
+            self.registry.register(desired, "migrating")
+            self.target = desired
+            print(f"[Models] Migrating {self.active.name} -> {desired.name} online")
+
+    def start(self):
+        """Start the backfill thread if a collection still needs filling"""
+        if self.target is not None:
+            self._start_backfill(self.target)
+            return
+        entry = self._entry(self.active.name)
+        if entry is not None and not entry["backfill_done"]:
+            self._start_backfill(self.active)
+
+    def stop(self):
+        self._stop.set()
+        if self._backfill is not None:
+            self._backfill.join(timeout=5)
+            self._backfill = None
+
+    # Runtime migration
+
+    def migrate(self, provider_name: str, model: Optional[str] = None) -> Dict[str, Any]:
+        """Start an online migration to another model"""
+        provider = self._provider(provider_name, model)
+        if self._is_active(provider):
+            raise ValueError(f"{provider.model_id} is already the active model")
+        if self.target is not None and self.target.name == collection_name(provider.model_id, provider.dims):
+            return self.status()
+        slot = self._new_slot(provider)
+        self.abort_migration()
+        self.registry.register(slot, "migrating")
+        with self.write_lock:
+            self.target = slot
+        self._start_backfill(slot)
+        print(f"[Models] Migrating {self.active.name} -> {slot.name} online")
+        return self.status()
+
+    def _is_rebuild(self, entry: Dict[str, Any]) -> bool:
+        """Is ``entry`` a new generation of the active model's collection?"""
+        active = self.active.provider
+        return (entry["provider"], entry["model"], entry["dims"]) == (active.name, active.model_id, active.dims)
+
+    def _next_generation(self, provider: EmbeddingProvider) -> int:
+        names = {entry["collection"] for entry in self.registry.entries()}
+        generation = 2
+        while collection_name(provider.model_id, provider.dims, generation) in names:
+            generation += 1
+        return generation
+
+    def rebuild(self, hnsw: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """
+        Rebuild the active model's collection online (e.g. with new HNSW
+        parameters; None: the configured ones). The current collection keeps
+        serving until the new generation is backfilled from SQLite.
+        """
+        if self.target is not None:
+            raise ValueError(f"A migration to {self.target.name} is already running")
+        provider = self.active.provider
+        name = collection_name(provider.model_id, provider.dims, self._next_generation(provider))
+        slot = ModelSlot(name, provider, self._open_collection(name, provider, hnsw))
+        self.registry.register(slot, "migrating")
+        with self.write_lock:
+            self.target = slot
+        self._start_backfill(slot)
+        print(f"[Models] Rebuilding {self.active.name} -> {slot.name} online")
+        return self.status()
+
+    def abort_migration(self) -> bool:
+        """Stop dual-writing and backfilling; the target collection is retired"""
+        target = self.target
+        if target is None:
+            return False
+        self.stop()
+        with self.write_lock:
+            self.target = None
+            self._rewind = None
+        self.registry.retire(target.name)
+        print(f"[Models] Migration to {target.name} aborted")
+        return True
+
+    def _activate(self, slot: ModelSlot):
+        """Make ``slot`` serve search (called with write_lock held)"""
+        self.registry.activate(slot.name)
+        previous = self.active
+        self.active, self.target = slot, None
+        print(f"[Models] Search switched {previous.name} -> {slot.name}")
+
+    # Writes
+
+    def write_slots(self) -> List[ModelSlot]:
+        slots = [self.active]
+        if self.target is not None:
+            slots.append(self.target)
+        return slots
+
+    def upsert(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]) -> Dict[int, str]:
+        """
+        Embed and store documents in every write slot. Returns the positions
+        that could not be embedded for the active collection, with the error.
+
+        A failure of the migration target alone does not fail the write: the
+        active collection is still updated and the target's backfill is
+        rewound to pick the documents up again.
+        """
+        failures: Dict[int, str] = {}
+        writes = []
+        missed: List[str] = []
+        computed: Dict[int, Optional[List[List[float]]]] = {}
+        for slot in self.write_slots():
+            # During a rebuild both slots share one provider: embed once
+            if id(slot.provider) not in computed:
+                computed[id(slot.provider)] = slot.provider.embed_batch(documents)
+            embeddings = computed[id(slot.provider)]
+            if embeddings is not None:
+                writes.append((slot, embeddings))
+            elif slot is self.active:
+                for i in range(len(ids)):
+                    failures[i] = f"Embedding provider unavailable ({slot.provider.model_id})"
+            else:
+                missed = list(ids)
+
+        with self.write_lock:
+            for slot, embeddings in writes:
+                if slot is not self.active and slot is not self.target:
+                    continue  # Migration switched or was aborted meanwhile
+                keep = [i for i in range(len(ids)) if i not in failures and embeddings[i]]
+                if keep:
+                    slot.collection.upsert(
+                        ids=[ids[i] for i in keep],
+                        embeddings=[embeddings[i] for i in keep],
+                        documents=[documents[i] for i in keep],
+                        metadatas=[metadatas[i] for i in keep]
+                    )
+            if missed and self.target is not None:
+                self._rewind_backfill(self.target, missed)
+        return failures
+
+    # Backfill
+
+    def _entry(self, name: str) -> Optional[Dict[str, Any]]:
+        for entry in self.registry.entries():
+            if entry["collection"] == name:
+                return entry
+        return None
+
+    def _start_backfill(self, slot: ModelSlot):
+        if self.load_documents is None:
+            return
+        self.stop()
+        self._stop = threading.Event()
+        self._backfill = threading.Thread(
+            target=self._run_backfill, args=(slot, self._stop), name="model-backfill", daemon=True
+        )
+        self._backfill.start()
+
+    def _rewind_backfill(self, slot: ModelSlot, ids: List[str]):
+        """
+        Make the backfill of ``slot`` revisit ``ids`` (called with write_lock
+        held). The cursor moves back to the shortest prefix of the smallest
+        id, which sorts just before it.
+        """
+        cursor_id = min(ids)[:-1]
+        if self._rewind is None or cursor_id < self._rewind:
+            self._rewind = cursor_id
+        self.registry.rewind(slot.name, cursor_id)
+        print(f"[Models] Embedding for {slot.name} failed, its backfill will revisit {len(ids)} visit(s)")
+
+    def _run_backfill(self, slot: ModelSlot, stop: threading.Event):
+        entry = self._entry(slot.name) or {}
+        cursor_id = entry.get("backfill_cursor")
+        backfilled = entry.get("backfilled") or 0
+        print(f"[Models] Backfilling {slot.name} from {cursor_id or 'the start'}")
+
+        switch = False
+        while not stop.is_set():
+            docs = self.load_documents(cursor_id, self.batch_size)
+            if not docs:
+                with self.write_lock:
+                    if stop.is_set():
+                        return
+                    if self._rewind is None:
+                        # Done; finishing under the lock means no dual-write is missed
+                        self.registry.finish_backfill(slot.name)
+                        switch = self.target is slot
+                        if switch:
+                            self._activate(slot)
+                        break
+                    cursor_id, self._rewind = min(cursor_id or "", self._rewind), None
+                continue
+            batch = [d for d in docs if d[2]]
+            embeddings = slot.provider.embed_batch([d[2] for d in batch]) if batch else []
+            if embeddings is None:
+                print(f"[Models] Backfill embedding failed, retrying in {MIGRATION_RETRY_SECONDS:.0f}s")
+                stop.wait(MIGRATION_RETRY_SECONDS)
+                continue
+            with self.write_lock:
+                if stop.is_set():
+                    return
+                # Rows rewritten since they were read are dual-written by the queue
+                current = self.current_versions([d[0] for d in batch]) if batch else {}
+                keep = [(d, e) for d, e in zip(batch, embeddings) if e and current.get(d[0]) == d[1]]
+                if keep:
+                    slot.collection.upsert(
+                        ids=[d[0] for d, _ in keep],
+                        embeddings=[e for _, e in keep],
+                        documents=[d[2] for d, _ in keep],
+                        metadatas=[d[3] for d, _ in keep]
+                    )
+                cursor_id = docs[-1][0]
+                if self._rewind is not None:
+                    cursor_id, self._rewind = min(cursor_id, self._rewind), None
+                backfilled += len(docs)
+                self.registry.save_progress(slot.name, cursor_id, backfilled)
+
+        if stop.is_set() and not switch:
+            return
+        print(f"[Models] Backfill of {slot.name} complete ({backfilled} visits)")
+        if switch and self.on_switch:
+            self.on_switch(slot)
+
+    def status(self) -> Dict[str, Any]:
+        result = {
+            "active": self.active.describe() if self.active else None,
+            "migration": None,
+            "models": self.registry.entries(),
+        }
+        if self.active is not None:
+            result["active"]["count"] = self.active.collection.count()
+        if self.target is not None:
+            entry = self._entry(self.target.name) or {}
+            result["migration"] = {
+                **self.target.describe(),
+                "count": self.target.collection.count(),
+                "backfilled": entry.get("backfilled", 0),
+                "backfill_cursor": entry.get("backfill_cursor"),
+                "running": self._backfill is not None and self._backfill.is_alive(),
+            }
+        return result
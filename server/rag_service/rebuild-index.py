@@ -0,0 +1,138 @@
+"""
+Rebuild a vector collection with new HNSW parameters
+Run: python rebuild-index.py text [--m 32] [--construction-ef 200] [--search-ef 64]
+     python rebuild-index.py images [--m 32] [--construction-ef 200] [--search-ef 64]
+
+text: asks the running service to rebuild the active text collection online
+(POST /embeddings/rebuild). The new collection is filled from the SQLite
+visits (vectors come from the embedding cache) while the current one keeps
+serving, then search switches over. Progress is printed until it finishes.
+
+images: copies the CLIP vectors into a new collection with the given
+parameters and swaps it in under the same name. Stop the service first:
+ChromaDB collections must not be rewritten by two processes at once.
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from env_file import load_env  # noqa: E402
+
+# Before vector_store (and the settings below) read the environment
+load_env(Path(__file__).resolve().parent / ".env")
+
+from embeddings.providers import image_collection_name, resolve_clip_provider  # noqa: E402
+from vector_store import VECTOR_BACKEND, create_vector_client, hnsw_config, hnsw_metadata  # noqa: E402
+
+DATA_DIR = Path(os.getenv("DATA_DIR", "./data"))
+CHROMA_DIR = DATA_DIR / "chroma"
+VECTOR_DIR = DATA_DIR / "vectors"
+CLIP_PROVIDER = resolve_clip_provider(os.getenv("CLIP_PROVIDER", "clip"))
+IMAGE_COLLECTION = image_collection_name(CLIP_PROVIDER)
+COPY_BATCH = 500
+
+
+def _params(args, kind: str) -> dict:
+    params = hnsw_config(kind)
+    for param, value in (("M", args.m), ("construction_ef", args.construction_ef), ("search_ef", args.search_ef)):
+        if value is not None:
+            params[param] = value
+    return params
+
+
+def rebuild_text(args):
+    import requests
+
+    params = _params(args, "text")
+    response = requests.post(f"{args.url}/embeddings/rebuild", json=params, timeout=30)
+    if response.status_code != 200:
+        print(f"[ERROR] Rebuild not started ({response.status_code}): {response.text}")
+        sys.exit(1)
+    target = response.json()["migration"]["collection"]
+    print(f"[OK] Rebuilding into {target} with {params or 'default parameters'}")
+
+    while True:
+        time.sleep(args.poll)
+        status = requests.get(f"{args.url}/embeddings/models", timeout=30).json()
+        migration = status["migration"]
+        if migration is None or migration["collection"] != target:
+            break
+        print(f"  {migration['backfilled']} visits backfilled, {migration['count']} vectors")
+    if status["active"]["collection"] == target:
+        print(f"[OK] Search now uses {target} ({status['active']['hnsw']})")
+    else:
+        print(f"[ERROR] Rebuild of {target} did not complete (aborted or replaced)")
+        sys.exit(1)
+
+
+def rebuild_images(args):
+    if VECTOR_BACKEND != "chroma":
+        print("[INFO] HNSW parameters only apply to VECTOR_BACKEND=chroma; nothing to rebuild")
+        return
+    client = create_vector_client(VECTOR_BACKEND, CHROMA_DIR, VECTOR_DIR)
+    if IMAGE_COLLECTION not in [c.name for c in client.list_collections()]:
+        print(f"[X] Collection {IMAGE_COLLECTION} not found in {CHROMA_DIR}")
+        sys.exit(1)
+    source = client.get_collection(IMAGE_COLLECTION)
+    params = _params(args, "image")
+    metadata = {
+        **{k: v for k, v in (source.metadata or {}).items() if not k.startswith("hnsw:")},
+        "hnsw:space": (source.metadata or {}).get("hnsw:space", "cosine"),
+        **hnsw_metadata(params),
+    }
+
+    tmp_name = f"{IMAGE_COLLECTION}__rebuild"
+    existing = [c.name for c in client.list_collections()]
+    if tmp_name in existing:
+        client.delete_collection(tmp_name)  # Left over from an interrupted run
+    if f"{IMAGE_COLLECTION}__old" in existing:
+        client.delete_collection(f"{IMAGE_COLLECTION}__old")
+    target = client.create_collection(tmp_name, metadata=metadata)
+
+    total = source.count()
+    print(f"Copying {total} image vectors into a collection with {params or 'default parameters'}...")
+    for offset in range(0, total, COPY_BATCH):
+        batch = source.get(limit=COPY_BATCH, offset=offset, include=["embeddings", "documents", "metadatas"])
+        if batch["ids"]:
+            target.add(
+                ids=batch["ids"],
+                embeddings=batch["embeddings"],
+                documents=batch["documents"],
+                metadatas=batch["metadatas"]
+            )
+        print(f"  {min(offset + COPY_BATCH, total)}/{total}")
+
+    if target.count() != total:
+        print(f"[ERROR] Copied {target.count()} of {total} vectors; {IMAGE_COLLECTION} left unchanged")
+        sys.exit(1)
+    # Swap by renaming, so a failure at any step leaves a complete collection behind
+    old_name = f"{IMAGE_COLLECTION}__old"
+    source.modify(name=old_name)
+    target.modify(name=IMAGE_COLLECTION)
+    client.delete_collection(old_name)
+    print(f"[OK] {IMAGE_COLLECTION} rebuilt ({total} vectors)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild a vector collection with new HNSW parameters")
+    parser.add_argument("collection", choices=["text", "images"])
+    parser.add_argument("--m", type=int, help="HNSW graph degree (hnsw:M)")
+    parser.add_argument("--construction-ef", type=int, help="Candidate list size while building (hnsw:construction_ef)")
+    parser.add_argument("--search-ef", type=int, help="Candidate list size while searching (hnsw:search_ef)")
+    parser.add_argument("--url", default=os.getenv("RAG_SERVICE_URL", "http://localhost:8000"), help="Service URL (text)")
+    parser.add_argument("--poll", type=float, default=2.0, help="Seconds between progress checks (text)")
+    args = parser.parse_args()
+
+    if args.collection == "text":
+        rebuild_text(args)
+    else:
+        rebuild_images(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Search Filters
+Translates /rag/search ``filters`` into a native ChromaDB ``where`` clause
+(vector search) or an SQL condition on ``visits`` (lexical search).
+
+Filtering happens inside the vector query, so the top k is taken from
+matching visits only: results are exactly k whenever k visits match, and
+no over-fetching or Python post-filtering is needed.
+
+Supported filters:
+- ``created_at_min`` / ``created_at_max``: epoch ms range ($gte / $lte)
+- ``severity_min`` / ``severity_max``: severity range
+- ``field_id``, ``crop``, ``issue``, ``task_type``, ``severity``:
+  a single value ($eq) or a list of values ($in)
+- ``near`` / ``bbox``: location, resolved to candidate ids by geo_index.py
+  and applied with ``restrict_ids``, or, above ``MAX_RESTRICT_IDS``
+  candidates, by over-fetching and post-filtering (``limit_ids``)
+
+Photos in the image collection carry their visit's filterable fields under
+``PHOTO_VISIT_PREFIX`` (``visit_created_at``, ``visit_crop``, ...), so the
+same filters apply to image search with ``build_where(filters, prefix=...)``.
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Largest id list sent to the vector store as a $in clause (one bound SQLite
+# parameter per id in Chroma); larger candidate sets are post-filtered
+MAX_RESTRICT_IDS = int(os.getenv("MAX_RESTRICT_IDS", "1000"))
+
+# filter key -> (metadata field, operator)
+RANGE_FILTERS = {
+    "created_at_min": ("created_at", "$gte"),
+    "created_at_max": ("created_at", "$lte"),
+    "severity_min": ("severity", "$gte"),
+    "severity_max": ("severity", "$lte"),
+}
+
+MATCH_FILTERS = ("field_id", "crop", "issue", "task_type", "severity")
+
+# Handled by geo_index.py (R*Tree prefilter), not translated here
+GEO_FILTERS = ("near", "bbox")
+
+# Numeric metadata fields; their values must be compared as numbers
+NUMERIC_FIELDS = ("created_at", "severity")
+
+# Visit metadata fields the filters above compare against
+FILTER_FIELDS = ("created_at", "field_id", "crop", "issue", "task_type", "severity")
+
+# Photo metadata key prefix for the visit's FILTER_FIELDS
+PHOTO_VISIT_PREFIX = "visit_"
+
+
+class FilterError(ValueError):
+    """Raised for unknown filter keys or values of the wrong type"""
+
+
+def _number(key: str, value: Any) -> int:
+    # bool is an int subclass, but True is never a meaningful timestamp
+    if isinstance(value, bool):
+        raise FilterError(f"Filter '{key}' must be a number")
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            raise FilterError(f"Filter '{key}' must be a number") from None
+    if isinstance(value, (int, float)):
+        return int(value)
+    raise FilterError(f"Filter '{key}' must be a number")
+
+
+def _match_value(key: str, value: Any):
+    return _number(key, value) if key in NUMERIC_FIELDS else str(value)
+
+
+def _conditions(filters: Dict[str, Any]) -> List[Tuple[str, str, Any]]:
+    """Validate ``filters`` into (field, operator, value) conditions"""
+    unknown = sorted(set(filters) - set(RANGE_FILTERS) - set(MATCH_FILTERS) - set(GEO_FILTERS))
+    if unknown:
+        supported = ", ".join(list(RANGE_FILTERS) + list(MATCH_FILTERS) + list(GEO_FILTERS))
+        raise FilterError(f"Unknown filter(s): {', '.join(unknown)}. Supported: {supported}")
+
+    conditions: List[Tuple[str, str, Any]] = []
+    for key, (field, op) in RANGE_FILTERS.items():
+        value = filters.get(key)
+        if value is not None:
+            conditions.append((field, op, _number(key, value)))
+
+    for key in MATCH_FILTERS:
+        value = filters.get(key)
+        if value is None or value == "":
+            continue
+        if isinstance(value, (list, tuple)):
+            values = [_match_value(key, v) for v in value if v is not None]
+            if not values:
+                continue
+            conditions.append((key, "$in", values))
+        else:
+            conditions.append((key, "$eq", _match_value(key, value)))
+    return conditions
+
+
+def build_where(filters: Optional[Dict[str, Any]], prefix: str = "") -> Optional[Dict[str, Any]]:
+    """
+    Build the ChromaDB where clause for ``filters`` (None if nothing to
+    filter). ``prefix`` is prepended to the metadata field names.
+    """
+    if not filters:
+        return None
+    conditions = [{prefix + field: {op: value}} for field, op, value in _conditions(filters)]
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+def restrict_ids(
+    where: Optional[Dict[str, Any]],
+    ids: List[str],
+    field: str = "id",
+) -> Dict[str, Any]:
+    """Add ``field`` $in ``ids`` (e.g. geo candidates) to a where clause"""
+    condition = {field: {"$in": list(ids)}}
+    if where is None:
+        return condition
+    if "$and" in where:
+        return {"$and": where["$and"] + [condition]}
+    return {"$and": [where, condition]}
+
+
+def limit_ids(
+    where: Optional[Dict[str, Any]],
+    ids: List[str],
+    field: str = "id",
+) -> Tuple[Optional[Dict[str, Any]], Optional[Set[str]]]:
+    """
+    Restrict a where clause to ``field`` in ``ids``. Returns the where clause
+    and, if there are more than MAX_RESTRICT_IDS ids, the set of ids to
+    post-filter results on instead (the where clause is then left as is).
+    """
+    if len(ids) <= MAX_RESTRICT_IDS:
+        return restrict_ids(where, ids, field), None
+    return where, set(ids)
+
+
+_SQL_OPERATORS = {"$gte": ">=", "$lte": "<=", "$eq": "="}
+
+
+def build_sql_where(filters: Optional[Dict[str, Any]], table: str = "v") -> Tuple[str, List[Any]]:
+    """
+    Build an SQL condition on the visits table (aliased ``table``) for
+    ``filters``. Returns ("", []) if nothing to filter.
+    """
+    if not filters:
+        return "", []
+    clauses, params = [], []
+    for field, op, value in _conditions(filters):
+        if op == "$in":
+            clauses.append(f"{table}.{field} IN ({','.join('?' for _ in value)})")
+            params.extend(value)
+        else:
+            clauses.append(f"{table}.{field} {_SQL_OPERATORS[op]} ?")
+            params.append(value)
+    return " AND ".join(clauses), params
@@ -0,0 +1,101 @@
+"""
+Service Startup
+Timed startup phases and the readiness state behind /livez and /readyz.
+
+Importing main.py only defines things. The startup event hands the real
+work to a background thread (``ServiceStartup.start``), so the server binds
+at once:
+
+1. ``initialize``: directories, vector store, SQLite schema, text index,
+   embedding workers. Until it finishes, endpoints other than /livez,
+   /readyz, /health and /metrics answer 503 with ``Retry-After``.
+2. ``warmup``: load the embedding model(s) so the first search does not
+   pay for it. /readyz turns 200 once this is done.
+
+Every phase is timed; the breakdown is logged, returned by /readyz and
+exported as ``rag_startup_phase_seconds``.
+"""
+
+import os
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from metrics import STARTUP_PHASE
+
+# "0": ready without loading models first (they load on first use)
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") != "0"
+
+
+class ServiceStartup:
+    """Startup phases with their durations, and the service state"""
+
+    STARTING, WARMING, READY, FAILED = "starting", "warming", "ready", "failed"
+
+    def __init__(self, started: Optional[float] = None):
+        self.created = time.perf_counter() if started is None else started
+        self.state = self.STARTING
+        self.error: Optional[str] = None
+        self.phases: Dict[str, float] = {}  # name -> seconds, in run order
+        self.initialized = threading.Event()
+        self.ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = seconds
+        STARTUP_PHASE.set(seconds, phase=name)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time a block as startup phase ``name``"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def start(self, initialize: Callable[[], None], warmup: Callable[[], None]):
+        """Run initialize, then warmup, on a background thread"""
+        self._thread = threading.Thread(
+            target=self._run, args=(initialize, warmup), name="service-startup", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, initialize: Callable[[], None], warmup: Callable[[], None]):
+        try:
+            initialize()
+            self.state = self.WARMING
+            self.initialized.set()
+            print(f"[Startup] Serving requests after {self.elapsed():.2f}s")
+            if STARTUP_WARMUP:
+                warmup()
+            self.state = self.READY
+            self.ready.set()
+            print(f"[Startup] Ready in {self.elapsed():.2f}s ({self.breakdown()})")
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self.state = self.FAILED
+            print(f"[Startup] Failed after {self.elapsed():.2f}s: {self.error}")
+            traceback.print_exc()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.created
+
+    def breakdown(self) -> str:
+        return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until ready (tests, scripts); False on timeout"""
+        return self.ready.wait(timeout)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "initialized": self.initialized.is_set(),
+            "ready": self.ready.is_set(),
+            "elapsed_s": round(self.elapsed(), 3),
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+            "error": self.error,
+        }
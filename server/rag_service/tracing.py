@@ -0,0 +1,217 @@
+"""
+Request Tracing
+Request-scoped span timings for the ``Server-Timing`` response header,
+structured request logs and on-demand sampling profiles.
+
+Each request gets a Trace in a contextvar. Stages timed with
+``metrics.stage`` (embedding, vector store, SQLite, CLIP, file writes) are
+also recorded as spans of the current trace; executors.run_io/run_embed copy
+the context, so spans from pool threads land in the right request. The
+middleware in main.py returns them as ``Server-Timing`` (visible in the
+browser devtools' network timing tab), aggregated per stage.
+
+- ``TRACE_LOG=1``: log one JSON line per request with its spans
+  (``TRACE_SLOW_MS``: only requests slower than this)
+- ``?profile=1`` with header ``X-Admin-Token: $ADMIN_TOKEN``: sample the
+  request's threads every ``PROFILE_INTERVAL_MS`` and return folded stacks
+  (flamegraph.pl / speedscope input) instead of the response body.
+  Disabled unless ``ADMIN_TOKEN`` is set.
+"""
+
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+TRACE_LOG = os.getenv("TRACE_LOG", "0") == "1"
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "0"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "2"))
+
+# Leaf frames of a thread that is idle, not working for the request
+_IDLE_LEAVES = {("selectors.py", "select")}
+
+
+class Trace:
+    """Spans of one request (shared by the threads working on it)"""
+
+    def __init__(self, profile: bool = False):
+        self.start = time.perf_counter()
+        self.spans: List[Tuple[str, str, float]] = []  # (stage, target, seconds)
+        self._lock = threading.Lock()
+        self.profiler = SamplingProfiler(self) if profile else None
+        self._threads: Dict[int, int] = {}  # thread id -> nesting depth
+
+    def add(self, stage: str, target: str, seconds: float):
+        with self._lock:
+            self.spans.append((stage, target, seconds))
+
+    @contextmanager
+    def bind_thread(self) -> Iterator[None]:
+        """Mark the calling thread as working for this request (profiled)"""
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] = self._threads.get(ident, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._threads[ident] -= 1
+                if not self._threads[ident]:
+                    del self._threads[ident]
+
+    def threads(self) -> List[int]:
+        with self._lock:
+            return list(self._threads)
+
+    def stages(self) -> Dict[str, Dict[str, float]]:
+        """Total milliseconds and call count per stage, in first-seen order"""
+        result: Dict[str, Dict[str, float]] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for stage, _, seconds in spans:
+            entry = result.setdefault(stage, {"ms": 0.0, "count": 0})
+            entry["ms"] += seconds * 1000
+            entry["count"] += 1
+        for entry in result.values():
+            entry["ms"] = round(entry["ms"], 2)
+        return result
+
+    def server_timing(self, total_seconds: float) -> str:
+        """Server-Timing header value; concurrent spans may add up to more than total"""
+        parts = []
+        for stage, entry in self.stages().items():
+            desc = f';desc="{entry["count"]} calls"' if entry["count"] > 1 else ""
+            parts.append(f"{stage};dur={entry['ms']}{desc}")
+        parts.append(f"total;dur={round(total_seconds * 1000, 2)}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+def start(profile: bool = False):
+    """Begin a trace for the current request; returns (trace, token for finish)"""
+    trace = Trace(profile=profile)
+    return trace, _current.set(trace)
+
+
+def finish(token):
+    _current.reset(token)
+
+
+@contextmanager
+def span(stage: str, target: str = "") -> Iterator[None]:
+    """Record the block as a span of the current trace (no-op outside requests)"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(stage, target, time.perf_counter() - start_time)
+
+
+@contextmanager
+def bind_thread() -> Iterator[None]:
+    """Attribute the calling pool thread to the current request while profiling"""
+    trace = _current.get()
+    if trace is None or trace.profiler is None:
+        yield
+        return
+    with trace.bind_thread():
+        yield
+
+
+def admin_authorized(token: Optional[str]) -> bool:
+    if not ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+
+def log_request(method: str, route: str, path: str, status: int, seconds: float, trace: Trace):
+    """One JSON line per request (TRACE_LOG=1)"""
+    duration_ms = round(seconds * 1000, 2)
+    if not TRACE_LOG or duration_ms < TRACE_SLOW_MS:
+        return
+    print(json.dumps({
+        "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()),
+        "event": "request",
+        "method": method,
+        "route": route,
+        "path": path,
+        "status": status,
+        "duration_ms": duration_ms,
+        "stages": trace.stages(),
+    }), flush=True)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of the request's threads: the event loop thread that
+    runs the request and the pool threads bound to its trace. Stacks are
+    counted in folded format (``thread;outer;...;inner count``).
+    """
+
+    def __init__(self, trace: Trace, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.trace = trace
+        self.interval = max(0.0005, interval_ms / 1000)
+        self.samples = 0
+        self.counts: Dict[str, int] = {}
+        self._loop_thread: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and wait for the sampler thread (blocks; not on the event loop)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        names = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            self.samples += 1
+            for ident in [self._loop_thread] + self.trace.threads():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if ident not in names:
+                    thread = next((t for t in threading.enumerate() if t.ident == ident), None)
+                    names[ident] = thread.name if thread else str(ident)
+                key = ";".join([names[ident]] + stack[::-1])
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def folded(self) -> str:
+        """Folded stacks, most sampled first"""
+        lines = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        return "\n".join(f"{stack} {count}" for stack, count in lines) + "\n"
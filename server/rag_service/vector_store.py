@@ -0,0 +1,619 @@
+"""
+Vector Store
+Selects the vector backend and provides an in-process NumPy exact-search
+backend as an alternative to ChromaDB's HNSW index.
+
+``VECTOR_BACKEND=chroma`` (default) uses ChromaDB. ``VECTOR_BACKEND=numpy``
+uses NumpyVectorStore: each collection keeps its vectors in a memory-mapped
+float32 (or float16, ``VECTOR_DTYPE``) matrix and its ids, documents and
+metadata in an append-only log replayed into memory at startup. Queries are
+one vectorized dot product over the matrix with the ``where`` clause applied
+as a boolean mask, so results are exact and filters never shrink the top k.
+For per-farm collections (10k-200k vectors) a scan takes a few milliseconds
+to a few tens of milliseconds, needs no index build, and selective filters
+only read the matching rows instead of going through Chroma's SQLite
+metadata layer.
+
+NumpyCollection implements the part of the Chroma collection API the
+service uses: ``upsert``, ``query``, ``get``, ``delete``, ``count``; where
+clauses support ``$eq``, ``$ne``, ``$gt``, ``$gte``, ``$lt``, ``$lte``,
+``$in``, ``$nin``, ``$and`` and ``$or``. Distances are cosine distances
+(1 - cosine similarity), like Chroma's ``hnsw:space: cosine``.
+
+ChromaDB's HNSW parameters (``M``, ``construction_ef``, ``search_ef``) are
+configured per collection kind with ``HNSW_<KIND>_<PARAM>`` (e.g.
+``HNSW_TEXT_SEARCH_EF``) or ``HNSW_<PARAM>`` for all kinds. They are fixed
+when a collection is created: to change them, rebuild the collection
+(rebuild-index.py). The NumPy backend ignores them.
+
+Collections returned by ``open_collection`` are wrapped in
+InstrumentedCollection, which times every call for /metrics.
+
+Files per collection (``<VECTOR_DIR>/<name>/``):
+- ``collection.json``: dims, dtype and collection metadata
+- ``vectors.bin``: the row-major vector matrix (grown by doubling)
+- ``log.jsonl``: upsert/delete records; compacted when mostly superseded
+"""
+
+import functools
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from metrics import stage
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32").lower()
+
+VECTOR_BACKENDS = ("chroma", "numpy")
+
+INITIAL_CAPACITY = 1024
+# Rows scored per matmul chunk (bounds the float32 copy of float16 matrices)
+QUERY_CHUNK_ROWS = 65536
+
+# Tunable HNSW parameters (collection metadata key: "hnsw:<param>")
+HNSW_PARAMS = ("M", "construction_ef", "search_ef")
+
+_DEFAULT_QUERY_INCLUDE = ("metadatas", "documents", "distances")
+_DEFAULT_GET_INCLUDE = ("metadatas", "documents")
+
+
+def create_vector_client(backend: str, chroma_dir: Path, vector_dir: Path):
+    """ChromaDB PersistentClient or NumpyVectorStore, per ``backend``"""
+    if backend == "numpy":
+        return NumpyVectorStore(vector_dir, dtype=VECTOR_DTYPE)
+    if backend != "chroma":
+        raise ValueError(f"Unknown VECTOR_BACKEND '{backend}'. Supported: {', '.join(VECTOR_BACKENDS)}")
+    import chromadb
+    from chromadb.config import Settings
+    return chromadb.PersistentClient(
+        path=str(chroma_dir),
+        settings=Settings(anonymized_telemetry=False)
+    )
+
+
+def hnsw_config(kind: str) -> Dict[str, int]:
+    """HNSW parameters set in the environment for collection ``kind`` (text/image)"""
+    params = {}
+    for param in HNSW_PARAMS:
+        value = os.getenv(f"HNSW_{kind.upper()}_{param.upper()}") or os.getenv(f"HNSW_{param.upper()}")
+        if value:
+            params[param] = int(value)
+    return params
+
+
+def hnsw_metadata(params: Optional[Dict[str, int]]) -> Dict[str, int]:
+    """Collection metadata entries for HNSW ``params``"""
+    return {f"hnsw:{param}": int(value) for param, value in (params or {}).items() if value is not None}
+
+
+def open_collection(client, name: str, metadata: Dict[str, Any], hnsw: Optional[Dict[str, int]] = None):
+    """
+    Get or create collection ``name``. New collections get ``hnsw``
+    parameters; an existing collection keeps the ones it was built with
+    (Chroma would only rewrite its metadata, not the index), with a warning
+    if they differ from ``hnsw``.
+    """
+    existing = None
+    if name in [c.name for c in client.list_collections()]:
+        existing = client.get_collection(name)
+    if existing is None:
+        return InstrumentedCollection(
+            client.get_or_create_collection(name=name, metadata={**metadata, **hnsw_metadata(hnsw)})
+        )
+    current = existing.metadata or {}
+    stale = {key: value for key, value in hnsw_metadata(hnsw).items() if current.get(key) != value}
+    if stale and not isinstance(client, NumpyVectorStore):
+        print(
+            f"[VectorStore] {name} was built with different HNSW parameters than configured "
+            f"({', '.join(f'{k}={v}' for k, v in stale.items())}); rebuild it to apply them"
+        )
+    return InstrumentedCollection(existing)
+
+
+class InstrumentedCollection:
+    """Collection proxy that records each vector store call as a /metrics stage"""
+
+    _STAGES = {
+        "query": "vector_query",
+        "upsert": "vector_upsert",
+        "add": "vector_upsert",
+        "get": "vector_get",
+        "delete": "vector_delete",
+        "count": "vector_count",
+    }
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, attr: str):
+        value = getattr(self._collection, attr)
+        stage_name = self._STAGES.get(attr)
+        if stage_name is None:
+            return value
+
+        @functools.wraps(value)
+        def timed(*args, **kwargs):
+            with stage(stage_name, self._collection.name):
+                return value(*args, **kwargs)
+        return timed
+
+
+class _Column:
+    """
+    One metadata field as arrays: numbers (NaN = absent) and dictionary-encoded
+    strings (-1 = absent), so where clauses become vectorized comparisons.
+    """
+
+    def __init__(self, capacity: int):
+        self.numbers = np.full(capacity, np.nan)
+        self.codes = np.full(capacity, -1, dtype=np.int32)
+        self.vocab: Dict[str, int] = {}
+
+    def grow(self, capacity: int):
+        numbers = np.full(capacity, np.nan)
+        numbers[:len(self.numbers)] = self.numbers
+        codes = np.full(capacity, -1, dtype=np.int32)
+        codes[:len(self.codes)] = self.codes
+        self.numbers, self.codes = numbers, codes
+
+    def set(self, row: int, value: Any):
+        self.clear(row)
+        if isinstance(value, str):
+            self.codes[row] = self.vocab.setdefault(value, len(self.vocab))
+        elif isinstance(value, (bool, int, float)):
+            self.numbers[row] = float(value)
+
+    def clear(self, row: int):
+        self.numbers[row] = np.nan
+        self.codes[row] = -1
+
+    def equals(self, value: Any, n: int) -> np.ndarray:
+        if isinstance(value, str):
+            code = self.vocab.get(value)
+            if code is None:
+                return np.zeros(n, dtype=bool)
+            return self.codes[:n] == code
+        return self.numbers[:n] == float(value)
+
+
+class NumpyCollection:
+    """One memory-mapped collection with exact cosine search"""
+
+    def __init__(self, path: Path, name: str, metadata: Optional[Dict[str, Any]], dtype: str):
+        self.path = path
+        self.name = name
+        self._lock = threading.RLock()
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        info_path = self.path / "collection.json"
+        if info_path.exists():
+            info = json.loads(info_path.read_text(encoding="utf-8"))
+        else:
+            info = {"name": name, "metadata": metadata or {}, "dims": None, "dtype": dtype}
+            info_path.write_text(json.dumps(info), encoding="utf-8")
+        self._info = info
+        self.metadata = info["metadata"]
+        self.dims: Optional[int] = info["dims"]
+        self.dtype = np.dtype(info["dtype"])
+
+        self._vectors: Optional[np.memmap] = None
+        self._capacity = 0
+        self._n_rows = 0  # rows ever allocated; live rows are flagged in _live
+        self._live = np.zeros(0, dtype=bool)
+        self._row_ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._documents: Dict[str, Optional[str]] = {}
+        self._metadatas: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._columns: Dict[str, _Column] = {}
+        self._free: List[int] = []
+        self._log_entries = 0
+        self._log = None
+        self._load()
+
+    # Storage
+
+    def _vector_path(self) -> Path:
+        return self.path / "vectors.bin"
+
+    def _log_path(self) -> Path:
+        return self.path / "log.jsonl"
+
+    def _map(self, capacity: int):
+        """(Re)map vectors.bin with room for ``capacity`` rows"""
+        if self._vectors is not None:
+            self._vectors.flush()
+            # Windows cannot resize a file that is still mapped
+            self._vectors._mmap.close()
+            self._vectors = None
+        vector_path = self._vector_path()
+        size = capacity * self.dims * self.dtype.itemsize
+        if not vector_path.exists() or vector_path.stat().st_size < size:
+            with open(vector_path, "ab") as f:
+                f.truncate(size)
+        self._vectors = np.memmap(vector_path, dtype=self.dtype, mode="r+", shape=(capacity, self.dims))
+        self._capacity = capacity
+        self._live = np.concatenate([self._live, np.zeros(capacity - len(self._live), dtype=bool)])
+        self._row_ids.extend([None] * (capacity - len(self._row_ids)))
+        for column in self._columns.values():
+            column.grow(capacity)
+
+    def _set_dims(self, dims: int):
+        self.dims = dims
+        self._info["dims"] = dims
+        (self.path / "collection.json").write_text(json.dumps(self._info), encoding="utf-8")
+
+    def _load(self):
+        """Replay the log into the id index, documents, metadata and columns"""
+        if self.dims is None:
+            return
+        vector_path = self._vector_path()
+        rows_on_disk = vector_path.stat().st_size // (self.dims * self.dtype.itemsize) if vector_path.exists() else 0
+        self._map(max(INITIAL_CAPACITY, rows_on_disk))
+
+        log_path = self._log_path()
+        if log_path.exists():
+            intact = 0
+            with open(log_path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    intact += len(line)
+                    self._log_entries += 1
+                    if entry["op"] == "upsert":
+                        self._n_rows = max(self._n_rows, entry["row"] + 1)
+                        self._apply_upsert(entry["id"], entry["row"], entry.get("document"), entry.get("metadata"))
+                    elif entry["op"] == "delete":
+                        self._apply_delete(entry["id"])
+            if intact < log_path.stat().st_size:
+                # Torn last record from a crash: drop it so new records follow intact ones
+                print(f"[VectorStore] Truncating torn log record in {self.name}")
+                with open(log_path, "r+b") as f:
+                    f.truncate(intact)
+        self._free = [row for row in range(self._n_rows) if not self._live[row]]
+        print(f"[VectorStore] Loaded {self.name}: {len(self._rows)} vectors ({self.dims} dims, {self.dtype.name})")
+
+    def _append_log(self, entries: List[Dict[str, Any]]):
+        if self._log is None:
+            self._log = open(self._log_path(), "a", encoding="utf-8")
+        self._log.write("".join(json.dumps(e) + "\n" for e in entries))
+        self._log.flush()
+        self._log_entries += len(entries)
+
+    def _compact_if_needed(self):
+        """Rewrite the log with one record per live id once it is mostly superseded"""
+        if self._log_entries < 1000 or self._log_entries < 2 * len(self._rows):
+            return
+        tmp_path = self.path / "log.jsonl.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for vector_id, row in self._rows.items():
+                f.write(json.dumps({
+                    "op": "upsert", "id": vector_id, "row": row,
+                    "document": self._documents[vector_id], "metadata": self._metadatas[vector_id]
+                }) + "\n")
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        os.replace(tmp_path, self._log_path())
+        self._log_entries = len(self._rows)
+
+    def _apply_upsert(self, vector_id: str, row: int, document: Optional[str], metadata: Optional[Dict[str, Any]]):
+        old_row = self._rows.get(vector_id)
+        if old_row is not None and old_row != row:
+            self._release(old_row)
+        self._rows[vector_id] = row
+        self._row_ids[row] = vector_id
+        self._live[row] = True
+        self._documents[vector_id] = document
+        self._metadatas[vector_id] = metadata
+        for key, value in (metadata or {}).items():
+            if key not in self._columns:
+                self._columns[key] = _Column(self._capacity)
+            self._columns[key].set(row, value)
+
+    def _apply_delete(self, vector_id: str):
+        row = self._rows.pop(vector_id, None)
+        if row is None:
+            return
+        self._documents.pop(vector_id, None)
+        self._metadatas.pop(vector_id, None)
+        self._release(row)
+
+    def _release(self, row: int):
+        self._live[row] = False
+        self._row_ids[row] = None
+        for column in self._columns.values():
+            column.clear(row)
+
+    def _allocate(self) -> int:
+        if self._free:
+            return self._free.pop()
+        if self._n_rows >= self._capacity:
+            self._map(self._capacity * 2)
+        self._n_rows += 1
+        return self._n_rows - 1
+
+    # Filtering
+
+    def _where_mask(self, where: Dict[str, Any], n: int) -> np.ndarray:
+        mask = np.ones(n, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._where_mask(clause, n)
+            elif key == "$or":
+                either = np.zeros(n, dtype=bool)
+                for clause in condition:
+                    either |= self._where_mask(clause, n)
+                mask &= either
+            else:
+                mask &= self._field_mask(key, condition, n)
+        return mask
+
+    def _field_mask(self, key: str, condition: Any, n: int) -> np.ndarray:
+        column = self._columns.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        mask = np.ones(n, dtype=bool)
+        for op, value in condition.items():
+            if column is None:
+                # Unknown field: only negative conditions can match
+                mask &= np.full(n, op in ("$ne", "$nin"))
+            elif op == "$eq":
+                mask &= column.equals(value, n)
+            elif op == "$ne":
+                mask &= ~column.equals(value, n)
+            elif op in ("$in", "$nin"):
+                found = np.zeros(n, dtype=bool)
+                codes = [column.vocab[v] for v in value if isinstance(v, str) and v in column.vocab]
+                if codes:
+                    found |= np.isin(column.codes[:n], codes)
+                numbers = [float(v) for v in value if not isinstance(v, str)]
+                if numbers:
+                    found |= np.isin(column.numbers[:n], numbers)
+                mask &= found if op == "$in" else ~found
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                numbers = column.numbers[:n]
+                with np.errstate(invalid="ignore"):
+                    if op == "$gt":
+                        mask &= numbers > value
+                    elif op == "$gte":
+                        mask &= numbers >= value
+                    elif op == "$lt":
+                        mask &= numbers < value
+                    else:
+                        mask &= numbers <= value
+            else:
+                raise ValueError(f"Unsupported where operator: {op}")
+        return mask
+
+    def _candidates(self, where: Optional[Dict[str, Any]], ids: Optional[Sequence[str]] = None) -> np.ndarray:
+        n = self._n_rows
+        mask = self._live[:n].copy()
+        if where:
+            mask &= self._where_mask(where, n)
+        if ids is not None:
+            id_mask = np.zeros(n, dtype=bool)
+            rows = [self._rows[i] for i in ids if i in self._rows]
+            id_mask[rows] = True
+            mask &= id_mask
+        return mask
+
+    # Chroma-compatible API
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._rows)
+
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: Optional[List[Optional[str]]] = None,
+        metadatas: Optional[List[Optional[Dict[str, Any]]]] = None,
+    ):
+        if not ids:
+            return
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2 or len(matrix) != len(ids):
+            raise ValueError("Expected one embedding per id")
+        with self._lock:
+            if self.dims is None:
+                self._set_dims(matrix.shape[1])
+                self._map(INITIAL_CAPACITY)
+            if matrix.shape[1] != self.dims:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match collection dimensionality {self.dims}")
+            # Stored normalized: cosine similarity is then a plain dot product
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms > 0, norms, 1.0)
+
+            # New rows are written before the log records them, so a crash
+            # never leaves a logged id pointing at a half-written vector
+            rows = [self._allocate() for _ in ids]
+            self._vectors[rows] = matrix.astype(self.dtype)
+            self._vectors.flush()
+
+            entries = []
+            for i, vector_id in enumerate(ids):
+                document = documents[i] if documents else None
+                metadata = metadatas[i] if metadatas else None
+                old_row = self._rows.get(vector_id)
+                self._apply_upsert(vector_id, rows[i], document, metadata)
+                if old_row is not None and old_row != rows[i]:
+                    self._free.append(old_row)
+                entries.append({"op": "upsert", "id": vector_id, "row": rows[i], "document": document, "metadata": metadata})
+            self._append_log(entries)
+            self._compact_if_needed()
+
+    def add(self, ids, embeddings, documents=None, metadatas=None):
+        self.upsert(ids, embeddings, documents, metadatas)
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            if where is not None:
+                rows = np.flatnonzero(self._candidates(where, ids))
+                ids = [self._row_ids[row] for row in rows]
+            ids = [i for i in (ids or []) if i in self._rows]
+            if not ids:
+                return
+            for vector_id in ids:
+                row = self._rows[vector_id]
+                self._apply_delete(vector_id)
+                self._free.append(row)
+            self._append_log([{"op": "delete", "id": vector_id} for vector_id in ids])
+            self._compact_if_needed()
+
+    def _records(self, rows: Sequence[int], include: Sequence[str]) -> Dict[str, Any]:
+        ids = [self._row_ids[row] for row in rows]
+        result: Dict[str, Any] = {"ids": ids, "embeddings": None, "documents": None, "metadatas": None}
+        if "embeddings" in include:
+            result["embeddings"] = [self._vectors[row].astype(np.float32).tolist() for row in rows]
+        if "documents" in include:
+            result["documents"] = [self._documents[i] for i in ids]
+        if "metadatas" in include:
+            result["metadatas"] = [self._metadatas[i] for i in ids]
+        return result
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Sequence[str] = _DEFAULT_GET_INCLUDE,
+    ) -> Dict[str, Any]:
+        with self._lock:
+            if self.dims is None:
+                return self._empty_get(include)
+            if ids is not None:
+                # In the order asked for, like Chroma
+                rows = [self._rows[i] for i in ids if i in self._rows]
+                if where:
+                    mask = self._candidates(where)
+                    rows = [row for row in rows if mask[row]]
+            else:
+                rows = np.flatnonzero(self._candidates(where)).tolist()
+            rows = rows[offset or 0:]
+            if limit is not None:
+                rows = rows[:limit]
+            return self._records(rows, include)
+
+    def _empty_get(self, include: Sequence[str]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"ids": [], "embeddings": None, "documents": None, "metadatas": None}
+        for key in include:
+            if key in result:
+                result[key] = []
+        return result
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include: Sequence[str] = _DEFAULT_QUERY_INCLUDE,
+    ) -> Dict[str, Any]:
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1.0)
+
+        result: Dict[str, Any] = {key: [] for key in ("ids", "distances", "documents", "metadatas", "embeddings")}
+        with self._lock:
+            if self.dims is not None and queries.shape[1] != self.dims:
+                raise ValueError(f"Query dimension {queries.shape[1]} does not match collection dimensionality {self.dims}")
+            rows = np.flatnonzero(self._candidates(where)) if self.dims is not None else np.zeros(0, dtype=np.int64)
+            scores = self._scores(rows, queries)  # (len(rows), len(queries))
+
+            k = min(n_results, len(rows))
+            for q in range(len(queries)):
+                if k > 0:
+                    top = np.argpartition(-scores[:, q], k - 1)[:k]
+                    top = top[np.argsort(-scores[top, q], kind="stable")]
+                else:
+                    top = np.zeros(0, dtype=np.int64)
+                records = self._records(rows[top].tolist(), include)
+                result["ids"].append(records["ids"])
+                result["distances"].append([float(1.0 - d) for d in scores[top, q]])
+                for key in ("documents", "metadatas", "embeddings"):
+                    result[key].append(records[key])
+        for key in ("distances", "documents", "metadatas", "embeddings"):
+            if key not in include:
+                result[key] = None
+        return result
+
+    def _scores(self, rows: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """Cosine similarity of every candidate row with every query"""
+        scores = np.empty((len(rows), len(queries)), dtype=np.float32)
+        if len(rows) * 2 >= self._n_rows:
+            # Mostly unfiltered: stream contiguous chunks of the matrix, keep the candidates
+            positions = np.full(self._n_rows, -1, dtype=np.int64)
+            positions[rows] = np.arange(len(rows))
+            for start in range(0, self._n_rows, QUERY_CHUNK_ROWS):
+                stop = min(self._n_rows, start + QUERY_CHUNK_ROWS)
+                chunk_positions = positions[start:stop]
+                keep = chunk_positions >= 0
+                chunk = np.asarray(self._vectors[start:stop], dtype=np.float32) @ queries.T
+                scores[chunk_positions[keep]] = chunk[keep]
+        else:
+            # Selective filter: only read the matching rows
+            for start in range(0, len(rows), QUERY_CHUNK_ROWS):
+                chunk_rows = rows[start:start + QUERY_CHUNK_ROWS]
+                scores[start:start + len(chunk_rows)] = np.asarray(self._vectors[chunk_rows], dtype=np.float32) @ queries.T
+        return scores
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            if self._vectors is not None:
+                self._vectors.flush()
+
+
+class NumpyVectorStore:
+    """Client with the ChromaDB collection-management calls the service uses"""
+
+    def __init__(self, path: Path, dtype: str = VECTOR_DTYPE):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported VECTOR_DTYPE '{dtype}'. Supported: float32, float16")
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dtype = dtype
+        self._collections: Dict[str, NumpyCollection] = {}
+        self._lock = threading.Lock()
+
+    def _open(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> NumpyCollection:
+        if name not in self._collections:
+            self._collections[name] = NumpyCollection(self.path / name, name, metadata, self.dtype)
+        return self._collections[name]
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> NumpyCollection:
+        with self._lock:
+            return self._open(name, metadata)
+
+    def get_collection(self, name: str) -> NumpyCollection:
+        with self._lock:
+            if name not in self._collections and not (self.path / name / "collection.json").exists():
+                raise ValueError(f"Collection {name} does not exist.")
+            return self._open(name)
+
+    def list_collections(self) -> List[NumpyCollection]:
+        with self._lock:
+            names = sorted(p.name for p in self.path.iterdir() if (p / "collection.json").exists())
+            return [self._open(name) for name in names]
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            collection = self._collections.pop(name, None)
+            if collection is not None:
+                collection.close()
+                if collection._vectors is not None:
+                    collection._vectors._mmap.close()
+                    collection._vectors = None
+            shutil.rmtree(self.path / name, ignore_errors=True)